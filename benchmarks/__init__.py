@@ -0,0 +1,6 @@
+"""
+Benchmarks of the doppkit download and upload engines against a local fake
+GRiD server.
+
+Run them from the repository root with ``python -m benchmarks``.
+"""
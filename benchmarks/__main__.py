@@ -0,0 +1,194 @@
+"""
+Run the doppkit benchmarks and compare them with earlier runs.
+
+Every run is appended to a JSON lines file, ``.benchmarks/results.jsonl`` by
+default, and compared with the run before it.
+"""
+import concurrent.futures
+import json
+import multiprocessing
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+
+from typing import Any, Optional
+
+import click
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+
+from doppkit import __version__
+
+from .cases import CASES, run_case
+from .profiles import PROFILES
+
+DEFAULT_OUTPUT = pathlib.Path(".benchmarks") / "results.jsonl"
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_server(profile: str, latency: float, storage_latency: float, bandwidth: Optional[str]):
+    command = [
+        sys.executable, "-m", "benchmarks.server",
+        "--profile", profile,
+        "--latency", str(latency),
+        "--storage-latency", str(storage_latency),
+    ]
+    if bandwidth:
+        command.extend(["--bandwidth", bandwidth])
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base = server.stdout.readline().strip()
+    if not base:
+        server.kill()
+        raise click.ClickException("Fake GRiD server failed to start")
+    return server, base
+
+
+def _in_fresh_process(case: str, profile, base: str, threads: int) -> dict[str, Any]:
+    # a new process per case keeps peak memory measurements separate
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, case, profile, base, threads).result()
+
+
+def _previous(path: pathlib.Path) -> Optional[dict[str, Any]]:
+    if not path.exists():
+        return None
+    last = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f} ms"
+
+
+def _change(current: Optional[float], before: Optional[float], higher_is_better: bool = True) -> str:
+    if not current or not before:
+        return ""
+    change = (current - before) / before * 100
+    better = change > 0 if higher_is_better else change < 0
+    color = "green" if better else "red"
+    if abs(change) < 5:
+        color = "dim"
+    return f" [{color}]{change:+.0f}%[/{color}]"
+
+
+def report(run: dict[str, Any], baseline: Optional[dict[str, Any]]) -> None:
+    before = {}
+    if baseline is not None:
+        before = {(r["case"], r["profile"]): r for r in baseline["results"]}
+    title = f"doppkit {run['version']} ({run['commit'] or 'unknown commit'})"
+    if baseline is not None:
+        title += f" compared with {baseline['version']} ({baseline['commit'] or 'unknown commit'})"
+    table = Table(title=title)
+    for column in ("Case", "Profile", "Throughput", "Files/s", "Latency p50", "Latency p95",
+                   "Loop lag p99", "Peak RSS", "Failures"):
+        table.add_column(column, justify="left" if column in ("Case", "Profile") else "right")
+    for result in run["results"]:
+        old = before.get((result["case"], result["profile"]), {})
+        old_latency = old.get("latency", {})
+        old_lag = old.get("loop_lag", {})
+        throughput = result["throughput"]
+        table.add_row(
+            result["case"],
+            result["profile"],
+            (f"{decimal(int(throughput))}/s" if throughput else "-")
+            + _change(throughput, old.get("throughput")),
+            f"{result['files_per_second']:.1f}" + _change(result["files_per_second"], old.get("files_per_second")),
+            _ms(result["latency"]["p50"]) + _change(result["latency"]["p50"], old_latency.get("p50"), False),
+            _ms(result["latency"]["p95"]) + _change(result["latency"]["p95"], old_latency.get("p95"), False),
+            _ms(result["loop_lag"]["p99"]) + _change(result["loop_lag"]["p99"], old_lag.get("p99"), False),
+            (decimal(result["peak_rss"]) if result["peak_rss"] else "-")
+            + _change(result["peak_rss"], old.get("peak_rss"), False),
+            str(result["failures"]),
+        )
+    Console().print(table)
+
+
+@click.command()
+@click.option(
+    "--profile", "profiles",
+    type=click.Choice(sorted(PROFILES)),
+    multiple=True,
+    help="File count and size profile to run, may be repeated, by default all",
+)
+@click.option(
+    "--case", "cases",
+    type=click.Choice(sorted(CASES)),
+    multiple=True,
+    help="Case to run, may be repeated, by default all",
+)
+@click.option("--threads", default=20, type=int, help="Maximum concurrent fetch count")
+@click.option("--latency", default=0.02, type=float, help="Seconds the fake GRiD API takes to respond")
+@click.option("--storage-latency", default=0.02, type=float, help="Seconds to first byte of the fake storage host")
+@click.option("--bandwidth", default=None, help="Bandwidth of each storage connection, such as 50M")
+@click.option(
+    "--output",
+    default=DEFAULT_OUTPUT,
+    type=pathlib.Path,
+    help="JSON lines file runs are appended to and compared against",
+)
+@click.option(
+    "--compare",
+    default=None,
+    type=pathlib.Path,
+    help="Compare with the last run in this file instead of the last run in --output",
+)
+@click.option("--no-save", is_flag=True, default=False, help="Do not append this run to --output")
+def main(profiles, cases, threads, latency, storage_latency, bandwidth, output, compare, no_save):
+    """Benchmark the doppkit download and upload engines against a fake GRiD server"""
+    profiles = profiles or tuple(PROFILES)
+    cases = cases or tuple(CASES)
+    baseline = _previous(compare if compare is not None else output)
+
+    run = {
+        "time": time.time(),
+        "version": __version__,
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "threads": threads,
+            "latency": latency,
+            "storage_latency": storage_latency,
+            "bandwidth": bandwidth,
+        },
+        "results": [],
+    }
+    console = Console(stderr=True)
+    for profile_name in profiles:
+        server, base = _start_server(profile_name, latency, storage_latency, bandwidth)
+        try:
+            for case in cases:
+                console.print(f"Running {case} with {profile_name}...")
+                run["results"].append(
+                    _in_fresh_process(case, PROFILES[profile_name], base, threads)
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    if not no_save:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+    report(run, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Benchmark cases, each measuring one doppkit entry point against the fake GRiD
+server.  Every case runs in a fresh process so its peak memory use can be
+told apart from the others.
+"""
+__all__ = ["CASES", "run_case"]
+
+import asyncio
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+from typing import Any, Awaitable, Callable, Optional
+
+from .profiles import Profile
+
+# how often the event loop is asked to wake up to measure how late it is
+LAG_INTERVAL = 0.01
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, None if unknown"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(values: list[float]) -> dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0], "max": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(values)}
+
+
+class LoopLag:
+    """Measures how late the event loop wakes up a task sleeping in a loop"""
+
+    def __init__(self, interval: float = LAG_INTERVAL) -> None:
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - before - self.interval))
+
+    def __enter__(self) -> 'LoopLag':
+        self._task = asyncio.ensure_future(self._monitor())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+class TimingProgress:
+    """Progress recording how long each file took from first byte to completion"""
+
+    def __init__(self) -> None:
+        self.started: dict[str, float] = {}
+        self.latencies: list[float] = []
+
+    def create_task(self, name: str, source: str, total: int) -> None:
+        self.started.setdefault(source, time.perf_counter())
+
+    def update(self, name: str, source: str, completed: int) -> None:
+        pass
+
+    def complete_task(self, name: str, source: str) -> None:
+        started = self.started.pop(source, None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def _application(base: str, directory: str, threads: int):
+    from doppkit.app import Application
+
+    return Application(
+        token="benchmark",
+        url=f"{base}/grid",
+        directory=directory,
+        threads=threads,
+        run_method="API",
+        log_level="WARNING",
+    )
+
+
+async def bench_cache(app, profile: Profile) -> dict[str, Any]:
+    """Download every file of the profile with doppkit.cache.cache"""
+    import httpx
+    from doppkit.cache import DownloadUrl, cache
+    from doppkit.grid import Grid
+
+    api = Grid(app)
+    urls: list[DownloadUrl] = []
+    for export_id in range(1, profile.exports + 1):
+        urls.extend(await api.get_exports(export_id))
+    progress = TimingProgress()
+    started = time.perf_counter()
+    results = await cache(app, urls, {}, progress=progress)
+    elapsed = time.perf_counter() - started
+    # failed downloads come back as exceptions or error responses
+    failed = [
+        isinstance(result, BaseException)
+        or (isinstance(result, httpx.Response) and result.is_error)
+        for result in results
+    ]
+    return {
+        "elapsed": elapsed,
+        "files": len(urls),
+        "bytes": sum(url.total for url, failure in zip(urls, failed) if not failure),
+        "failures": sum(failed),
+        "latencies": progress.latencies,
+    }
+
+
+async def bench_get_exports(app, profile: Profile) -> dict[str, Any]:
+    """Fetch and parse the file listings of every export with Grid.get_exports"""
+    from doppkit.grid import Grid
+
+    api = Grid(app)
+    latencies = []
+
+    async def timed(export_id: int) -> int:
+        started = time.perf_counter()
+        files = await api.get_exports(export_id)
+        latencies.append(time.perf_counter() - started)
+        return len(files)
+
+    started = time.perf_counter()
+    counts = await asyncio.gather(
+        *(timed(export_id) for export_id in range(1, profile.exports + 1)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed": elapsed,
+        "files": sum(count for count in counts if not isinstance(count, BaseException)),
+        "bytes": 0,
+        "failures": sum(isinstance(count, BaseException) for count in counts),
+        "latencies": latencies,
+    }
+
+
+async def bench_upload_asset(app, profile: Profile) -> dict[str, Any]:
+    """Upload files of the profile's size with Grid.upload_asset"""
+    from doppkit.grid import Grid
+
+    api = Grid(app)
+    # uploads are slower to set up, a handful of files is representative
+    count = min(profile.files, 8)
+    directory = pathlib.Path(app.directory) / "uploads"
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = directory / f"upload-{index}.bin"
+        with open(path, "wb") as f:
+            f.truncate(profile.file_size)
+        paths.append(path)
+
+    latencies = []
+
+    async def timed(path: pathlib.Path) -> None:
+        started = time.perf_counter()
+        await api.upload_asset(path, directory=pathlib.PurePosixPath("benchmark"))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(timed(path) for path in paths), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    failures = sum(isinstance(outcome, BaseException) for outcome in outcomes)
+    return {
+        "elapsed": elapsed,
+        "files": count,
+        "bytes": (count - failures) * profile.file_size,
+        "failures": failures,
+        "latencies": latencies,
+    }
+
+
+CASES: dict[str, Callable[[Any, Profile], Awaitable[dict[str, Any]]]] = {
+    "cache": bench_cache,
+    "get_exports": bench_get_exports,
+    "upload_asset": bench_upload_asset,
+}
+
+
+def run_case(case: str, profile: Profile, base: str, threads: int) -> dict[str, Any]:
+    """Run a case in this process and summarize its measurements"""
+
+    async def measure() -> tuple[dict[str, Any], list[float]]:
+        with tempfile.TemporaryDirectory(prefix="doppkit-benchmark-") as directory:
+            app = _application(base, directory, threads)
+            try:
+                with LoopLag() as lag:
+                    outcome = await CASES[case](app, profile)
+            finally:
+                await app.session.aclose()
+        return outcome, lag.lags
+
+    outcome, lags = asyncio.run(measure())
+    elapsed = outcome["elapsed"]
+    return {
+        "case": case,
+        "profile": profile.name,
+        "threads": threads,
+        "elapsed": elapsed,
+        "files": outcome["files"],
+        "bytes": outcome["bytes"],
+        "failures": outcome["failures"],
+        "throughput": outcome["bytes"] / elapsed if elapsed else None,
+        "files_per_second": outcome["files"] / elapsed if elapsed else None,
+        "latency": percentiles(outcome["latencies"]),
+        "loop_lag": percentiles(lags),
+        "peak_rss": peak_rss(),
+        "pid": os.getpid(),
+    }
@@ -0,0 +1,29 @@
+__all__ = ["Profile", "PROFILES"]
+
+from typing import NamedTuple
+
+
+class Profile(NamedTuple):
+    """Shape of the AOI the fake GRiD server hands out"""
+    name: str
+    exports: int
+    files_per_export: int
+    file_size: int
+
+    @property
+    def files(self) -> int:
+        return self.exports * self.files_per_export
+
+    @property
+    def total_size(self) -> int:
+        return self.files * self.file_size
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        Profile("small-files", exports=4, files_per_export=250, file_size=64 * 1024),
+        Profile("medium-files", exports=4, files_per_export=16, file_size=4 * 1024 ** 2),
+        Profile("large-files", exports=2, files_per_export=2, file_size=128 * 1024 ** 2),
+    )
+}
@@ -0,0 +1,343 @@
+"""
+Fake GRiD server for benchmarks.
+
+Implements just enough of the GRiD API for doppkit: AOIs, exports, tasks, the
+multipart upload endpoints, and downloads that redirect to a storage host
+serving synthetic bytes with Range support.  Latency and bandwidth can be
+configured to mimic a remote server.
+
+Run on its own with ``python -m benchmarks.server --profile small-files``.
+"""
+__all__ = ["FakeGrid", "serve"]
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import random
+import re
+import sys
+import uuid
+
+from typing import AsyncIterator, Optional, Union
+from urllib.parse import parse_qs, urlsplit
+
+from .profiles import PROFILES, Profile
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# every synthetic file is made of this block repeated, so contents are
+# deterministic without keeping whole files in memory
+_block = random.Random(0).randbytes(BLOCK_SIZE)
+_doubled = memoryview(_block + _block)
+
+_range_re = re.compile(r"bytes=(\d+)-(\d*)")
+
+_reasons = {
+    200: "OK",
+    206: "Partial Content",
+    302: "Found",
+    307: "Temporary Redirect",
+    404: "Not Found",
+    416: "Range Not Satisfiable",
+}
+
+
+def content(start: int, end: int) -> AsyncIterator[memoryview]:
+    """Bytes start to end (exclusive) of any synthetic file"""
+    async def chunks() -> AsyncIterator[memoryview]:
+        offset = start
+        while offset < end:
+            length = min(CHUNK_SIZE, end - offset)
+            position = offset % BLOCK_SIZE
+            yield _doubled[position:position + length]
+            offset += length
+    return chunks()
+
+
+@functools.lru_cache(maxsize=None)
+def etag(size: int) -> str:
+    """MD5 of the synthetic file of size bytes, as S3 would report it"""
+    md5 = hashlib.md5(usedforsecurity=False)
+    for offset in range(0, size, BLOCK_SIZE):
+        md5.update(_block[:min(BLOCK_SIZE, size - offset)])
+    return f'"{md5.hexdigest()}"'
+
+
+class Response:
+    def __init__(
+            self,
+            status: int = 200,
+            body: Union[bytes, AsyncIterator[memoryview]] = b"",
+            headers: Optional[dict[str, str]] = None,
+            length: Optional[int] = None
+    ) -> None:
+        self.status = status
+        self.body = body
+        self.headers = headers if headers is not None else {}
+        self.length = len(body) if isinstance(body, bytes) else length
+
+    @classmethod
+    def json(cls, payload) -> 'Response':
+        return cls(
+            body=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+
+
+class FakeGrid:
+    """
+    Parameters
+    ----------
+    profile
+        Shape of the single AOI (with id 1) the server hands out
+    latency
+        Seconds before GRiD API responses are sent
+    storage_latency
+        Seconds before storage responses are sent, the time to first byte
+    bandwidth
+        Bytes per second each storage connection is limited to, None for
+        unlimited
+    """
+
+    def __init__(
+            self,
+            profile: Profile,
+            latency: float = 0.0,
+            storage_latency: float = 0.0,
+            bandwidth: Optional[float] = None
+    ) -> None:
+        self.profile = profile
+        self.latency = latency
+        self.storage_latency = storage_latency
+        self.bandwidth = bandwidth
+        self.base = ""
+        self.uploads: dict[str, dict[int, int]] = {}
+        self.requests = 0
+
+    # GRiD API
+
+    def aoi(self) -> dict:
+        return {
+            "id": 1,
+            "name": f"benchmark {self.profile.name}",
+            "notes": "",
+            "exports": [
+                {
+                    "id": export_id,
+                    "name": f"export-{export_id}",
+                    "datatype": "benchmark",
+                    "status": "SUCCESS",
+                    "started_at": "2024-01-01T00:00:00Z",
+                }
+                for export_id in range(1, self.profile.exports + 1)
+            ],
+            "raster_intersects": [],
+            "mesh_intersects": [],
+            "pointcloud_intersects": [],
+            "vector_intersects": [],
+        }
+
+    def export(self, export_id: int) -> dict:
+        files = [
+            {
+                "id": export_id * 1_000_000 + index,
+                "name": f"tile-{index}.bin",
+                "datatype": "benchmark",
+                "filesize": self.profile.file_size,
+                "url": f"{self.base}/grid/api/v4/exportfiles/{export_id}/{index}/download",
+                "storage_path": "tiles",
+            }
+            for index in range(self.profile.files_per_export)
+        ]
+        return {
+            "exports": [
+                {
+                    "id": export_id,
+                    "name": f"export-{export_id}",
+                    "exportfiles": files,
+                    "auxfiles": [],
+                    "licensefiles": [],
+                }
+            ]
+        }
+
+    async def route(self, method: str, target: str, headers: dict[str, str], body: bytes) -> Response:
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts[:1] == ["storage"]:
+            await asyncio.sleep(self.storage_latency)
+            if method == "GET":
+                return self.storage_get(int(parts[1]), headers)
+            return self.storage_put(parts[1], int(parts[2]), body)
+
+        await asyncio.sleep(self.latency)
+        if parts[:3] != ["grid", "api", "v4"]:
+            return Response(404)
+        endpoint = parts[3:]
+        if endpoint[:1] == ["aois"]:
+            return Response.json({"aois": [self.aoi()]})
+        if endpoint[:1] == ["exports"] and len(endpoint) == 2:
+            return Response.json(self.export(int(endpoint[1])))
+        if endpoint[:1] == ["tasks"]:
+            return Response.json({"tasks": []})
+        if endpoint[:1] == ["exportfiles"]:
+            _, export_id, index, _ = endpoint
+            name = f"tile-{index}.bin"
+            return Response(302, headers={
+                "Location": f"{self.base}/storage/{self.profile.file_size}/{export_id}-{name}",
+                "Content-Disposition": f'attachment; filename="{name}"',
+            })
+        if endpoint[:1] == ["upload"]:
+            return self.upload(endpoint[1], method, query, body)
+        return Response(404)
+
+    def upload(self, action: str, method: str, query: dict[str, str], body: bytes) -> Response:
+        if action == "open":
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = {}
+            return Response.json({"upload_id": upload_id})
+        if action == "get_urls":
+            parts = int(query["nparts"])
+            return Response.json({
+                "parts": [
+                    {
+                        "part": part,
+                        "url": f"{self.base}/grid/api/v4/upload/part/?upload_id={query['upload_id']}&part={part}",
+                    }
+                    for part in range(1, parts + 1)
+                ]
+            })
+        if action == "part":
+            # doppkit sends the presigned url's query as json, GRiD redirects
+            # to the storage host
+            params = json.loads(body or b"{}")
+            return Response(307, headers={
+                "Location": f"{self.base}/storage/{params['upload_id']}/{params['part']}"
+            })
+        if action == "close":
+            payload = json.loads(body or b"{}")
+            self.uploads.pop(payload.get("upload_id"), None)
+            return Response.json({"status": "complete"})
+        return Response(404)
+
+    # storage host
+
+    def storage_get(self, size: int, headers: dict[str, str]) -> Response:
+        common = {"Accept-Ranges": "bytes", "ETag": etag(size)}
+        match = _range_re.fullmatch(headers.get("range", ""))
+        if_range = headers.get("if-range")
+        if match is None or (if_range is not None and if_range != common["ETag"]):
+            return Response(200, content(0, size), headers=common, length=size)
+        start = int(match[1])
+        end = int(match[2]) + 1 if match[2] else size
+        if start >= size:
+            return Response(416, headers={"Content-Range": f"bytes */{size}"})
+        end = min(end, size)
+        return Response(
+            206,
+            content(start, end),
+            headers={**common, "Content-Range": f"bytes {start}-{end - 1}/{size}"},
+            length=end - start
+        )
+
+    def storage_put(self, upload_id: str, part: int, body: bytes) -> Response:
+        self.uploads.setdefault(upload_id, {})[part] = len(body)
+        digest = hashlib.md5(body, usedforsecurity=False).hexdigest()
+        return Response(200, headers={"ETag": f'"{digest}"'})
+
+    # HTTP
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                response = await self.route(method, target, headers, body)
+                await self.send(writer, response)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer: asyncio.StreamWriter, response: Response) -> None:
+        reason = _reasons.get(response.status, "")
+        head = [f"HTTP/1.1 {response.status} {reason}", f"Content-Length: {response.length or 0}"]
+        head.extend(f"{name}: {value}" for name, value in response.headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if isinstance(response.body, bytes):
+            writer.write(response.body)
+            await writer.drain()
+            return None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        sent = 0
+        async for chunk in response.body:
+            writer.write(chunk)
+            sent += len(chunk)
+            await writer.drain()
+            if self.bandwidth:
+                ahead = sent / self.bandwidth - (loop.time() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        server = await asyncio.start_server(self.handle, host, port)
+        bound_host, bound_port = server.sockets[0].getsockname()[:2]
+        self.base = f"http://{bound_host}:{bound_port}"
+        logger.info(f"Fake GRiD serving {self.profile.name} at {self.base}/grid")
+        return server
+
+
+async def serve(grid: FakeGrid, host: str = "127.0.0.1", port: int = 0) -> None:
+    """Serve until cancelled, announcing the base url on stdout"""
+    server = await grid.start(host, port)
+    print(grid.base, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    from doppkit.throttle import parse_rate
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small-files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--storage-latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", default=None)
+    args = parser.parse_args(argv)
+    grid = FakeGrid(
+        PROFILES[args.profile],
+        latency=args.latency,
+        storage_latency=args.storage_latency,
+        bandwidth=parse_rate(args.bandwidth)
+    )
+    try:
+        asyncio.run(serve(grid, args.host, args.port))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
-import asyncio
 import logging
 import pathlib
 import os
 
-from typing import Union, Optional
+from typing import Union, Optional, TextIO
 from urllib.parse import urlparse
 
 import httpx
 
+from .concurrency import AdaptiveLimit
+from .events import EventStream
+from .metrics import Metrics
+from .retry import RetryPolicy
+from .session import Session
+from .shard import parse_shard
+from .throttle import Throttle, parse_rate, parse_schedule
+from .trace import NullTracer, Tracer
+from .writer import WRITE_BUFFER, WriterPool
+
 class Application:
     def __init__(
             self,
@@ -21,7 +30,32 @@ class Application:
             override: bool = False,
             directory: Union[str, pathlib.Path, None] = None,
             filter: str = "",
-            start_id: Optional[int] = 0
+            start_id: Optional[int] = 0,
+            segments: int = 4,
+            segment_threshold: int = 256 * 1024 * 1024,
+            store: Union[str, pathlib.Path, None] = None,
+            store_size: Optional[int] = None,
+            incremental: bool = False,
+            adaptive_concurrency: bool = True,
+            retries: int = 5,
+            retry_budget: int = 1000,
+            checksums: bool = True,
+            sha256: bool = False,
+            rate_limit: Union[str, float, None] = None,
+            host_rate_limit: Union[str, float, None] = None,
+            rate_schedule: Optional[str] = None,
+            http2: bool = False,
+            fresh: bool = False,
+            shard: Optional[str] = None,
+            shard_balance: bool = False,
+            trace: bool = False,
+            metrics_port: Optional[int] = None,
+            metrics_file: Union[str, pathlib.Path, None] = None,
+            events: Optional[TextIO] = None,
+            writer_threads: int = 4,
+            write_buffer: int = WRITE_BUFFER,
+            fsync: str = "none",
+            processes: int = 1
     ) -> None:
         """_summary_
 
@@ -37,7 +71,7 @@ class Application:
             how doppkit is being run, recognized options are CLI, GUI and API, by
             default "API"
         threads : int, optional
-            Number of threads to use to download resources, by default 20
+            Maximum number of resources to download concurrently, by default 20
         override : bool, optional
             Tells doppkit if the files should be overwritten
         directory: str, pathlib.Path, optional
@@ -46,7 +80,93 @@ class Application:
             Filter AOIs that contain the string provided here in the 'notes' field.
             Defaults to empty string, resulting in no filtering of results
         start_id: int
-            Filter out AOI PKs below this value.
+            Skip exports with an ID below this value, by default 0
+        segments : int, optional
+            Maximum number of concurrent byte ranges a single large file is split
+            into, taken from otherwise idle download slots, by default 4
+        segment_threshold : int, optional
+            Files at least this many bytes in size are downloaded in segments,
+            by default 256 MiB
+        store : str, pathlib.Path, optional
+            Location of the persistent store of downloaded files, by default a
+            ``.doppkit`` directory inside the download directory
+        store_size : int, optional
+            Maximum size in bytes of the download store, by default unlimited.
+            Files are stored as hardlinks or reflinks of the downloads, which
+            cost no extra disk space.  Where the filesystem allows neither,
+            files are only copied into the store if it has a maximum size, so
+            the store costs up to this much extra disk space.  Deleting
+            downloads does not free the space of objects linked to them, only
+            eviction past the maximum size does
+        incremental : bool, optional
+            Fetch existing files again if their size does not match GRiD's, they
+            are older than their export or they changed since their entry in the
+            export's manifest.jsonl was recorded, rather than skipping them, by
+            default False
+        adaptive_concurrency : bool, optional
+            Adjust the number of concurrent downloads, up to threads, to the
+            observed throughput and server congestion, by default True
+        retries : int, optional
+            Number of times a request failing with a transient error is retried,
+            by default 5
+        retry_budget : int, optional
+            Total number of retries allowed over the lifetime of the application,
+            by default 1000
+        checksums : bool, optional
+            Hash downloads as they are written, compare against the ETag where
+            it is an MD5 and record the digests in each export's manifest.jsonl,
+            by default True
+        sha256 : bool, optional
+            Also compute SHA-256 digests of downloads, by default False
+        rate_limit : str, float, optional
+            Overall bandwidth limit for downloads and uploads in bytes per second,
+            either a number or a string such as "10M", by default unlimited
+        host_rate_limit : str, float, optional
+            Bandwidth limit for each individual host, by default unlimited
+        rate_schedule : str, optional
+            Comma separated HH:MM-HH:MM=RATE windows of local time that override
+            rate_limit while active, such as "08:00-18:00=5M", by default None
+        http2 : bool, optional
+            Use HTTP/2 where servers support it, requires the h2 package, by
+            default False
+        fresh : bool, optional
+            Ask GRiD for the exports to sync even if an interrupted sync of the
+            same AOIs could be resumed from the sync state, by default False
+        shard : str, optional
+            Only sync slice i of n of the files, given as "i/n", so several
+            hosts can share one sync, by default None
+        shard_balance : bool, optional
+            Partition files between shards by size rather than by hash of
+            their path, by default False
+        trace : bool, optional
+            Record how long each phase of every request takes in ``tracer``, to
+            be saved as a Chrome trace with ``tracer.write``, by default False
+        metrics_port : int, optional
+            Serve Prometheus metrics on this port of localhost while the
+            application runs, by default None
+        metrics_file : str, pathlib.Path, optional
+            Periodically write Prometheus metrics to this file, for the node
+            exporter's textfile collector, by default None.  Call
+            ``metrics.close()`` when done to write it a last time
+        events : TextIO, optional
+            Stream download progress to this text stream as newline delimited
+            JSON events instead of showing progress bars in the CLI, by
+            default None.  Call ``events.close()`` when done
+        writer_threads : int, optional
+            Number of threads writing downloads to disk, by default 4
+        write_buffer : int, optional
+            Bytes of a download collected before they are written to disk in
+            one go, by default 1 MiB
+        fsync : str, optional
+            When to flush downloads to stable storage: "none" leaves it to the
+            operating system, "file" flushes each file before it is moved into
+            place and "end" flushes all files when ``writer.sync()`` is called
+            once the downloads are done, by default "none"
+        processes : int, optional
+            Number of worker processes downloading files, each with its own
+            event loop and connection pool and a share of threads, to use more
+            than one CPU.  API requests are always made by this process, by
+            default 1 which downloads in this process too
         """
         self.token = token if token is not None else os.getenv("GRID_ACCESS_TOKEN", "")
         if not self.token:
@@ -59,8 +179,18 @@ class Application:
         self.url = url
         self.threads = threads
         self.progress = progress
-        self.limit = asyncio.Semaphore(threads)
+        self.limit = AdaptiveLimit(threads, adaptive=adaptive_concurrency)
+        self.retry = RetryPolicy(attempts=retries, budget=retry_budget)
+        self.checksums = checksums
+        self.sha256 = sha256
+        self.throttle = Throttle(
+            parse_rate(rate_limit),
+            parse_rate(host_rate_limit),
+            parse_schedule(rate_schedule)
+        )
         self.override = override
+        self.incremental = incremental
+        self.fresh = fresh
         self.run_method = run_method
         self.log_level = log_level
 
@@ -77,11 +207,28 @@ class Application:
             if urlparse(url).hostname in exclude_hosts:
                 disable_ssl_verification = True
         self.disable_ssl_verification = disable_ssl_verification
+        self.http2 = http2
+        self.session = Session(self)
         if directory is None:
             directory = pathlib.Path.home() / "Downloads"
         self.directory = os.fsdecode(directory)
         self.filter = ""
         self.start_id = start_id
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.store = store
+        self.store_size = store_size
+        self.shard = parse_shard(shard)
+        self.shard_balance = shard_balance
+        self.tracer = Tracer() if trace else NullTracer()
+        self.metrics = Metrics(self)
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+        if metrics_file is not None:
+            self.metrics.write_periodically(metrics_file)
+        self.events = EventStream(events) if events is not None else None
+        self.writer = WriterPool(threads=writer_threads, buffer_size=write_buffer, fsync=fsync)
+        self.processes = max(1, processes)
 
     def __repr__(self) -> str:
         return (
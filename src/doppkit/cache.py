@@ -1,29 +1,61 @@
-__all__ = ["Content", "Progress", "cache", "cache_url", "DownloadUrl"]
+__all__ = ["Content", "Progress", "cache", "cache_iter", "cache_url", "DownloadUrl", "part_path", "store_keys", "needs_download"]
 
-import aiofiles
 import contextlib
+import datetime
 import pathlib
 import logging
 import asyncio
-import shutil
+import math
+import os
 import httpx
+import re
+import time
 from io import BytesIO
+from . import integrity
+from .integrity import IntegrityError, StreamHasher
+from .progress import CoalescedProgress
+from .store import open_store, materialize
+from .trace import NullTracer, Tracer
 from .util import parse_options_header
 from . import __version__
 
-from typing import Protocol, Optional, NamedTuple, TYPE_CHECKING, Union, Iterable
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Protocol,
+    Optional,
+    NamedTuple,
+    TYPE_CHECKING,
+    Union,
+    Iterable,
+    Sized
+)
 
 if TYPE_CHECKING:
     from .app import Application
 
 logger = logging.getLogger(__name__)
 
+# downloads are written next to their destination with this suffix appended and
+# only renamed into place once the transfer has completed
+PART_SUFFIX = ".part"
+
+# the validator of the response a .part file was started from, ETag or
+# Last-Modified, is kept next to it with this suffix appended
+VALIDATOR_SUFFIX = ".validator"
+
+# bytes 0-499/1234
+_content_range_re = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)", re.ASCII)
+
 
 class DownloadUrl(NamedTuple):
     url: str
     name: str = ""
     save_path: str = "."
     total: int = 1
+    file_id: Optional[int] = None
+    # time the export containing the file was started, if known
+    since: Optional[datetime.datetime] = None
 
 
 class Progress(Protocol):
@@ -31,12 +63,25 @@ class Progress(Protocol):
     def update(self, name: str, source: str, completed: int) -> None:
         ...
 
+    # followed by an update with the bytes the file already has
     def create_task(self, name: str, source: str, total: int) -> None:
         ...
     
     def complete_task(self, name: str, source: str) -> None:
         ...
 
+    # optional, called once a download has failed for good
+    def fail_task(self, name: str, source: str, reason: str) -> None:
+        ...
+
+    # optional, called as each byte range of a segmented download advances, with
+    # the bytes received of the total bytes of the segment starting at start,
+    # alongside the update of the whole file
+    def update_segment(
+            self, name: str, source: str, start: int, total: int, completed: int
+    ) -> None:
+        ...
+
 
 
 
@@ -92,43 +137,593 @@ class Content:
     data = property(get_data)
 
 
-completed_downloads: dict[str, Content] = dict()
+def _congestion(result: Union[Content, Exception, httpx.Response]) -> Optional[str]:
+    """Reason to reduce concurrency based on the result of a download, if any"""
+    if isinstance(result, httpx.HTTPStatusError):
+        result = result.response
+    if isinstance(result, httpx.Response):
+        if result.status_code == httpx.codes.TOO_MANY_REQUESTS:
+            return "too many requests"
+        if result.status_code >= 500:
+            return f"server error {result.status_code}"
+    elif isinstance(result, httpx.TimeoutException):
+        return "timeout"
+    return None
 
 
-async def cache(
+def _describe(result: Union[Content, Exception, httpx.Response]) -> str:
+    if isinstance(result, httpx.Response):
+        return f"status {result.status_code}"
+    return repr(result)
+
+
+@contextlib.asynccontextmanager
+async def _slot(args: 'Application', download: bool) -> AsyncIterator[None]:
+    """Hold a download slot while in the block, API requests do not need one"""
+    if not download:
+        with args.metrics.busy("metadata"):
+            yield
+        return
+    with args.tracer.span("wait for slot", "queue"):
+        await args.limit.acquire()
+    try:
+        with args.metrics.busy("transfer"):
+            yield
+    finally:
+        args.limit.release()
+
+
+async def _iterate(
+        urls: Union[Iterable[DownloadUrl], AsyncIterable[DownloadUrl]]
+) -> AsyncIterator[DownloadUrl]:
+    if isinstance(urls, AsyncIterable):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+async def _cache_retrying(
         app: 'Application',
-        urls: Iterable[DownloadUrl],
+        url: DownloadUrl,
         headers: dict[str, str],
+        client: httpx.AsyncClient,
         progress: Optional[Progress] = None
-) -> Iterable[Union[Content, BaseException, httpx.Response]]:
-    limits = httpx.Limits(
-        max_keepalive_connections=app.threads, max_connections=app.threads
-    )
-    timeout = httpx.Timeout(20.0, connect=40.0)
+) -> Union[Content, Exception, httpx.Response]:
+    """Download url, retrying transient failures, returning the final result"""
+    attempt = 0
+    while True:
+        try:
+            result = await cache_url(app, url, headers, client, progress=progress)
+        except Exception as e:
+            result = e
+        reason = _congestion(result)
+        if reason is not None:
+            app.limit.backoff(reason)
+        # a retried download picks up from its .part file
+        delay = app.retry.next_delay(result, attempt)
+        if delay is None:
+            return result
+        logger.warning(
+            f"Download of {url.name or url.url} failed with "
+            f"{_describe(result)}, retrying in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def cache_iter(
+        app: 'Application',
+        urls: Union[Iterable[DownloadUrl], AsyncIterable[DownloadUrl]],
+        headers: dict[str, str],
+        progress: Optional[Progress] = None
+) -> AsyncIterator[tuple[DownloadUrl, Union[Content, Exception, httpx.Response]]]:
+    """
+    Download urls with a fixed pool of ``app.threads`` workers, yielding each
+    url along with its result as soon as it completes.
+
+    urls are only pulled from the (possibly asynchronous) iterable as workers
+    become available, so memory use does not grow with the number of urls.
+    Exceptions raised while downloading a url are yielded as its result.
+    Progress updates are passed on to progress at most 10 times a second.
+
+    If ``app.processes`` is more than 1, files are downloaded by that many
+    worker processes instead, see :class:`~doppkit.workers.ProcessPool`.
+    """
     headers['user-agent'] = f"doppkit/{__version__}/{app.run_method}"
     headers["Authorization"] = f"Bearer {app.token}"
-    async with httpx.AsyncClient(
-        timeout=timeout, limits=limits, verify=not app.disable_ssl_verification
-    ) as client:
-        files = await asyncio.gather(
-            *[
-                asyncio.create_task(
-                    cache_url(
-                        app,
-                        url,
-                        headers,
-                        client,
-                        progress=progress
-                    )
-                )
-                for url in urls
-            ],
-            return_exceptions=True
-        )
+    workers = max(1, app.threads)
+    if isinstance(urls, Sized):
+        # no point in starting more workers than there are urls
+        workers = max(1, min(workers, len(urls)))
+    pending: asyncio.Queue = asyncio.Queue(maxsize=workers)
+    finished: asyncio.Queue = asyncio.Queue(maxsize=workers)
+
+    client = app.session.client()
+    coalesced = CoalescedProgress(progress) if progress is not None else None
+    pool = None
+    if app.processes > 1:
+        from .workers import ProcessPool
+        # API requests are answered here, only downloads go to worker processes
+        pool = ProcessPool(app, headers, coalesced)
+
+    async def feed() -> None:
+        try:
+            async for url in _iterate(urls):
+                await pending.put(url)
+        finally:
+            # let the workers finish even if iterating over urls failed
+            for _ in range(workers):
+                await pending.put(None)
+
+    async def work() -> None:
+        while (url := await pending.get()) is not None:
+            destination = _destination(app, url)
+            if pool is not None and destination is not None:
+                result = await pool.download(url)
+            else:
+                result = await _cache_retrying(app, url, headers, client, progress=coalesced)
+            app.metrics.record_result(result, download=destination is not None)
+            if coalesced is not None and isinstance(result, (Exception, httpx.Response)):
+                name = destination.name if destination is not None else "bytesIO"
+                coalesced.fail_task(name, url.url, _describe(result))
+            await finished.put((url, result))
+        await finished.put(None)
+
+    tasks = [asyncio.create_task(feed())]
+    tasks.extend(asyncio.create_task(work()) for _ in range(workers))
+    try:
+        running = workers
+        while running:
+            item = await finished.get()
+            if item is None:
+                running -= 1
+            else:
+                yield item
+        # surface errors from iterating over urls
+        await tasks[0]
+        if pool is not None:
+            # workers send the files they wrote to flush before they exit
+            await pool.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+        if pool is not None:
+            await pool.close(cancel=True)
+        if coalesced is not None:
+            coalesced.close()
+
+
+async def cache(
+        app: 'Application',
+        urls: Union[Iterable[DownloadUrl], AsyncIterable[DownloadUrl]],
+        headers: dict[str, str],
+        progress: Optional[Progress] = None
+) -> Iterable[Union[Content, Exception, httpx.Response]]:
+    """
+    Download urls, returning the results in the order the urls were given.
+
+    See :func:`cache_iter` to process results as they become available.
+    """
+    order: dict[DownloadUrl, list[int]] = {}
+
+    async def indexed() -> AsyncIterator[DownloadUrl]:
+        index = 0
+        async for url in _iterate(urls):
+            order.setdefault(url, []).append(index)
+            index += 1
+            yield url
+
+    results: dict[int, Union[Content, Exception, httpx.Response]] = {}
+    async for url, result in cache_iter(app, indexed(), headers, progress=progress):
+        indices = order[url]
+        results[indices.pop(0)] = result
+        if not indices:
+            del order[url]
+    files = [results[index] for index in range(len(results))]
     logger.info(f"Cache operation complete for {len(files)} files.")
     return files
 
 
+def part_path(target: pathlib.Path) -> pathlib.Path:
+    """Path of the sidecar file a download to ``target`` is streamed into"""
+    return target.with_name(f"{target.name}{PART_SUFFIX}")
+
+
+def _validator_path(partial: pathlib.Path) -> pathlib.Path:
+    return partial.with_name(f"{partial.name}{VALIDATOR_SUFFIX}")
+
+
+def _validator(headers: httpx.Headers) -> Optional[str]:
+    """Value for If-Range identifying the version of a response, if it has one"""
+    etag = headers.get("ETag")
+    # If-Range only takes strong ETags
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _discard_partial(partial: pathlib.Path) -> None:
+    partial.unlink(missing_ok=True)
+    _validator_path(partial).unlink(missing_ok=True)
+
+
+def _destination(args: 'Application', url: DownloadUrl) -> Optional[pathlib.Path]:
+    if url.save_path in ("", "."):
+        return None
+    return pathlib.Path(args.directory).joinpath(url.save_path.lstrip("/"))
+
+
+def needs_download(
+        args: 'Application',
+        url: DownloadUrl,
+        since: Optional[datetime.datetime] = None
+) -> bool:
+    """
+    Decide if a file has to be fetched, given what is already in the download
+    directory.
+
+    Without ``args.incremental`` only missing files are fetched.  In incremental
+    mode files whose size does not match ``url.total`` or that were written
+    before ``since`` (the time the export was started, by default
+    ``url.since``) are fetched again, as are files that no longer match their
+    entry in the export's manifest: files of a different size, and files
+    modified after they were recorded whose MD5 differs from the recorded one.
+    Short files that are otherwise current are moved to their ``.part`` file so
+    that only the missing tail is downloaded.
+
+    Parameters
+    ----------
+    args
+        doppkit application
+    url
+        file to check
+    since
+        time the export containing the file was started, if known, by default
+        ``url.since``
+
+    Returns
+    -------
+    bool
+        True if the file should be downloaded
+    """
+    destination = _destination(args, url)
+    if destination is None or args.override:
+        return True
+    try:
+        stat = destination.stat()
+    except FileNotFoundError:
+        return True
+    if not args.incremental:
+        return False
+
+    if since is None:
+        since = url.since
+    if since is not None and stat.st_mtime < since.timestamp():
+        logger.debug(f"{destination} predates its export, fetching again")
+        return True
+    if url.total > 1 and stat.st_size != url.total:
+        logger.debug(
+            f"{destination} is {stat.st_size} bytes instead of {url.total}, "
+            "fetching again"
+        )
+        partial = part_path(destination)
+        if stat.st_size < url.total and not partial.exists():
+            destination.replace(partial)
+        return True
+    if _changed(args, url, destination, stat):
+        # a stored object linked to the file changed along with it
+        open_store(args).discard(store_keys(url))
+        return True
+    return False
+
+
+def _changed(
+        args: 'Application',
+        url: DownloadUrl,
+        destination: pathlib.Path,
+        stat: os.stat_result
+) -> bool:
+    """Check a file against the latest entry for it in its export's manifest"""
+    entry = integrity.recorded(
+        integrity.manifest_path(pathlib.Path(args.directory), url.save_path)
+    ).get(url.save_path)
+    if entry is None:
+        return False
+    if entry.get("size") is not None and stat.st_size != entry["size"]:
+        logger.debug(
+            f"{destination} is {stat.st_size} bytes instead of the {entry['size']} "
+            "recorded, fetching again"
+        )
+        return True
+    # hashing every file on every sync would cost as much as fetching them, only
+    # files written to since they were recorded are checked
+    if stat.st_mtime <= entry.get("time", math.inf):
+        return False
+    expected = entry.get("md5") or integrity.etag_md5(entry.get("etag"))
+    if expected is None:
+        return False
+    if integrity.file_md5(destination) != expected:
+        logger.debug(f"{destination} does not match its recorded MD5, fetching again")
+        return True
+    return False
+
+
+def store_keys(url: DownloadUrl) -> list[str]:
+    """Keys a download is recorded under in the persistent download store"""
+    keys = [f"url:{url.url}"]
+    if url.file_id is not None:
+        # identifies a product file regardless of the export it is part of
+        keys.append(f"exportfile:{url.file_id}:{url.name}:{url.total}")
+    return keys
+
+
+async def _restore(
+        args: 'Application',
+        url: DownloadUrl,
+        stored: pathlib.Path,
+        destination: pathlib.Path,
+        progress: Optional[Progress] = None
+) -> Content:
+    """Materialize a previously downloaded file from the store at destination"""
+    size = stored.stat().st_size
+    if progress is not None:
+        progress.create_task(destination.name, url.url, total=size)
+    with args.tracer.span("restore", "disk", size=size) as span:
+        method = await asyncio.to_thread(materialize, stored, destination)
+        span["method"] = method
+    logger.info(f"Download store hit on {destination.name}, restored using {method}")
+    integrity.record(
+        integrity.manifest_path(pathlib.Path(args.directory), url.save_path),
+        path=url.save_path,
+        url=url.url,
+        size=size,
+        restored=method
+    )
+    if progress is not None:
+        progress.update(destination.name, url.url, completed=size)
+        progress.complete_task(destination.name, url.url)
+    return Content(
+        httpx.Headers(),
+        filename=pathlib.Path(url.save_path.lstrip("/")),
+        args=args
+    )
+
+
+def _refreshing(url: DownloadUrl, destination: pathlib.Path) -> Optional[float]:
+    """
+    Unix time the export of a file that is downloaded again although it exists,
+    because :func:`needs_download` found it out of date, was started.  Stored
+    objects downloaded before then are out of date too, whether they are
+    linked to the file or copies of it.
+    """
+    if url.since is None or not destination.exists():
+        return None
+    return url.since.timestamp()
+
+
+def _resume_offset(args: 'Application', url: DownloadUrl) -> int:
+    """
+    Determine how many bytes of a previous, interrupted, download can be reused.
+
+    Returns 0 if there is no partial download, if we are overriding existing
+    downloads, or if the partial download cannot be a prefix of the expected file.
+    """
+    destination = _destination(args, url)
+    if destination is None:
+        return 0
+    partial = part_path(destination)
+    try:
+        size = partial.stat().st_size
+    except OSError:
+        return 0
+    if args.override or (url.total > 1 and size >= url.total):
+        logger.debug(f"Discarding partial download {partial}")
+        _discard_partial(partial)
+        return 0
+    return size
+
+
+def _range_satisfied(response: httpx.Response, offset: int, expected_total: int) -> bool:
+    """
+    Check that the server honored a request for the bytes starting at offset and
+    that the resource is the size we expect it to be.
+    """
+    if response.status_code != httpx.codes.PARTIAL_CONTENT:
+        return False
+    match = _content_range_re.match(response.headers.get("Content-Range", ""))
+    if match is None or int(match[1]) != offset:
+        return False
+    if match[3] != "*" and expected_total > 1 and int(match[3]) != expected_total:
+        return False
+    return True
+
+
+async def _send_traced(
+        client: httpx.AsyncClient,
+        request: httpx.Request,
+        tracer: Union[Tracer, NullTracer]
+) -> httpx.Response:
+    # the span ends once the response headers are in, the time to first byte
+    with tracer.span("request", "http", host=request.url.host, path=request.url.path) as span:
+        response = await client.send(request, stream=True)
+        span["status"] = response.status_code
+        span["http_version"] = response.http_version
+    return response
+
+
+async def _send(
+        client: httpx.AsyncClient,
+        url: str,
+        headers: dict[str, str],
+        tracer: Union[Tracer, NullTracer]
+) -> tuple[httpx.Response, Optional[pathlib.Path], int]:
+    """
+    Send a GET request, following redirects while keeping track of the filename
+    GRiD hands out along the way and the largest reported content length.
+    """
+    request = client.build_request("GET", url, headers=headers, timeout=None)
+    response = await _send_traced(client, request, tracer)
+    filename = None  # placeholder
+    total = max(0, int(response.headers.get("Content-length", 0)))
+    while response.next_request is not None:
+        extracted_filename = Content._extract_filename(response.headers)
+        filename = (
+            extracted_filename if extracted_filename is not None else filename
+        )
+        request = response.next_request
+        await response.aclose()
+        response = await _send_traced(client, request, tracer)
+        total = max(total, int(response.headers.get("Content-length", 0)))
+    return response, filename, total
+
+
+async def _borrow_slots(limit: asyncio.Semaphore, wanted: int) -> int:
+    """Acquire up to ``wanted`` additional download slots that are currently idle"""
+    borrowed = 0
+    while borrowed < wanted and not limit.locked():
+        await limit.acquire()
+        borrowed += 1
+    return borrowed
+
+
+async def _download_segment(
+        args: 'Application',
+        url: DownloadUrl,
+        headers: dict[str, str],
+        client: httpx.AsyncClient,
+        target: pathlib.Path,
+        start: int,
+        end: int,
+        report
+) -> None:
+    """
+    Fetch bytes start-end (inclusive) of url and write them at the same offset,
+    resuming from the last byte written if the transfer is interrupted.
+    """
+    position = start
+    attempt = 0
+    tracer = args.tracer
+    # timing every chunk is only worth its cost while tracing
+    traced = tracer.enabled
+    while True:
+        try:
+            response, _, _ = await _send(
+                client, url.url, {**headers, "Range": f"bytes={position}-{end}"}, tracer
+            )
+            try:
+                if not _range_satisfied(response, position, url.total):
+                    raise httpx.HTTPStatusError(
+                        f"Server did not honor range request bytes={position}-{end} "
+                        f"for {url.name or url.url}, returned {response.status_code}",
+                        request=response.request,
+                        response=response
+                    )
+                first = position
+                async with args.writer.open(target, offset=position, segment=True) as f:
+                    with tracer.span("transfer", "http", start=position, end=end) as span:
+                        async for chunk in response.aiter_bytes():
+                            if traced:
+                                await tracer.timed("write", "disk", f.write(chunk), span)
+                            else:
+                                await f.write(chunk)
+                            position += len(chunk)
+                            report(start, len(chunk))
+                            args.metrics.record_download(response.url.host, len(chunk))
+                            if traced:
+                                await tracer.timed(
+                                    "throttle", "queue",
+                                    args.throttle.consume(response.url.host, len(chunk)),
+                                    span
+                                )
+                            else:
+                                await args.throttle.consume(response.url.host, len(chunk))
+                        span["bytes"] = position - first
+            finally:
+                await response.aclose()
+            if position <= end:
+                raise httpx.RemoteProtocolError(
+                    f"Segment of {url.name or url.url} ended at byte {position} "
+                    f"instead of {end + 1}"
+                )
+            return None
+        except Exception as e:
+            delay = args.retry.next_delay(e, attempt)
+            if delay is None:
+                raise
+            logger.warning(
+                f"Segment of {url.name or url.url} failed at byte {position} with "
+                f"{e!r}, resuming in {delay:.1f}s"
+            )
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _download_segmented(
+        args: 'Application',
+        url: DownloadUrl,
+        headers: dict[str, str],
+        client: httpx.AsyncClient,
+        target: pathlib.Path,
+        size: int,
+        segments: int,
+        name: str,
+        progress: Optional[Progress] = None
+) -> None:
+    """
+    Download a file as ``segments`` concurrent byte ranges written into a
+    preallocated ``target``.
+    """
+    await args.writer.allocate(target, size)
+
+    segment_size = math.ceil(size / segments)
+    starts = range(0, size, segment_size)
+    received = 0
+    # bytes received of each segment, keyed by its first byte
+    segment_received = dict.fromkeys(starts, 0)
+    update_segment = getattr(progress, "update_segment", None)
+
+    def report(start: int, nbytes: int) -> None:
+        nonlocal received
+        received += nbytes
+        segment_received[start] += nbytes
+        args.limit.record(nbytes)
+        if progress is not None:
+            progress.update(name, url.url, completed=received)
+        if update_segment is not None:
+            update_segment(
+                name,
+                url.url,
+                start,
+                min(segment_size, size - start),
+                segment_received[start]
+            )
+
+    logger.info(f"Downloading {url.name or url.url} in {len(starts)} segments")
+
+    async def segment(start: int) -> None:
+        with args.tracer.lane("segment"):
+            await _download_segment(
+                args,
+                url,
+                headers,
+                client,
+                target,
+                start,
+                min(start + segment_size, size) - 1,
+                report
+            )
+
+    tasks = [asyncio.create_task(segment(start)) for start in starts]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # if one segment fails, there is no point in finishing the others
+        for task in tasks:
+            task.cancel()
+
+
 async def cache_url(
         args: 'Application',
         url: DownloadUrl,
@@ -136,28 +731,89 @@ async def cache_url(
         client: httpx.AsyncClient,
         progress: Optional[Progress] = None
 ) -> Union[Content, httpx.Response]:
+    destination = _destination(args, url)
+    with args.tracer.lane(), args.tracer.span(
+            url.name or "request",
+            "download" if destination is not None else "api",
+            url=url.url
+    ) as span:
+        if destination is None or args.override:
+            result = await _fetch(args, url, headers, client, progress=progress)
+        else:
+            store = open_store(args)
+            keys = store_keys(url)
+            # the same file can be part of several exports, while one of them is
+            # downloading it the others wait and are then restored from the store
+            async with contextlib.AsyncExitStack() as stack:
+                with args.tracer.span("wait for duplicate", "queue", threshold=0.001):
+                    await stack.enter_async_context(store.reserve(keys[-1]))
+                stored = store.lookup(
+                    keys,
+                    size=url.total if url.total > 1 else None,
+                    newer_than=_refreshing(url, destination)
+                )
+                if stored is not None:
+                    result = await _restore(args, url, stored, destination, progress=progress)
+                else:
+                    result = await _fetch(args, url, headers, client, progress=progress)
+        if isinstance(result, httpx.Response):
+            span["status"] = result.status_code
+        return result
+
+
+async def _fetch(
+        args: 'Application',
+        url: DownloadUrl,
+        headers: dict[str, str],
+        client: httpx.AsyncClient,
+        progress: Optional[Progress] = None
+) -> Union[Content, httpx.Response]:
+    destination = _destination(args, url)
     limit = args.limit
-    async with limit:
+    tracer = args.tracer
+    # timing every chunk is only worth its cost while tracing
+    traced = tracer.enabled
+    # API requests are small and must not queue up behind the downloads they
+    # lead to, only downloads count against the concurrency limit
+    async with _slot(args, destination is not None):
         if url.name:
             logger.info(f"Getting {url.name}...")
-        request = client.build_request("GET", url.url, headers=headers, timeout=None)
-        response = await client.send(request, stream=True)
+        started = time.perf_counter()
+        offset = _resume_offset(args, url)
+        request_headers = headers
+        if offset:
+            request_headers = {**headers, "Range": f"bytes={offset}-"}
+            with contextlib.suppress(OSError):
+                # the rest of the file is only sent if it did not change since
+                # the .part was started, otherwise all of the new one is
+                request_headers["If-Range"] = _validator_path(
+                    part_path(destination)
+                ).read_text(encoding="utf-8").strip()
+        response, filename, total = await _send(client, url.url, request_headers, tracer)
+        if offset and response.status_code == httpx.codes.OK:
+            logger.info(
+                f"{url.name or url.url} changed or cannot be resumed, "
+                "restarting download."
+            )
+            offset = 0
+        elif offset and not _range_satisfied(response, offset, url.total):
+            logger.info(
+                f"Unable to resume {url.name or url.url} from byte {offset}, "
+                "restarting download."
+            )
+            await response.aclose()
+            offset = 0
+            response, filename, total = await _send(client, url.url, headers, tracer)
+        elif offset:
+            logger.info(f"Resuming {url.name or url.url} from byte {offset}")
+            total += offset
+        ttfb = time.perf_counter() - started
+
         if response.is_error:
             await response.aread()
             logger.error(f"GRiD returned an error code {response.status_code} with message: {response.text}")
             return response
 
-        filename = None  # placeholder
-        total = max(0, int(response.headers.get("Content-length", 0)))
-        while response.next_request is not None:
-            extracted_filename = Content._extract_filename(response.headers)
-            filename = (
-                extracted_filename if extracted_filename is not None else filename
-            )
-            request = response.next_request
-            await response.aclose()
-            response = await client.send(request, stream=True)
-            total = max(total, int(response.headers.get("Content-length", 0)))
         if filename is not None:  # we are not saving to BytesIO
             filename = pathlib.Path(url.save_path.lstrip("/"))
         c = Content(
@@ -165,19 +821,34 @@ async def cache_url(
             filename=filename,
             args=args
         )
-        if args.progress and progress is not None:
-            name = c.target.name if isinstance(c.target, pathlib.Path) else "bytesIO"
+        name = c.target.name if isinstance(c.target, pathlib.Path) else "bytesIO"
+        if progress is not None:
             progress.create_task(f"{name}", url.url, total=total)
+            # where the transfer starts, a resumed download already has offset
+            progress.update(name, url.url, completed=offset)
         chunk_count = 0
         if isinstance(c.target, BytesIO):
             # do in-memory stuff
-            async for chunk in response.aiter_bytes():
-                _ = c.target.write(chunk)
-                chunk_count += 1
-                if args.progress and progress is not None:
-                    progress.update(
-                        name, url.url, completed=response.num_bytes_downloaded
-                    )
+            with tracer.span("transfer", "http") as span:
+                async for chunk in response.aiter_bytes():
+                    _ = c.target.write(chunk)
+                    chunk_count += 1
+                    if destination is not None:
+                        limit.record(len(chunk))
+                    args.metrics.record_download(response.url.host, len(chunk))
+                    if traced:
+                        await tracer.timed(
+                            "throttle", "queue",
+                            args.throttle.consume(response.url.host, len(chunk)),
+                            span
+                        )
+                    else:
+                        await args.throttle.consume(response.url.host, len(chunk))
+                    if progress is not None:
+                        progress.update(
+                            name, url.url, completed=response.num_bytes_downloaded
+                        )
+                span["bytes"] = response.num_bytes_downloaded
             c.target.flush()
             c.target.seek(0)
         else:
@@ -186,30 +857,107 @@ async def cache_url(
             if c.target.parent is not None:
                 c.target.parent.mkdir(parents=True, exist_ok=True)
 
-            # check if we already downloaded this asset
-            if url.url in completed_downloads:
-                # get the path stored previously
-                previous_content = completed_downloads[url.url]
-                logger.info(f"Download cache hit on {c.target.name}, copying from {previous_content.target}")
-                shutil.copy(previous_content.target, c.target)
+            # we are writing to disk asynchronously, to a sidecar file so an
+            # interrupted transfer is never mistaken for a finished one
+            partial = part_path(c.target)
+            size = max(url.total, total)
+            if offset == 0:
+                validator = _validator(response.headers)
+                if validator is not None:
+                    _validator_path(partial).write_text(validator, encoding="utf-8")
+                else:
+                    _validator_path(partial).unlink(missing_ok=True)
+            # segmented downloads arrive out of order and cannot be hashed as
+            # they are written
+            verified = False
+            digests: dict[str, str] = {}
+            borrowed = 0
+            if (
+                offset == 0
+                and args.segments > 1
+                and size >= args.segment_threshold
+                and response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            ):
+                borrowed = await _borrow_slots(limit, args.segments - 1)
+            if borrowed:
+                await response.aclose()
+                try:
+                    await _download_segmented(
+                        args,
+                        url,
+                        headers,
+                        client,
+                        partial,
+                        size,
+                        borrowed + 1,
+                        name,
+                        progress=progress
+                    )
+                finally:
+                    for _ in range(borrowed):
+                        limit.release()
             else:
-                # we are writing to disk asynchronously
-                async with aiofiles.open(c.target, "wb+") as f:
-                    async for chunk in response.aiter_bytes():
-                        await f.write(chunk)
-                        chunk_count += 1
-                        if args.progress and progress is not None:
-                            progress.update(
-                                name,
-                                url.url,
-                                completed=response.num_bytes_downloaded
-                            )
-                completed_downloads[url.url] = c
-
-        if args.progress and progress is not None:
+                hasher = StreamHasher(sha256=args.sha256) if args.checksums else None
+                if hasher is not None and offset:
+                    await hasher.update_from_file(partial, offset)
+                async with args.writer.open(
+                        partial, offset=offset, size=size if url.total > 1 else None
+                ) as f:
+                    with tracer.span("transfer", "http", offset=offset) as span:
+                        async for chunk in response.aiter_bytes():
+                            if traced:
+                                await tracer.timed("write", "disk", f.write(chunk), span)
+                            else:
+                                await f.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            chunk_count += 1
+                            limit.record(len(chunk))
+                            args.metrics.record_download(response.url.host, len(chunk))
+                            if traced:
+                                await tracer.timed(
+                                    "throttle", "queue",
+                                    args.throttle.consume(response.url.host, len(chunk)),
+                                    span
+                                )
+                            else:
+                                await args.throttle.consume(response.url.host, len(chunk))
+                            if progress is not None:
+                                progress.update(
+                                    name,
+                                    url.url,
+                                    completed=offset + response.num_bytes_downloaded
+                                )
+                        span["bytes"] = response.num_bytes_downloaded
+                if hasher is not None:
+                    try:
+                        verified = hasher.verify(response.headers, url.name or url.url)
+                    except IntegrityError:
+                        # start over rather than resume from corrupt contents
+                        _discard_partial(partial)
+                        raise
+                    digests = hasher.digests()
+            with tracer.span("finalize", "disk"):
+                partial.replace(c.target)
+                _validator_path(partial).unlink(missing_ok=True)
+                stored_size = c.target.stat().st_size
+                integrity.record(
+                    integrity.manifest_path(pathlib.Path(args.directory), url.save_path),
+                    path=url.save_path,
+                    url=url.url,
+                    size=stored_size,
+                    etag=response.headers.get("ETag"),
+                    verified=verified,
+                    **digests
+                )
+                await open_store(args).add(store_keys(url), c.target)
+            args.writer.written(c.target)
+            args.metrics.record_file(
+                url.save_path, stored_size, ttfb, time.perf_counter() - started
+            )
+
+        if progress is not None:
             # we can hide the task now that it's finished
             progress.complete_task(name, url.url)
         await response.aclose()
-        if limit.locked():
-            await asyncio.sleep(0.5)
     return c
@@ -1,9 +1,13 @@
 import asyncio
 import click
 import logging
+import multiprocessing
 import pathlib
 
+from typing import Optional
+
 from doppkit.app import Application
+from doppkit.report import print_report, summarize, write_report
 from doppkit import __version__
 
 logger = logging.getLogger(__name__)
@@ -22,8 +26,86 @@ logger = logging.getLogger(__name__)
     help="GRiD Instance URL. Use GRID_BASE_URL environment variable to globally override",
 )
 @click.option("--log-level", default="INFO", help="Log level (INFO/DEBUG)")
-@click.option("--threads", default=20, type=int, help="Fetch thread count")
+@click.option("--threads", default=20, type=int, help="Maximum concurrent fetch count")
+@click.option(
+    "--adaptive/--fixed",
+    default=True,
+    help="Adapt the number of concurrent fetches to throughput, up to --threads",
+)
 @click.option("--progress", default=True, type=bool, help="Report download progress")
+@click.option(
+    "--retries",
+    default=5,
+    type=int,
+    help="Number of times a request failing with a transient error is retried",
+)
+@click.option(
+    "--retry-budget",
+    default=1000,
+    type=int,
+    help="Total number of retries allowed over the whole run",
+)
+@click.option(
+    "--rate-limit",
+    default=None,
+    help="Overall bandwidth limit in bytes per second, such as 10M",
+)
+@click.option(
+    "--host-rate-limit",
+    default=None,
+    help="Bandwidth limit per host in bytes per second, such as 5M",
+)
+@click.option(
+    "--rate-schedule",
+    default=None,
+    help="Time of day bandwidth limits overriding --rate-limit, such as "
+    "08:00-18:00=5M,18:00-08:00=0",
+)
+@click.option(
+    "--segments",
+    default=4,
+    type=int,
+    help="Maximum number of concurrent byte ranges to split a large file into",
+)
+@click.option(
+    "--segment-threshold",
+    default=256 * 1024 * 1024,
+    type=int,
+    help="Size in bytes above which files are downloaded in segments",
+)
+@click.option(
+    "--http2",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Use HTTP/2 where supported, requires doppkit[HTTP2]",
+)
+@click.option(
+    "--fsync",
+    type=click.Choice(["none", "file", "end"]),
+    default="none",
+    help="Flush downloads to disk after each file, once at the end, or leave "
+    "it to the operating system",
+)
+@click.option(
+    "--writer-threads",
+    default=4,
+    type=int,
+    help="Number of threads writing downloads to disk",
+)
+@click.option(
+    "--write-buffer",
+    default=1024 * 1024,
+    type=int,
+    help="Bytes of a download collected before they are written to disk",
+)
+@click.option(
+    "--processes",
+    default=1,
+    type=int,
+    help="Number of processes downloading files, sharing --threads, to use "
+    "more than one CPU",
+)
 @click.option(
     "--disable-ssl-verification",
     default=False,
@@ -31,9 +113,82 @@ logger = logging.getLogger(__name__)
     type=bool,
     help="Disable SSL verification of URLs",
 )
+@click.option(
+    "--trace",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write the timing of every request to this file as a Chrome trace, "
+    "viewable in Perfetto",
+)
+@click.option(
+    "--metrics-port",
+    default=None,
+    type=int,
+    help="Serve Prometheus metrics at http://localhost:PORT/metrics while running",
+)
+@click.option(
+    "--metrics-file",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Periodically write Prometheus metrics to this file for the node "
+    "exporter's textfile collector",
+)
+@click.option(
+    "--report",
+    default=False,
+    is_flag=True,
+    help="Print a performance report when done",
+)
+@click.option(
+    "--report-json",
+    default=None,
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Write a performance report to this file as JSON when done",
+)
+@click.option(
+    "--events",
+    type=click.Choice(["rich", "ndjson"]),
+    default="rich",
+    help="Show download progress as progress bars, or stream it as newline "
+    "delimited JSON events for automation",
+)
+@click.option(
+    "--events-fd",
+    default=1,
+    type=int,
+    help="File descriptor to write ndjson events to, by default stdout",
+)
 @click.version_option(version=__version__, message=f"doppkit {__version__}")
 @click.pass_context
-def cli(ctx, token, url, log_level, threads, progress, disable_ssl_verification):
+def cli(
+    ctx,
+    token,
+    url,
+    log_level,
+    threads,
+    adaptive,
+    progress,
+    retries,
+    retry_budget,
+    rate_limit,
+    host_rate_limit,
+    rate_schedule,
+    segments,
+    segment_threshold,
+    http2,
+    fsync,
+    writer_threads,
+    write_buffer,
+    processes,
+    disable_ssl_verification,
+    trace,
+    metrics_port,
+    metrics_file,
+    report,
+    report_json,
+    events,
+    events_fd
+):
 
     # Set up logging
     numeric_level = getattr(logging, log_level.upper(), None)
@@ -50,9 +205,57 @@ def cli(ctx, token, url, log_level, threads, progress, disable_ssl_verification)
         threads=threads,
         run_method="CLI",
         progress = progress,
-        disable_ssl_verification=disable_ssl_verification
+        disable_ssl_verification=disable_ssl_verification,
+        segments=segments,
+        segment_threshold=segment_threshold,
+        adaptive_concurrency=adaptive,
+        retries=retries,
+        retry_budget=retry_budget,
+        rate_limit=rate_limit,
+        host_rate_limit=host_rate_limit,
+        rate_schedule=rate_schedule,
+        http2=http2,
+        trace=trace is not None,
+        metrics_port=metrics_port,
+        metrics_file=metrics_file,
+        events=(
+            open(events_fd, "w", encoding="utf-8", closefd=False)
+            if events == "ndjson" else None
+        ),
+        writer_threads=writer_threads,
+        write_buffer=write_buffer,
+        fsync=fsync,
+        processes=processes
     )
     ctx.obj = app
+    ctx.call_on_close(app.writer.close)
+    ctx.call_on_close(app.metrics.close)
+    if app.events is not None:
+        ctx.call_on_close(app.events.close)
+    if trace is not None:
+        ctx.call_on_close(lambda: app.tracer.write(trace))
+    if report or report_json is not None:
+        ctx.call_on_close(lambda: end_of_run_report(app, report, report_json))
+
+
+def end_of_run_report(app: Application, show: bool, path: Optional[pathlib.Path]) -> None:
+    summary = summarize(app)
+    if show:
+        print_report(summary)
+    if path is not None:
+        write_report(summary, path)
+
+
+def aoi_ids(ids, from_file) -> list[str]:
+    """AOI IDs given as arguments followed by those listed in from_file"""
+    ids = list(ids)
+    if from_file is not None:
+        for line in from_file:
+            line = line.partition("#")[0]
+            ids.extend(line.replace(",", " ").split())
+    if not ids:
+        raise click.UsageError("Provide at least one AOI ID or --from-file")
+    return ids
 
 
 @cli.command()
@@ -66,20 +269,236 @@ def cli(ctx, token, url, log_level, threads, progress, disable_ssl_verification)
     type=bool,
     help="Override existing fetches of the same name",
 )
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help=(
+        "Fetch existing files again if they are incomplete, older than their "
+        "export or no longer match the size or MD5 recorded in its manifest"
+    ),
+)
+@click.option(
+    "--fresh",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="List exports again instead of resuming an interrupted sync of the same AOIs",
+)
 
 @click.option("--directory", help="Output directory to write", default="downloads", type=pathlib.Path)
 @click.option("--filter", help="AOI note filter query", default="")
-@click.argument("id",)
-def sync(app, timeout, start_id, override, directory, filter, id):
+@click.option(
+    "--store",
+    help="Directory of the persistent download store, defaults to DIRECTORY/.doppkit",
+    default=None,
+    type=pathlib.Path,
+)
+@click.option(
+    "--store-size",
+    help=(
+        "Maximum size in bytes of the download store.  Files are hardlinked or "
+        "reflinked into the store at no extra disk space, and only copied, using "
+        "up to this much extra space, if a size is given"
+    ),
+    default=None,
+    type=int,
+)
+@click.option(
+    "--checksums/--no-checksums",
+    default=True,
+    help="Verify downloads against MD5 ETags and record their digests",
+)
+@click.option(
+    "--sha256",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Also record SHA-256 digests of downloads",
+)
+@click.option(
+    "--from-file",
+    help="File listing AOI IDs to sync, separated by whitespace or commas, '-' for stdin",
+    default=None,
+    type=click.File("r"),
+)
+@click.option(
+    "--shard",
+    help="Only sync slice i of n of the files, such as 2/4, to share a sync between hosts",
+    default=None,
+    type=str,
+)
+@click.option(
+    "--shard-balance",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Partition files between shards by size instead of by hash of their path",
+)
+@click.argument("ids", nargs=-1)
+def sync(
+    app,
+    timeout,
+    start_id,
+    override,
+    incremental,
+    fresh,
+    directory,
+    filter,
+    store,
+    store_size,
+    checksums,
+    sha256,
+    from_file,
+    shard,
+    shard_balance,
+    ids
+):
     from doppkit.cli.sync import sync as syncFunction
+    from doppkit.shard import parse_shard
+    ids = aoi_ids(ids, from_file)
+    try:
+        app.shard = parse_shard(shard)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--shard") from e
+    app.shard_balance = shard_balance
     app.start_id = start_id
     app.timeout = timeout
     app.command = "sync"
     app.override = override
+    app.incremental = incremental
+    app.fresh = fresh
+    app.directory = directory
+    app.filter = filter
+    app.store = store
+    app.store_size = store_size
+    app.checksums = checksums
+    app.sha256 = sha256
+    app.id = ids[0] if len(ids) == 1 else ids
+    asyncio.run(syncFunction(app, *ids))
+
+
+@cli.command()
+@click.pass_obj
+@click.option(
+    "--interval",
+    help="Seconds between polls while exports are changing",
+    default=60.0,
+    type=float,
+)
+@click.option(
+    "--max-interval",
+    help="Seconds between polls that nothing has changed for a while",
+    default=3600.0,
+    type=float,
+)
+@click.option("--directory", help="Output directory to write", default="downloads", type=pathlib.Path)
+@click.option("--filter", help="AOI note filter query", default="")
+@click.option(
+    "--store",
+    help="Directory of the persistent download store, defaults to DIRECTORY/.doppkit",
+    default=None,
+    type=pathlib.Path,
+)
+@click.option(
+    "--store-size",
+    help=(
+        "Maximum size in bytes of the download store.  Files are hardlinked or "
+        "reflinked into the store at no extra disk space, and only copied, using "
+        "up to this much extra space, if a size is given"
+    ),
+    default=None,
+    type=int,
+)
+@click.option(
+    "--checksums/--no-checksums",
+    default=True,
+    help="Verify downloads against MD5 ETags and record their digests",
+)
+@click.option(
+    "--sha256",
+    default=False,
+    is_flag=True,
+    type=bool,
+    help="Also record SHA-256 digests of downloads",
+)
+@click.option(
+    "--from-file",
+    help="File listing AOI IDs to watch, separated by whitespace or commas, '-' for stdin",
+    default=None,
+    type=click.File("r"),
+)
+@click.argument("ids", nargs=-1)
+def watch(
+    app,
+    interval,
+    max_interval,
+    directory,
+    filter,
+    store,
+    store_size,
+    checksums,
+    sha256,
+    from_file,
+    ids
+):
+    """Keep AOIs synced, downloading new and changed exports as they appear"""
+    from doppkit.cli.watch import watch as watchFunction
+    ids = aoi_ids(ids, from_file)
+    app.command = "watch"
+    # exports that were run again replace files of the same name
+    app.incremental = True
     app.directory = directory
     app.filter = filter
-    app.id = id
-    asyncio.run(syncFunction(app, id))
+    app.store = store
+    app.store_size = store_size
+    app.checksums = checksums
+    app.sha256 = sha256
+    app.id = ids[0] if len(ids) == 1 else ids
+    try:
+        asyncio.run(
+            watchFunction(app, *ids, interval=interval, max_interval=max_interval)
+        )
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
+@cli.command()
+@click.option("--directory", help="Download directory of the sync", default="downloads", type=pathlib.Path)
+@click.option("--shard", help="Shard i/n of a sharded sync to show", default=None, type=str)
+@click.pass_obj
+def status(app, directory, shard):
+    """Show the progress of the latest sync, also while it is running"""
+    from doppkit.cli.status import status as statusFunction
+    from doppkit.shard import parse_shard
+    app.directory = directory
+    try:
+        app.shard = parse_shard(shard)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--shard") from e
+    statusFunction(app)
+
+
+@cli.command('check-shards')
+@click.option("--directory", help="Download directory shared by the shards", default="downloads", type=pathlib.Path)
+@click.option("--shards", help="Number of shards, by default taken from their manifests", default=None, type=int)
+def checkShards(directory, shards):
+    """Check that every shard of a sharded sync completed, exiting with 1 if not"""
+    from doppkit.shard import check
+    result = check(directory, shards)
+    if result["shards"] == 0:
+        click.echo(f"No shard manifests found in {directory}")
+        raise SystemExit(1)
+    for index in result["missing"]:
+        click.echo(f"Shard {index}/{result['shards']} has not finished")
+    for index in result["incomplete"]:
+        click.echo(f"Shard {index}/{result['shards']} finished with files that did not download")
+    for save_path in result["failed"]:
+        click.echo(f"  {save_path}")
+    if not result["complete"]:
+        raise SystemExit(1)
+    click.echo(f"All {result['shards']} shards complete")
 
 
 @cli.command('list-aois')
@@ -100,4 +519,6 @@ def listExports(app, id):
 
 
 if __name__ == "__main__":
+    # download worker processes of frozen builds start through here
+    multiprocessing.freeze_support()
     cli()
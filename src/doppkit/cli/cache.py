@@ -1,4 +1,4 @@
-from typing import Iterable, Union, TYPE_CHECKING
+from typing import AsyncIterable, Iterable, Optional, Union, TYPE_CHECKING
 from rich.table import Column
 from rich.progress import (
     DownloadColumn,
@@ -10,9 +10,11 @@ from rich.progress import (
 )
 
 from doppkit.cache import cache as cache_generic
+from doppkit.state import StateProgress
 if TYPE_CHECKING:
     from ..app import Application
     from ..cache import Content, DownloadUrl
+    from ..state import SyncState
 
 
 class RichProgress:
@@ -20,20 +22,57 @@ class RichProgress:
     def __init__(self, context_manager: Progress):
         self.context_manager = context_manager
         self.tasks: dict[str, TaskID] = {}
+        # byte ranges of segmented downloads, keyed by source and first byte
+        self.segments: dict[tuple[str, int], TaskID] = {}
 
     def create_task(self, name: str, source: str, total: int):
-        self.tasks[name] = self.context_manager.add_task(name, total=total)
+        # files of different exports can share a name, their sources differ
+        if source in self.tasks:
+            # download is being retried
+            self.context_manager.reset(self.tasks[source], total=total)
+            self._remove_segments(source)
+        else:
+            self.tasks[source] = self.context_manager.add_task(name, total=total)
 
     def update(self, name: str, source: str, completed: int):
-        task = self.tasks[name]
+        task = self.tasks[source]
         self.context_manager.update(task, completed=completed)
     
+    def update_segment(self, name: str, source: str, start: int, total: int, completed: int):
+        key = (source, start)
+        if key not in self.segments:
+            self.segments[key] = self.context_manager.add_task(
+                f"  {name} from byte {start}", total=total
+            )
+        self.context_manager.update(self.segments[key], completed=completed)
+
     def complete_task(self, name: str, source: str):
-        task = self.tasks.pop(name)
+        task = self.tasks.pop(source)
         self.context_manager.update(task, visible=False)
+        self._remove_segments(source)
+
+    def fail_task(self, name: str, source: str, reason: str):
+        task = self.tasks.pop(source, None)
+        if task is not None:
+            self.context_manager.update(task, visible=False)
+        self._remove_segments(source)
+
+    def _remove_segments(self, source: str):
+        for key in [key for key in self.segments if key[0] == source]:
+            self.context_manager.remove_task(self.segments.pop(key))
+
 
+async def cache(
+        app: 'Application',
+        urls: Union[Iterable['DownloadUrl'], AsyncIterable['DownloadUrl']],
+        headers,
+        state: Optional['SyncState'] = None
+) -> Iterable[Union[Exception, 'Content']]:
 
-async def cache(app: 'Application', urls: Iterable['DownloadUrl'], headers) -> Iterable[Union[Exception, 'Content']]:
+    if app.events is not None:
+        # machine readable events replace the progress bars
+        progress = app.events if state is None else StateProgress(state, app.events)
+        return await cache_generic(app, urls, headers, progress=progress)
 
     text_column = TextColumn("{task.description}", table_column=Column(ratio=1))
     bar_column = BarColumn(bar_width=None, table_column=Column(ratio=2))
@@ -43,8 +82,11 @@ async def cache(app: 'Application', urls: Iterable['DownloadUrl'], headers) -> I
         bar_column,
         DownloadColumn(),
         TransferSpeedColumn(),
-        transient=True
+        transient=True,
+        disable=not app.progress
     ) as progress:
         rich_progress = RichProgress(progress)
+        if state is not None:
+            rich_progress = StateProgress(state, rich_progress)
         files = await cache_generic(app, urls, headers, progress=rich_progress)
     return files
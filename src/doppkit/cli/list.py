@@ -2,14 +2,23 @@
 import asyncio
 from doppkit.grid import Grid
 from rich.console import Console
+from rich.live import Live
 from rich.table import Table
 
 
+async def _run(args, coroutine):
+    """Await coroutine, closing the HTTP session of args afterwards"""
+    try:
+        return await coroutine
+    finally:
+        await args.session.aclose()
+
+
 def listAOIs(args):
     """List AOIs and Exports for a given user token"""
 
     api = Grid(args)
-    aois = asyncio.run(api.get_aois())
+    aois = asyncio.run(_run(args, api.get_aois()))
 
     console = Console()
     table = Table(title='AOIs')
@@ -26,10 +35,13 @@ def listAOIs(args):
 
 def listExports(args, id_):
     """List Exports for a given AOI ID"""
+    asyncio.run(_run(args, _listExports(args, id_)))
 
+
+async def _listExports(args, id_):
     api = Grid(args)
 
-    aois = asyncio.run(api.get_aois(id_=id_))
+    aois = await api.get_aois(int(id_))
 
     aoi = aois[0]
     console = Console()
@@ -38,14 +50,12 @@ def listExports(args, id_):
     table.add_column("Export ID")
     table.add_column("Name")
     table.add_column("Size")
-    if aoi.get('exports'):
-        for export in aoi['exports']:
-            export_id = export['id']
-            exports = asyncio.run(api.get_exports(export_id))
+    # rows are added as the files of each export become known
+    with Live(table, console=console, refresh_per_second=4):
+        async for export, exports in api.iter_exports(aoi.get('exports') or []):
             for e in exports:
                 table.add_row(
-                    str(export_id),
+                    str(export['id']),
                     e.name,
                     str(e.total)
                 )
-    console.print(table)
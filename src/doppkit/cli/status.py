@@ -0,0 +1,56 @@
+import datetime
+
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+
+from doppkit.state import DONE, FAILED, PARTIAL, PENDING, SyncState, state_path
+
+
+def _time(timestamp) -> str:
+    if timestamp is None:
+        return "-"
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+
+def status(args):
+    """Show the progress of the latest sync into the download directory"""
+    console = Console()
+    path = state_path(args.directory, args.shard)
+    if not path.exists():
+        console.print(f"No sync has been run into {args.directory}")
+        return None
+
+    # read only, so a running sync is not disturbed
+    state = SyncState(path, read_only=True)
+    try:
+        run = state.latest()
+        if run is None:
+            console.print(f"No sync has been run into {args.directory}")
+            return None
+        summary = state.summary(run["run"])
+    finally:
+        state.close()
+
+    if run["finished"] is not None:
+        condition = f"finished {_time(run['finished'])}"
+    elif run["planned"] is not None:
+        condition = "downloading"
+    else:
+        condition = "listing exports"
+    aois = ", ".join(run["plan"]["aois"])
+    table = Table(title=f"Sync of AOIs {aois} started {_time(run['started'])}, {condition}")
+
+    table.add_column("Status")
+    table.add_column("Files", justify="right")
+    table.add_column("Received", justify="right")
+    table.add_column("Size", justify="right")
+    files = received = size = 0
+    for name in (DONE, PARTIAL, PENDING, FAILED):
+        count, nbytes, total = summary.get(name, (0, 0, 0))
+        table.add_row(name, str(count), decimal(nbytes), decimal(total))
+        files += count
+        received += nbytes
+        size += total
+    table.add_row("total", str(files), decimal(received), decimal(size), style="bold")
+    console.print(table)
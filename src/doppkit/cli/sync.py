@@ -1,10 +1,14 @@
 import logging
 from pathlib import Path
 
-from doppkit.grid import Grid
+import httpx
+
+from doppkit.grid import Export, Grid, started_at
 from doppkit.cli.cache import cache
-from doppkit.cache import Content, DownloadUrl
-from typing import Iterable, TYPE_CHECKING
+from doppkit.cache import Content, DownloadUrl, needs_download
+from doppkit.shard import partition, write_manifest
+from doppkit.state import DONE, SyncState, open_state
+from typing import AsyncIterator, Iterable, Optional, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from doppkit.app import Application
@@ -14,45 +18,171 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-async def sync(args: 'Application', id_: str) -> Iterable[Content]:
-    """The main function for our script."""
-
-    # Create a directory into which our downloads will go
-    download_dir = Path(args.directory)
-    logger.debug(f"download directory: {args.directory}")
-    download_dir.mkdir(exist_ok=True)
+async def sync(args: 'Application', *ids: str) -> Iterable[Content]:
+    """
+    The main function for our script.
 
+    The exports of every AOI in ids are downloaded together, sharing one
+    connection pool and concurrency limit.  Progress is recorded in the sync
+    state of the download directory, an interrupted sync of the same AOIs is
+    resumed from there without asking GRiD for the exports again unless
+    ``args.fresh`` is set.
+    """
     api = Grid(args)
-    aois = await api.get_aois(int(id_))
+    state = open_state(args)
+    plan = {
+        "aois": sorted(ids),
+        "filter": args.filter,
+        "start_id": args.start_id,
+        "directory": str(Path(args.directory).resolve()),
+        "shard": str(args.shard) if args.shard is not None else None,
+        "shard_balance": args.shard_balance,
+    }
+    try:
+        run = None if args.fresh else state.resumable(plan)
+        if run is not None:
+            logger.info("Resuming interrupted sync from its saved state")
+            state.resume(run)
+            results = await resume_exports(args, state)
+        else:
+            state.start(plan)
+            exports = await sync_exports(args, api, ids)
+            results = await download_exports(args, api, exports, state=state)
+        # with fsync "end", flush everything downloaded before recording the
+        # run as finished
+        await args.writer.sync()
+        state.finish()
+        if args.shard is not None:
+            write_manifest(args.directory, args.shard, state.files())
+    finally:
+        state.close()
+        await args.session.aclose()
+    return [result for _, result in results]
+
+
+async def sync_exports(args: 'Application', api: Grid, ids: Iterable[str]) -> list[Export]:
+    """
+    Exports of the AOIs in ids that pass the AOI note filter, starting from
+    export ``args.start_id``
+    """
+    aois = await api.get_many_aois(int(id_) for id_ in ids)
 
     if args.filter:
         logger.debug(f'Filtering AOIs with "{args.filter}"')
         aois = [aoi for aoi in aois if args.filter in aoi["notes"]]
-    files_to_download = []
-    for aoi in aois:
-        for export in aoi["exports"]:
-            logger.debug(f"export: {export}")
-            files = await api.get_exports(export["id"])
-            files_to_download.extend(files)
-
-    total_downloads = len(files_to_download)
-    urls = []
-    logger.debug(f"{total_downloads} files found, downloading to dir: {download_dir}")
-    for file_ in files_to_download:
-        download_url = file_.url
-        download_destination = download_dir.joinpath(file_.save_path)
-        logger.debug(
-            f"File {file_.name} downloading from {download_url} to {download_destination}"
-        )
-        # Skip this file if we've already downloaded it
-        if not args.override and download_destination.exists():
-            logger.debug(f"File already exists, skipping: {download_destination}")
+    # AOIs can share exports, download those only once
+    exports = {
+        export["id"]: export for aoi in aois for export in aoi["exports"]
+    }
+    if args.start_id:
+        logger.debug(f"Skipping exports before {args.start_id}")
+        exports = {
+            export_id: export for export_id, export in exports.items()
+            if export_id >= args.start_id
+        }
+    return list(exports.values())
+
+
+async def download_exports(
+        args: 'Application',
+        api: Grid,
+        exports: list[Export],
+        state: Optional[SyncState] = None
+) -> list[tuple[Export, Union[Content, Exception, httpx.Response]]]:
+    """
+    Download the files of exports that are missing from the download directory.
+
+    Returns
+    -------
+    list of tuple
+        Export each downloaded file belongs to, along with the result of the
+        download
+    """
+    download_dir = Path(args.directory)
+
+    async def resolved() -> AsyncIterator[tuple[Export, list[DownloadUrl]]]:
+        if args.shard is None:
+            async for export, export_files in api.iter_exports(exports):
+                yield export, export_files
+        elif not args.shard_balance:
+            async for export, export_files in api.iter_exports(exports):
+                yield export, [f for f in export_files if args.shard.owns(f)]
         else:
-            urls.append(
-                file_
-            )
+            # balancing by size needs every file before any can be assigned
+            everything = [item async for item in api.iter_exports(exports)]
+            owned = set(partition(
+                (f for _, export_files in everything for f in export_files),
+                args.shard,
+                balance=True
+            ))
+            for export, export_files in everything:
+                yield export, [f for f in export_files if f in owned]
+
+    async def files() -> AsyncIterator[tuple[Export, DownloadUrl]]:
+        # files are handed to the downloads as soon as their export resolves,
+        # so transfers overlap with fetching the metadata of the other exports
+        total_downloads = 0
+        async for export, export_files in resolved():
+            since = started_at(export)
+            total_downloads += len(export_files)
+            wanted = []
+            for file_ in export_files:
+                download_destination = download_dir.joinpath(file_.save_path)
+                logger.debug(
+                    f"File {file_.name} downloading from {file_.url} to {download_destination}"
+                )
+                # Skip this file if we've already downloaded it
+                if not needs_download(args, file_, since):
+                    logger.debug(f"File already exists, skipping: {download_destination}")
+                else:
+                    wanted.append(file_)
+            if state is not None:
+                state.add_export(export, export_files, wanted)
+            for file_ in wanted:
+                yield export, file_
+        if state is not None:
+            state.planned()
+        logger.debug(f"{total_downloads} files found, downloaded to dir: {download_dir}")
+
+    return await _download(args, files(), state)
+
+
+async def resume_exports(
+        args: 'Application',
+        state: SyncState
+) -> list[tuple[Export, Union[Content, Exception, httpx.Response]]]:
+    """Download the files a previous run recorded in state did not finish"""
+
+    async def files() -> AsyncIterator[tuple[Export, DownloadUrl]]:
+        for export, file_ in state.remaining():
+            if needs_download(args, file_, started_at(export)):
+                yield export, file_
+            else:
+                # finished, but the run was interrupted before recording it
+                state.mark(file_.url, DONE, file_.total)
+
+    return await _download(args, files(), state)
+
+
+async def _download(
+        args: 'Application',
+        files: AsyncIterator[tuple[Export, DownloadUrl]],
+        state: Optional[SyncState]
+) -> list[tuple[Export, Union[Content, Exception, httpx.Response]]]:
+    # Create a directory into which our downloads will go
+    download_dir = Path(args.directory)
+    logger.debug(f"download directory: {args.directory}")
+    download_dir.mkdir(exist_ok=True)
+
     headers = {"Authorization": f"Bearer {args.token}"}
-    logger.debug(urls, headers)
+    downloads: list[tuple[Export, DownloadUrl]] = []
+
+    async def urls() -> AsyncIterator[DownloadUrl]:
+        async for export, file_ in files:
+            downloads.append((export, file_))
+            yield file_
 
-    files = await cache(args, urls, headers)
-    return files
+    # files are marked done or failed in state as they finish
+    results = await cache(args, urls(), headers, state=state)
+    # cache returns results in the order the urls were yielded
+    return [(export, result) for (export, _), result in zip(downloads, results)]
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+import httpx
+
+from doppkit.grid import Export, Grid
+from doppkit.cache import Content
+from doppkit.cli.sync import download_exports, sync_exports
+from typing import Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from doppkit.app import Application
+
+
+logger = logging.getLogger(__name__)
+
+# growth of the poll interval after each poll that found nothing to do
+INTERVAL_BACKOFF = 1.5
+
+# export statuses of exports GRiD is still producing files for, compared
+# case-insensitively
+IN_PROGRESS_STATUSES = frozenset(
+    {"pending", "queued", "started", "running", "processing", "in progress"}
+)
+
+
+def fingerprint(export: Export) -> tuple:
+    """What identifies a version of an export, a change means it was re-run"""
+    return export.get("started_at"), export.get("status")
+
+
+def in_progress(export: Export) -> bool:
+    return str(export.get("status", "")).lower() in IN_PROGRESS_STATUSES
+
+
+async def poll(
+        args: 'Application',
+        api: Grid,
+        ids: Iterable[str],
+        seen: dict[int, tuple]
+) -> tuple[bool, bool]:
+    """
+    Download the new or changed exports of the AOIs in ids.
+
+    Exports are recorded in seen once all of their files were downloaded, so
+    exports that failed are attempted again on the next poll.
+
+    Returns
+    -------
+    tuple of bool
+        Whether anything was downloaded, and whether GRiD is still working on
+        some of the exports
+    """
+    exports = await sync_exports(args, api, ids)
+    busy = False
+    changed = []
+    for export in exports:
+        if in_progress(export):
+            busy = True
+        elif seen.get(export["id"]) != fingerprint(export):
+            changed.append(export)
+    if not changed:
+        logger.debug("No new or changed exports")
+        return False, busy
+
+    logger.info(f"{len(changed)} new or changed exports")
+    results = await download_exports(args, api, changed)
+    await args.writer.sync()
+    failed = {
+        export["id"] for export, result in results if not isinstance(result, Content)
+    }
+    for export in changed:
+        if export["id"] in failed:
+            logger.warning(f"Export {export['id']} did not download completely, retrying next poll")
+        else:
+            seen[export["id"]] = fingerprint(export)
+    return True, busy
+
+
+async def watch(
+        args: 'Application',
+        *ids: str,
+        interval: float = 60.0,
+        max_interval: float = 3600.0,
+        polls: Optional[int] = None
+) -> None:
+    """
+    Keep the exports of the AOIs in ids synced until interrupted.
+
+    Only exports that are new or whose ``started_at`` or ``status`` changed
+    since the previous poll are looked at.  Polls happen every ``interval``
+    seconds while there is activity, and back off up to ``max_interval`` while
+    nothing changes.
+
+    Parameters
+    ----------
+    args
+        doppkit application
+    ids
+        AOI IDs to watch
+    interval
+        Shortest time in seconds between polls
+    max_interval
+        Longest time in seconds between polls
+    polls
+        Number of polls after which to stop, by default keep polling
+    """
+    api = Grid(args)
+    seen: dict[int, tuple] = {}
+    delay = interval
+    count = 0
+    try:
+        while True:
+            try:
+                changed, busy = await poll(args, api, ids, seen)
+            except (httpx.HTTPError, RuntimeError) as e:
+                logger.warning(f"Polling GRiD failed with {e!r}")
+                changed, busy = False, False
+            count += 1
+            if polls is not None and count >= polls:
+                break
+            if changed or busy:
+                delay = interval
+            else:
+                delay = min(max_interval, delay * INTERVAL_BACKOFF)
+            logger.info(f"Watching {len(seen)} exports, next poll in {delay:.0f}s")
+            await asyncio.sleep(delay)
+    finally:
+        await args.session.aclose()
@@ -0,0 +1,178 @@
+__all__ = ["AdaptiveLimit"]
+
+import asyncio
+import collections
+import logging
+import time
+
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit for downloads that adjusts itself to the link.
+
+    Can be used in place of an :class:`asyncio.Semaphore`.  While every slot is
+    in use the aggregate throughput reported through :meth:`record` is compared
+    over consecutive intervals; the limit grows by one while throughput keeps
+    improving and shrinks by one if an increase made things worse.  Timeouts and
+    overloaded servers reported through :meth:`backoff` cut the limit by
+    ``decrease_factor``, at most once per interval.
+
+    Parameters
+    ----------
+    maximum
+        Upper bound on the number of concurrent downloads
+    minimum
+        Lower bound on the number of concurrent downloads, by default 1
+    initial
+        Limit to start at, by default the smaller of 4 and maximum
+    adaptive
+        When False the limit stays at maximum, behaving like a semaphore
+    interval
+        Seconds over which throughput is measured, by default 2.0
+    tolerance
+        Relative change in throughput considered significant, by default 0.05
+    decrease_factor
+        Multiplier applied to the limit when backing off, by default 0.5
+    """
+
+    def __init__(
+            self,
+            maximum: int,
+            minimum: int = 1,
+            initial: Optional[int] = None,
+            adaptive: bool = True,
+            interval: float = 2.0,
+            tolerance: float = 0.05,
+            decrease_factor: float = 0.5
+    ) -> None:
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.adaptive = adaptive
+        if not adaptive:
+            initial = self.maximum
+        elif initial is None:
+            initial = min(4, self.maximum)
+        self._limit = max(self.minimum, min(initial, self.maximum))
+        self.interval = interval
+        self.tolerance = tolerance
+        self.decrease_factor = decrease_factor
+
+        self._in_flight = 0
+        self._waiters: collections.deque[asyncio.Future] = collections.deque()
+
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_saturated = True
+        self._previous: Optional[float] = None
+        self._last_backoff = 0.0
+        self.throughput = 0.0
+
+    def __repr__(self) -> str:
+        return f"AdaptiveLimit {self._in_flight}/{self._limit} (max {self.maximum})"
+
+    @property
+    def limit(self) -> int:
+        """Current number of downloads allowed to run concurrently"""
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Number of downloads waiting for a slot"""
+        return sum(not waiter.done() for waiter in self._waiters)
+
+    def locked(self) -> bool:
+        return self._in_flight >= self._limit or any(
+            not waiter.done() for waiter in self._waiters
+        )
+
+    async def acquire(self) -> bool:
+        if not self.locked():
+            self._in_flight += 1
+            self._check_saturation()
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # we were handed a slot right as we got cancelled, pass it on
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return True
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._wake()
+        self._check_saturation()
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def _wake(self) -> None:
+        while self._waiters and self._in_flight < self._limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(True)
+
+    def _check_saturation(self) -> None:
+        if self._in_flight < self._limit:
+            self._window_saturated = False
+
+    def _set_limit(self, limit: int, reason: str) -> None:
+        limit = max(self.minimum, min(limit, self.maximum))
+        if limit != self._limit:
+            logger.debug(f"Concurrency limit {self._limit} -> {limit} ({reason})")
+            self._limit = limit
+            self._wake()
+            self._check_saturation()
+
+    def record(self, nbytes: int) -> None:
+        """Account for nbytes having been transferred"""
+        self._window_bytes += nbytes
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return None
+        self.throughput = self._window_bytes / elapsed
+        saturated = self._window_saturated and self._in_flight >= self._limit
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_saturated = True
+        if not self.adaptive:
+            return None
+        if not saturated:
+            # not every slot was in use, so we learned nothing about the limit
+            self._previous = None
+            return None
+        if self._previous is None or self.throughput > self._previous * (1 + self.tolerance):
+            self._set_limit(self._limit + 1, "throughput improving")
+        elif self.throughput < self._previous * (1 - self.tolerance):
+            self._set_limit(self._limit - 1, "throughput degrading")
+        self._previous = self.throughput
+
+    def backoff(self, reason: str = "server congestion") -> None:
+        """Multiplicatively decrease the limit in response to a congestion signal"""
+        if not self.adaptive:
+            return None
+        now = time.monotonic()
+        if now - self._last_backoff < self.interval:
+            return None
+        self._last_backoff = now
+        self._previous = None
+        self._set_limit(int(self._limit * self.decrease_factor), reason)
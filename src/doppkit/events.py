@@ -0,0 +1,116 @@
+__all__ = ["EventStream"]
+
+import json
+import logging
+import time
+
+from typing import Any, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+# seconds between aggregate progress events
+EVENT_INTERVAL = 1.0
+
+
+class EventStream:
+    """
+    Progress reporting downloads as newline delimited JSON events, for
+    orchestrators rather than people.
+
+    Every event is an object with an ``event`` type and a unix ``time``:
+
+    ``created``
+        a file started downloading, with its ``name``, ``source`` url and
+        ``total`` size
+    ``progress``
+        at most every ``interval`` seconds, the ``bytes`` received since the
+        previous progress event, the total bytes ``received`` (not counting
+        the bytes resumed downloads already had), the transfer
+        ``rate`` in bytes per second, and the number of ``active``,
+        ``completed`` and ``failed`` files
+    ``completed``
+        a file is in place, with its ``name``, ``source`` and ``bytes``
+    ``failed``
+        a file could not be downloaded, with its ``name``, ``source`` and the
+        ``reason``
+    ``finished``
+        written by :meth:`close`, with the final totals
+
+    Parameters
+    ----------
+    stream
+        Text stream to write the events to, each one is flushed as it is written
+    interval
+        Seconds between progress events, by default 1.0
+    """
+
+    def __init__(self, stream: TextIO, interval: float = EVENT_INTERVAL) -> None:
+        self.stream = stream
+        self.interval = interval
+        self.received = 0
+        self.completed = 0
+        self.failed = 0
+        # bytes of each file so far, None until its first update says where
+        # it starts
+        self._files: dict[str, Optional[int]] = {}
+        self._pending = 0
+        self._last = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"EventStream {len(self._files)} active, {self.completed} completed, {self.failed} failed"
+
+    def emit(self, event: str, **fields: Any) -> None:
+        self.stream.write(json.dumps({"event": event, "time": time.time(), **fields}) + "\n")
+        self.stream.flush()
+
+    def create_task(self, name: str, source: str, total: int) -> None:
+        # a retried download starts over, possibly resuming part of the way
+        self._files[source] = None
+        self.emit("created", name=name, source=source, total=total)
+
+    def update(self, name: str, source: str, completed: int) -> None:
+        previous = self._files.get(source)
+        self._files[source] = completed
+        if previous is None:
+            return None
+        self._pending += completed - previous
+        if time.monotonic() - self._last >= self.interval:
+            self.flush()
+
+    def complete_task(self, name: str, source: str) -> None:
+        nbytes = self._files.pop(source, None) or 0
+        self.completed += 1
+        self.emit("completed", name=name, source=source, bytes=nbytes)
+
+    def fail_task(self, name: str, source: str, reason: str) -> None:
+        self._files.pop(source, None)
+        self.failed += 1
+        self.emit("failed", name=name, source=source, reason=reason)
+
+    def flush(self) -> None:
+        """Emit a progress event for the bytes received since the last one"""
+        now = time.monotonic()
+        elapsed = now - self._last
+        self.received += self._pending
+        self.emit(
+            "progress",
+            bytes=self._pending,
+            received=self.received,
+            rate=self._pending / elapsed if elapsed > 0 else 0.0,
+            active=len(self._files),
+            completed=self.completed,
+            failed=self.failed,
+        )
+        self._pending = 0
+        self._last = now
+
+    def close(self) -> None:
+        """Emit the last progress event followed by a finished event"""
+        if self._pending:
+            self.flush()
+        self.emit(
+            "finished",
+            received=self.received,
+            completed=self.completed,
+            failed=self.failed,
+        )
@@ -1,5 +1,7 @@
-__all__ = ["Grid", "Exportfile", "Export", "AOI"]
+__all__ = ["Grid", "Exportfile", "Export", "AOI", "started_at"]
 
+import asyncio
+import datetime
 import itertools
 import json
 import warnings
@@ -8,7 +10,7 @@ import pathlib
 import math
 
 import httpx
-from typing import Optional, Iterable, TypedDict, Union, TYPE_CHECKING
+from typing import AsyncIterator, Optional, Iterable, TypedDict, Union, TYPE_CHECKING
 
 from .cache import cache, DownloadUrl, Progress
 from .upload import upload
@@ -111,6 +113,19 @@ class Export(TypedDict):
 Export.__optional_keys__ = frozenset({'export_total_size', 'auxfile_total_size', 'complete_size'})
 
 
+def started_at(export: Export) -> Optional[datetime.datetime]:
+    """Time an export was started, None if GRiD did not report a usable one"""
+    try:
+        started = datetime.datetime.fromisoformat(
+            export["started_at"].replace("Z", "+00:00")
+        )
+    except (KeyError, AttributeError, ValueError):
+        return None
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=datetime.timezone.utc)
+    return started
+
+
 class AOI(TypedDict):
     id: int
     area: Optional[float]
@@ -173,6 +188,26 @@ class Grid:
         return response["aois"]
 
 
+    async def get_many_aois(self, ids: Iterable[int]) -> list[AOI]:
+        """
+        Get several AOIs at once, in the order given.
+
+        Parameters
+        ----------
+        ids
+            AOI PKs to get, duplicates are only requested once
+
+        Returns
+        -------
+        list of AOI
+        """
+        ids = list(dict.fromkeys(ids))
+        responses = await asyncio.gather(*(self.get_aois(id_) for id_ in ids))
+        aois: dict[int, AOI] = {}
+        for aoi in itertools.chain.from_iterable(responses):
+            aois.setdefault(aoi["id"], aoi)
+        return list(aois.values())
+
     async def upload_asset(
             self,
             filepath: pathlib.Path,
@@ -192,61 +227,61 @@ class Grid:
         upload_endpoint_url = f"{self.args.url}{upload_endpoint_ext}"
 
         headers = {"Authorization": f"Bearer {self.args.token}"}
-        async with httpx.AsyncClient(verify=not self.args.disable_ssl_verification) as client:
-            params = {"key": key}
-            response_upload_id = await client.get(
-                f"{upload_endpoint_url}/open/",
-                params=params,
-                headers=headers
-            )
-            logger.debug(f"Upload open call returned {response_upload_id}")
-
-            try:
-                upload_id = response_upload_id.json()["upload_id"]
-            except KeyError as e:
-                if "error" in response_upload_id.json():
-                    raise ConnectionError(response_upload_id.json()["error"]) from e
-                else:
-                    raise ConnectionError(response_upload_id.json()) from e
-
-            params.update(upload_id=upload_id, nparts=str(chunks_count))
-            response_urls = await client.get(
-                f"{upload_endpoint_url}/get_urls/",
-                params=params,
-                headers=headers
-            )
+        client = self.args.session.client()
+        params = {"key": key}
+        response_upload_id = await client.get(
+            f"{upload_endpoint_url}/open/",
+            params=params,
+            headers=headers
+        )
+        logger.debug(f"Upload open call returned {response_upload_id}")
 
-            # want to make sure URLs are in order of part
-            urls = [
-                part['url'] 
-                for part in sorted(
-                    response_urls.json()["parts"],
-                    key=lambda part: part['part']
-                )
-            ]
-
-            part_info = await upload(
-                app=self.args,
-                filepath=filepath,
-                urls=urls,
-                bytes_per_chunk=bytes_per_chunk,
-                auth_header=headers,
-                progress=progress
-            )
+        try:
+            upload_id = response_upload_id.json()["upload_id"]
+        except KeyError as e:
+            if "error" in response_upload_id.json():
+                raise ConnectionError(response_upload_id.json()["error"]) from e
+            else:
+                raise ConnectionError(response_upload_id.json()) from e
 
-            data = {
-                "upload_id": upload_id,
-                "key": key,
-                "upload_info": part_info
-            }
+        params.update(upload_id=upload_id, nparts=str(chunks_count))
+        response_urls = await client.get(
+            f"{upload_endpoint_url}/get_urls/",
+            params=params,
+            headers=headers
+        )
 
-            response_finish = await client.put(
-                f"{upload_endpoint_url}/close/",
-                json=data,
-                headers=headers
+        # want to make sure URLs are in order of part
+        urls = [
+            part['url'] 
+            for part in sorted(
+                response_urls.json()["parts"],
+                key=lambda part: part['part']
             )
-            logger.debug(f"Upload close call returned {response_finish}")
-            logger.info(f"Finished upload of {filepath}")
+        ]
+
+        part_info = await upload(
+            app=self.args,
+            filepath=filepath,
+            urls=urls,
+            bytes_per_chunk=bytes_per_chunk,
+            auth_header=headers,
+            progress=progress
+        )
+
+        data = {
+            "upload_id": upload_id,
+            "key": key,
+            "upload_info": part_info
+        }
+
+        response_finish = await client.put(
+            f"{upload_endpoint_url}/close/",
+            json=data,
+            headers=headers
+        )
+        logger.debug(f"Upload close call returned {response_finish}")
+        logger.info(f"Finished upload of {filepath}")
 
         return None
 
@@ -301,8 +336,8 @@ class Grid:
         }
         headers = {"Authorization": f"Bearer {self.args.token}"}
 
-        async with httpx.AsyncClient(verify=not self.args.disable_ssl_verification) as client:
-            r = await client.post(export_endpoint, headers=headers, data=params)
+        client = self.args.session.client()
+        r = await client.post(export_endpoint, headers=headers, data=params)
 
         if r.status_code != httpx.codes.OK:
             raise RuntimeError(f"GRiD Returned an Error: {r.json()['error']}")
@@ -315,8 +350,11 @@ class Grid:
             task_endpoint += f"/{task_id}"
         params = {"sort": "task_id"}
 
-        async with httpx.AsyncClient(verify=not self.args.disable_ssl_verification) as client:
-            r = await client.get(task_endpoint, headers=headers, params=params)
+        client = self.args.session.client()
+        r = await self.args.retry.call(
+            lambda: client.get(task_endpoint, headers=headers, params=params),
+            description=f"Task request to {task_endpoint}"
+        )
 
         if r.status_code == httpx.codes.OK:
             output = r.json()["tasks"]
@@ -325,6 +363,48 @@ class Grid:
             raise RuntimeError(f"GRiD Task Endpoint Returned Error {r.status_code}")
         return output
 
+    async def iter_exports(
+            self,
+            exports: Iterable[Export],
+            concurrency: Optional[int] = None
+    ) -> AsyncIterator[tuple[Export, list[DownloadUrl]]]:
+        """
+        Fetch the files of several exports concurrently, yielding each export
+        along with its files as soon as they are known.
+
+        Parameters
+        ----------
+        exports
+            Exports, as listed in an AOI, to get the files of
+        concurrency
+            Maximum number of exports to request at once, by default the
+            application's thread count
+
+        Yields
+        ------
+        tuple of Export and list of DownloadUrl
+            The files know the time their export was started, if GRiD reported
+            it
+        """
+        limit = asyncio.Semaphore(concurrency or self.args.threads)
+
+        async def fetch(export: Export) -> tuple[Export, list[DownloadUrl]]:
+            async with limit:
+                logger.debug(f"export: {export}")
+                since = started_at(export)
+                return export, [
+                    url._replace(since=since)
+                    for url in await self.get_exports(export["id"])
+                ]
+
+        tasks = [asyncio.create_task(fetch(export)) for export in exports]
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                yield await next_completed
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def get_exports(self, export_id: int) -> list[DownloadUrl]:
         """
         Parameters
@@ -407,7 +487,8 @@ class Grid:
                             url=exportfile["url"],
                             save_path=f"{item['name']}/{exportfile['storage_path'].strip('/')}/{exportfile['name']}",
                             total=exportfile["filesize"],
-                            name=exportfile["name"]
+                            name=exportfile["name"],
+                            file_id=exportfile["id"]
                         )
                     )
                 for supplemental_file in itertools.chain(item["auxfiles"], item.get('licensefiles', [])):
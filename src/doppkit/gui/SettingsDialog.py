@@ -7,6 +7,8 @@ from qtpy.QtGui import QAbstractFileIconProvider, QValidator
 from qtpy.QtWidgets import QDialog, QFileDialog, QGroupBox, QLineEdit, QHBoxLayout, QVBoxLayout, QLabel, QWidget, QRadioButton, QListWidget, QFileIconProvider, QTabWidget, QDialogButtonBox, QPushButton, QListWidgetItem
 from qtpy.QtCore import QObject, Slot, Qt, QSettings, QStandardPaths, QUrl
 
+from ..throttle import parse_rate, parse_schedule
+
 if TYPE_CHECKING:
     from .window import Window
 
@@ -14,6 +16,7 @@ logger = logging.getLogger(__name__)
 
 class TabEnum(IntEnum):
     sslSettings = 0
+    bandwidthSettings = 1
     # add other settings tabs here...
 
 
@@ -36,6 +39,30 @@ class SSLFileValidator(QValidator):
             state = QValidator.State.Intermediate
         return state, input_, pos
 
+class RateValidator(QValidator):
+
+    def validate(self, input_: str, pos: int) -> tuple[QValidator.State, str, int]:
+        try:
+            parse_rate(input_)
+        except ValueError:
+            state = QValidator.State.Intermediate
+        else:
+            state = QValidator.State.Acceptable
+        return state, input_, pos
+
+
+class ScheduleValidator(QValidator):
+
+    def validate(self, input_: str, pos: int) -> tuple[QValidator.State, str, int]:
+        try:
+            parse_schedule(input_)
+        except ValueError:
+            state = QValidator.State.Intermediate
+        else:
+            state = QValidator.State.Acceptable
+        return state, input_, pos
+
+
 class URLValidator(QValidator):
 
     def validate(self, input_: str, pos: int) -> tuple[QValidator.State, str, int]:
@@ -304,12 +331,68 @@ class SSLSettings(SettingsTabContents):
         settings.setValue("grid/ssl_verification", checked)
 
 
+class BandwidthSettings(SettingsTabContents):
+
+    def __init__(self, parent: 'SettingsDialog') -> None:
+        super().__init__(parent)
+        settings = QSettings()
+
+        name = "Bandwidth"
+        self.setAccessibleName(name)
+        self.parent().insertTab(TabEnum.bandwidthSettings, self, name)
+
+        fields = [
+            (
+                "Overall Limit (bytes/s, e.g. 10M)",
+                "network/rate_limit",
+                RateValidator(parent=None),
+                "Leave blank or 0 for no limit"
+            ),
+            (
+                "Per Host Limit (bytes/s, e.g. 5M)",
+                "network/host_rate_limit",
+                RateValidator(parent=None),
+                "Leave blank or 0 for no limit"
+            ),
+            (
+                "Schedule",
+                "network/rate_schedule",
+                ScheduleValidator(parent=None),
+                "Comma separated time windows overriding the overall limit\n" +
+                "For example: 08:00-18:00=5M,18:00-08:00=0"
+            ),
+        ]
+        for text, key, validator, toolTip in fields:
+            label = QLabel(text)
+            labelFont = label.font()
+            labelFont.setPointSize(10)
+            label.setFont(labelFont)
+            lineEdit = QLineEdit()
+            lineEdit.setValidator(validator)
+            lineEdit.setToolTip(toolTip)
+            lineEdit.setText(str(settings.value(key, "")))
+            lineEdit.setProperty("settingsKey", key)
+            lineEdit.editingFinished.connect(self.bandwidthChanged)
+            label.setBuddy(lineEdit)
+            self.settingsContentLayout.addWidget(label)
+            self.settingsContentLayout.addWidget(lineEdit)
+
+    @Slot()
+    def bandwidthChanged(self):
+        sender = self.sender()
+        key = sender.property("settingsKey")
+        settings = QSettings()
+        settings.setValue(key, sender.text().strip())
+        logger.debug(f"Setting {key} to {sender.text().strip()}")
+
+
 class SettingsDialog(QDialog):
 
     def __init__(self, parent: Optional[QObject] = None) -> None:
         super().__init__(parent)
         self.tabWidget = QTabWidget(self)
         self.sslTab = SSLSettings(self.tabWidget)
+        self.bandwidthTab = BandwidthSettings(self.tabWidget)
         layout = QVBoxLayout()
         layout.addWidget(self.tabWidget)
         self.setLayout(layout)
@@ -2,6 +2,7 @@ import asyncio
 import contextlib
 from importlib import resources
 import logging
+import multiprocessing
 import os
 import signal
 import sys
@@ -72,7 +73,8 @@ def main():
         threads=5,
         run_method="GUI",
         progress=True,
-        override=False
+        override=False,
+        incremental=True
     )
     # https://github.com/CabbageDevelopment/qasync/issues/68
     # the easy way breaks with Python 3.11, so we do the plumbing ourselves to work around it
@@ -88,4 +90,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # download worker processes of frozen builds start through here
+    multiprocessing.freeze_support()
     main()
@@ -1,4 +1,4 @@
-from typing import Iterable, Union, TYPE_CHECKING
+from typing import AsyncIterable, Iterable, Union, TYPE_CHECKING
 import logging
 
 from ..app import Application
@@ -14,7 +14,7 @@ logger = logging.getLogger(__name__)
 
 async def cache(
         app: Application,
-        urls: Iterable[DownloadUrl],
+        urls: AsyncIterable[DownloadUrl],
         headers: dict[str, str],
         progress: 'QtProgress'
 ) -> Iterable[Union[Content, Exception]]:
@@ -25,7 +25,8 @@ async def cache(
     ----------
     app
     urls
-        List of DownloadUrl Named Tuples to download the contents of
+        DownloadUrl Named Tuples to download the contents of, downloads
+        start as they are yielded
     headers
         Header information to relay to the GRiD Server
     progress
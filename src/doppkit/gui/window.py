@@ -1,6 +1,8 @@
 import os
 from .. import __version__
-from ..grid import Grid, AOI
+from ..grid import Grid, AOI, started_at
+from ..cache import needs_download
+from ..throttle import parse_rate, parse_schedule
 from .cache import cache
 from qtpy import QtCore, QtGui, QtWidgets
 import contextlib
@@ -114,6 +116,11 @@ class QtExportProgress(QtCore.QObject):
 
         self.export_files: dict[int, dict[str, ExportFileProgress]] = defaultdict(dict)
 
+        # kept up to date as files progress rather than summed over every file
+        # of an export on every update
+        self.export_downloaded: dict[int, int] = defaultdict(int)
+        self.export_incomplete: dict[int, int] = defaultdict(int)
+
     def create_task(self, name: str, source: str, total: int):
         """
         Method adds a task to track the download progress
@@ -134,6 +141,14 @@ class QtExportProgress(QtCore.QObject):
 
         export_ids = self.urls_to_export_id[source]
         for export_id in export_ids:
+            old_progress = self.export_files[export_id].get(source)
+            if old_progress is None:
+                self.export_incomplete[export_id] += 1
+            else:
+                # download is being retried
+                self.export_downloaded[export_id] -= old_progress.current
+                if old_progress.is_complete:
+                    self.export_incomplete[export_id] += 1
             self.export_files[export_id][source] = ExportFileProgress(
                 source,
                 export_id=export_id,
@@ -144,16 +159,19 @@ class QtExportProgress(QtCore.QObject):
         export_ids = self.urls_to_export_id[source]
         for export_id in export_ids:
             old_progress = self.export_files[export_id][source]
-            self.export_files[export_id][source] = ExportFileProgress(
+            new_progress = ExportFileProgress(
                 source,
                 export_id=export_id,
                 current=completed,
                 total=old_progress.total,
                 is_complete=completed >= old_progress.total
             )
+            self.export_files[export_id][source] = new_progress
+            self.export_downloaded[export_id] += completed - old_progress.current
+            if new_progress.is_complete != old_progress.is_complete:
+                self.export_incomplete[export_id] += -1 if new_progress.is_complete else 1
             export_progress = self.export_progress[export_id]
-            export_downloaded = sum(file_progress.current for file_progress in self.export_files[export_id].values())
-            export_progress.update(export_downloaded)
+            export_progress.update(self.export_downloaded[export_id])
             self.taskUpdated.emit(export_progress)
 
     def complete_task(self, name: str, source: str) -> None:
@@ -163,7 +181,7 @@ class QtExportProgress(QtCore.QObject):
             old_progress = self.export_files[export_id][source]
             self.update(name, source, old_progress.total)
             export_progress = self.export_progress[export_id]
-            if all(export_file.is_complete for export_file in self.export_files[export_id].values()):
+            if not self.export_incomplete[export_id]:
                 export_progress.is_complete = True
                 self.taskCompleted.emit(export_progress)
 
@@ -268,10 +286,12 @@ class Window(QtWidgets.QMainWindow):
         aoiLabel = QtWidgets.QLabel("&AOI")
         aoiLabel.setFont(labelFont)
         self.aoiLineEdit = QtWidgets.QLineEdit()
-
-        # TODO: don't use IntValidator, should accept coma separated values
-        aoiValidator = QtGui.QIntValidator(parent=None)
-        aoiValidator.setBottom(0)
+        self.aoiLineEdit.setToolTip(
+            "Comma separated list of AOIs to download the exports of."
+        )
+        aoiValidator = QtGui.QRegularExpressionValidator(
+            QtCore.QRegularExpression(r"\d+(?:\s*,\s*\d+)*")
+        )
         self.aoiLineEdit.setValidator(aoiValidator)
         self.aoiLineEdit.editingFinished.connect(self.aoisChanged)
         aoiLabel.setBuddy(self.aoiLineEdit)
@@ -413,6 +433,19 @@ class Window(QtWidgets.QMainWindow):
         if isinstance(lineEdit, QtWidgets.QLineEdit):
             lineEdit.setText(directory)
 
+    def applyBandwidthSettings(self) -> None:
+        settings = QtCore.QSettings()
+        try:
+            self.doppkit.throttle.configure(
+                parse_rate(settings.value("network/rate_limit", "")),
+                parse_rate(settings.value("network/host_rate_limit", "")),
+                parse_schedule(settings.value("network/rate_schedule", ""))
+            )
+        except ValueError as e:
+            logger.warning(f"Ignoring invalid bandwidth settings: {e}")
+            self.doppkit.throttle.configure()
+        logger.debug(f"Bandwidth limits: {self.doppkit.throttle}")
+
     def showLogView(self):
         self.logView.show()
 
@@ -480,6 +513,7 @@ class Window(QtWidgets.QMainWindow):
             for filepath in files
         ]
 
+        self.applyBandwidthSettings()
         api = Grid(self.doppkit)
         model = UploadModel()
         model.load(items, self.uploadProgressInterconnect)
@@ -515,7 +549,6 @@ class Window(QtWidgets.QMainWindow):
     @qasync.asyncSlot()
     async def listExports(self):
         self.buttonList.setEnabled(False)
-        # TODO: this should accept a list of AOIs
 
         # need to determine if we should skip SSL verification...
         # first, is SSL verification enabled?
@@ -536,6 +569,7 @@ class Window(QtWidgets.QMainWindow):
         enabled = "enabled" if enable_ssl else "disabled"
         logger.debug(f"POSTing to GRiD with SSL {enabled}")
         self.doppkit.disable_ssl_verification = not enable_ssl
+        self.applyBandwidthSettings()
 
         api = Grid(self.doppkit)
         if not self.AOI_ids:
@@ -543,7 +577,7 @@ class Window(QtWidgets.QMainWindow):
             self.buttonList.setEnabled(True)
             return None
         try:
-            self.AOIs = await api.get_aois(self.AOI_ids[0])
+            self.AOIs = await api.get_many_aois(self.AOI_ids)
         finally:
             # no need to elave the button list grayed out if there is an exception...
             self.buttonList.setEnabled(True)
@@ -592,11 +626,15 @@ class Window(QtWidgets.QMainWindow):
         download_dir = pathlib.Path(self.doppkit.directory)
         download_dir.mkdir(exist_ok=True)
 
-        urls = []
         export_ids_to_filter = self.export_ids.copy()
+        exports = []
+        export_aois = {}
         for aoi in self.AOIs:
             for export in aoi["exports"]:
                 export_id = export["id"]
+                if export_id in export_aois:
+                    # shared with an AOI we have already seen
+                    continue
                 if self.export_ids:
                     # we're filtering!
                     if export_id not in export_ids_to_filter:
@@ -605,19 +643,30 @@ class Window(QtWidgets.QMainWindow):
                     # move the export_id from ones to filter to the ones that have
                     # been filtered
                     export_ids_to_filter.remove(export_id)
+                exports.append(export)
+                export_aois[export_id] = aoi
 
-                files = await api.get_exports(export["id"])
+        if export_ids_to_filter:
+            # there are some exports we intended to filter for, but weren't present in the AOIs
+            logger.warning(
+                f"The following export_ids were entered to filter for, but were not seen in the given AOIs: {export_ids_to_filter}"
+            )
+
+        async def urls():
+            # downloads start as soon as the first export resolves
+            async for export, files in api.iter_exports(exports):
+                aoi = export_aois[export["id"]]
+                since = started_at(export)
 
+                to_download = []
                 download_size = 0
                 for download_file in files:
                     filename = download_file.name
-                    download_destination = download_dir.joinpath(download_file.save_path)
 
-                    # TODO: compare filesizes, not just if it exists
-                    if not self.doppkit.override and download_destination.exists():
+                    if not needs_download(self.doppkit, download_file, since):
                         logger.debug(f"File already exists, skipping {filename}")
                     else:
-                        urls.append(
+                        to_download.append(
                             download_file
                         )
                         download_size += download_file.total
@@ -632,14 +681,12 @@ class Window(QtWidgets.QMainWindow):
                 )
                 self.progressInterconnect.export_progress[export["id"]] = progress_tracker
                 self.progressInterconnect.aois[aoi["id"]].append(progress_tracker)
+                for download_file in to_download:
+                    yield download_file
 
-        if export_ids_to_filter:
-            # there are some exports we intended to filter for, but weren't present in the AOIs
-            logger.warning(
-                f"The following export_ids were entered to filter for, but were not seen in the given AOIs: {export_ids_to_filter}"
-            )
         with contextlib.suppress(Exception):
-            _ = await cache(self.doppkit, urls, {}, progress=self.progressInterconnect)
+            _ = await cache(self.doppkit, urls(), {}, progress=self.progressInterconnect)
+            await self.doppkit.writer.sync()
         logger.info("Download AOI Exports Complete")
 
         self.buttonDownload.setEnabled(True)
@@ -0,0 +1,158 @@
+__all__ = [
+    "IntegrityError",
+    "StreamHasher",
+    "etag_md5",
+    "file_md5",
+    "manifest_path",
+    "record",
+    "recorded",
+]
+
+import functools
+import hashlib
+import json
+import logging
+import pathlib
+import re
+import time
+
+import aiofiles
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+
+# an ETag is only an MD5 of the content if it is a strong tag of 32 hex digits,
+# multipart uploads produce tags like "<md5 of md5s>-<parts>"
+_md5_etag_re = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+
+class IntegrityError(Exception):
+    """Downloaded contents do not match what the server said they should be"""
+
+
+def etag_md5(etag: Optional[str]) -> Optional[str]:
+    """MD5 digest contained in an ETag, if the ETag is one"""
+    if etag is None:
+        return None
+    match = _md5_etag_re.match(etag.strip())
+    return match[1].lower() if match is not None else None
+
+
+class StreamHasher:
+    """
+    Hashes downloaded contents chunk by chunk as they are written.
+
+    Parameters
+    ----------
+    sha256
+        Compute a SHA-256 digest in addition to the MD5 digest
+    """
+
+    def __init__(self, sha256: bool = False) -> None:
+        self.md5 = hashlib.md5(usedforsecurity=False)
+        self.sha256 = hashlib.sha256() if sha256 else None
+        self.size = 0
+
+    def update(self, chunk: bytes) -> None:
+        self.md5.update(chunk)
+        if self.sha256 is not None:
+            self.sha256.update(chunk)
+        self.size += len(chunk)
+
+    async def update_from_file(
+            self,
+            path: pathlib.Path,
+            length: int,
+            chunk_size: int = 1 << 20
+    ) -> None:
+        """Hash the first length bytes of path, the part of a resumed download we have"""
+        async with aiofiles.open(path, "rb") as f:
+            remaining = length
+            while remaining > 0:
+                chunk = await f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                self.update(chunk)
+                remaining -= len(chunk)
+
+    def digests(self) -> dict[str, str]:
+        digests = {"md5": self.md5.hexdigest()}
+        if self.sha256 is not None:
+            digests["sha256"] = self.sha256.hexdigest()
+        return digests
+
+    def verify(self, headers, description: str) -> bool:
+        """
+        Compare the MD5 digest against the ETag in the response headers.
+
+        Returns
+        -------
+        bool
+            True if the digest was verified, False if the headers do not allow
+            for verification
+
+        Raises
+        ------
+        IntegrityError
+            If the digest does not match the ETag
+        """
+        expected = etag_md5(headers.get("ETag"))
+        if expected is None or headers.get("Content-Encoding", "identity") != "identity":
+            return False
+        actual = self.md5.hexdigest()
+        if actual != expected:
+            raise IntegrityError(
+                f"{description} has MD5 {actual} but the server reported {expected}"
+            )
+        return True
+
+
+def file_md5(path: pathlib.Path, chunk_size: int = 1 << 20) -> str:
+    """MD5 digest of the contents of path"""
+    md5 = hashlib.md5(usedforsecurity=False)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def manifest_path(directory: pathlib.Path, save_path: str) -> pathlib.Path:
+    """Manifest of the export a file saved at save_path belongs to"""
+    parts = pathlib.PurePosixPath(save_path.lstrip("/")).parts
+    export_directory = directory.joinpath(parts[0]) if len(parts) > 1 else directory
+    return export_directory / MANIFEST_NAME
+
+
+def record(manifest: pathlib.Path, **entry: Any) -> None:
+    """Append an entry to a manifest, later entries for a path supersede earlier ones"""
+    entry.setdefault("time", time.time())
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+@functools.lru_cache(maxsize=16)
+def _read(manifest: pathlib.Path, mtime_ns: int, size: int) -> dict[str, dict[str, Any]]:
+    # keyed by the manifest's modification time and size as well, so appended
+    # entries are picked up
+    entries: dict[str, dict[str, Any]] = {}
+    with open(manifest, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted write
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def recorded(manifest: pathlib.Path) -> dict[str, dict[str, Any]]:
+    """Latest entry of each path in a manifest, none if there is no manifest"""
+    try:
+        stat = manifest.stat()
+    except OSError:
+        return {}
+    return _read(manifest, stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,305 @@
+__all__ = ["Metrics", "Histogram"]
+
+import bisect
+import collections
+import contextlib
+import heapq
+import http.server
+import logging
+import math
+import os
+import pathlib
+import threading
+import time
+
+import httpx
+
+from typing import Iterator, Optional, TYPE_CHECKING, Union
+
+from . import __version__
+from .retry import failure_reason
+
+if TYPE_CHECKING:
+    from .app import Application
+
+logger = logging.getLogger(__name__)
+
+# seconds between rewrites of the textfile collector file
+TEXTFILE_INTERVAL = 15.0
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, math.inf)
+
+# number of slowest files remembered
+SLOWEST = 10
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Observed values, counted into buckets and kept for exact percentiles"""
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.values: list[float] = []
+        self.sum = 0.0
+
+    def __repr__(self) -> str:
+        return f"Histogram of {len(self.values)} values"
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def observe(self, value: float) -> None:
+        self.values.append(value)
+        self.sum += value
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Value below which fraction of the observed values fall, None if empty"""
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Metrics:
+    """
+    Counters and gauges describing a running doppkit application, in the
+    Prometheus text exposition format.
+
+    Counters are updated by the download and upload code as it runs, gauges
+    such as the number of downloads in flight are read from the application
+    whenever the metrics are rendered.  They can be scraped over HTTP, see
+    :meth:`serve`, or written for the node exporter's textfile collector, see
+    :meth:`write_periodically`.
+
+    Parameters
+    ----------
+    app
+        doppkit application to report on
+    """
+
+    def __init__(self, app: 'Application') -> None:
+        self._app = app
+        self.downloaded: collections.Counter[str] = collections.Counter()
+        self.uploaded: collections.Counter[str] = collections.Counter()
+        self.completed = 0
+        self.failed: collections.Counter[str] = collections.Counter()
+        self.api_requests = 0
+        self.started = time.time()
+        self.last_transfer: Optional[float] = None
+        self.ttfb = Histogram()
+        self.durations = Histogram()
+        # (seconds, name, bytes) of the slowest files, the fastest of them first
+        self.slowest: list[tuple[float, str, int]] = []
+
+        self._clock = time.perf_counter()
+        self._active: collections.Counter[str] = collections.Counter()
+        self._since: dict[str, float] = {}
+        self._busy: collections.Counter[str] = collections.Counter()
+
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        self._textfile: Optional[pathlib.Path] = None
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def __repr__(self) -> str:
+        return (
+            f"Metrics {self.completed} files completed, {sum(self.failed.values())} failed, "
+            f"{sum(self.downloaded.values())} bytes downloaded"
+        )
+
+    def record_download(self, host: str, nbytes: int) -> None:
+        self.downloaded[host] += nbytes
+        self.last_transfer = time.time()
+
+    def record_upload(self, host: str, nbytes: int) -> None:
+        self.uploaded[host] += nbytes
+        self.last_transfer = time.time()
+
+    def record_result(self, result: object, download: bool = True) -> None:
+        """Count the final result of a request, after any retries"""
+        if not download:
+            self.api_requests += 1
+        elif isinstance(result, BaseException) or isinstance(result, httpx.Response):
+            self.failed[failure_reason(result)] += 1
+        else:
+            self.completed += 1
+
+    def record_file(self, name: str, nbytes: int, ttfb: float, seconds: float) -> None:
+        """Record the timing of a file that was downloaded"""
+        self.ttfb.observe(ttfb)
+        self.durations.observe(seconds)
+        entry = (seconds, name, nbytes)
+        if len(self.slowest) < SLOWEST:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    @contextlib.contextmanager
+    def busy(self, kind: str) -> Iterator[None]:
+        """
+        Account for time during which at least one request of a kind, such as
+        "metadata" or "transfer", is in progress
+        """
+        if not self._active[kind]:
+            self._since[kind] = time.perf_counter()
+        self._active[kind] += 1
+        try:
+            yield
+        finally:
+            self._active[kind] -= 1
+            if not self._active[kind]:
+                self._busy[kind] += time.perf_counter() - self._since[kind]
+
+    def busy_seconds(self, kind: str) -> float:
+        """Seconds during which at least one request of kind was in progress"""
+        seconds = self._busy[kind]
+        if self._active[kind]:
+            seconds += time.perf_counter() - self._since[kind]
+        return seconds
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the application started"""
+        return time.perf_counter() - self._clock
+
+    def render(self) -> str:
+        """Current metrics in the Prometheus text exposition format"""
+        limit = self._app.limit
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help_: str, samples: dict[str, float]) -> None:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples.items():
+                lines.append(f"{name}{labels} {value}")
+
+        def by(label: str, counts: collections.Counter) -> dict[str, float]:
+            return {f'{{{label}="{_escape(key)}"}}': value for key, value in list(counts.items())}
+
+        def histogram(name: str, help_: str, observed: Histogram) -> None:
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(observed.bounds, list(observed.counts)):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else f"{bound}"
+                lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum {observed.sum}")
+            lines.append(f"{name}_count {cumulative}")
+
+        metric("doppkit_info", "gauge", "doppkit version", {f'{{version="{_escape(__version__)}"}}': 1})
+        metric("doppkit_downloaded_bytes_total", "counter", "Bytes downloaded, by host",
+               by("host", self.downloaded))
+        metric("doppkit_uploaded_bytes_total", "counter", "Bytes uploaded, by host",
+               by("host", self.uploaded))
+        metric("doppkit_files_completed_total", "counter", "Files downloaded or restored from the store",
+               {"": self.completed})
+        metric("doppkit_files_failed_total", "counter",
+               "Files that failed to download after retries, by status code or error",
+               by("reason", self.failed))
+        metric("doppkit_api_requests_total", "counter", "GRiD API requests completed",
+               {"": self.api_requests})
+        metric("doppkit_retries_total", "counter",
+               "Requests retried after transient errors, by status code or error",
+               by("reason", self._app.retry.reasons))
+        metric("doppkit_downloads_in_flight", "gauge", "Downloads holding a download slot",
+               {"": limit.in_flight})
+        metric("doppkit_downloads_waiting", "gauge", "Downloads waiting for a download slot",
+               {"": limit.waiting})
+        metric("doppkit_concurrency_limit", "gauge", "Current number of download slots",
+               {"": limit.limit})
+        metric("doppkit_throughput_bytes_per_second", "gauge",
+               "Aggregate download throughput over the last measurement interval",
+               {"": float(limit.throughput)})
+        histogram("doppkit_time_to_first_byte_seconds",
+                  "Seconds from requesting a file to receiving its response headers", self.ttfb)
+        histogram("doppkit_file_duration_seconds",
+                  "Seconds from requesting a file to having written all of it", self.durations)
+        metric("doppkit_metadata_seconds_total", "counter",
+               "Seconds during which GRiD API requests were in progress",
+               {"": self.busy_seconds("metadata")})
+        metric("doppkit_transfer_seconds_total", "counter",
+               "Seconds during which downloads were in progress",
+               {"": self.busy_seconds("transfer")})
+        metric("doppkit_start_time_seconds", "gauge", "Unix time the application started",
+               {"": self.started})
+        if self.last_transfer is not None:
+            metric("doppkit_last_transfer_time_seconds", "gauge",
+                   "Unix time bytes were last downloaded or uploaded",
+                   {"": self.last_transfer})
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serve the metrics at http://host:port/metrics from a background thread"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return None
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format % args)
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(
+            target=self._server.serve_forever, name="doppkit-metrics", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Serving metrics at http://{host}:{self._server.server_port}/metrics")
+
+    def write(self, path: Union[str, pathlib.Path]) -> None:
+        """Write the metrics to path, replacing it atomically"""
+        path = pathlib.Path(path)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        partial.write_text(self.render(), encoding="utf-8")
+        partial.replace(path)
+
+    def write_periodically(self, path: Union[str, pathlib.Path], interval: float = TEXTFILE_INTERVAL) -> None:
+        """
+        Rewrite path every interval seconds from a background thread, and a last
+        time on :meth:`close`, for the node exporter's textfile collector
+        """
+        self._textfile = pathlib.Path(path)
+        self._textfile.parent.mkdir(parents=True, exist_ok=True)
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.write(self._textfile)
+                except OSError as e:
+                    logger.warning(f"Unable to write metrics to {self._textfile}: {e}")
+
+        thread = threading.Thread(target=loop, name="doppkit-metrics-textfile", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def close(self) -> None:
+        """Stop serving metrics and write the textfile a last time"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads.clear()
+        if self._textfile is not None:
+            self.write(self._textfile)
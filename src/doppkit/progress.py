@@ -0,0 +1,117 @@
+__all__ = ["CoalescedProgress"]
+
+import asyncio
+import logging
+
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .cache import Progress
+
+logger = logging.getLogger(__name__)
+
+# seconds between progress updates passed on, 10 per second
+PROGRESS_INTERVAL = 0.1
+
+
+class CoalescedProgress:
+    """
+    Progress that passes on at most one update per file every ``interval``
+    seconds to another progress.
+
+    Downloads report progress on every chunk received, which for many
+    concurrent files costs more than the transfer itself once the progress
+    redraws a bar or emits a Qt signal.  Only the latest update of each file is
+    kept and all of them are passed on together when the interval is up.
+    Creating, completing and failing tasks, and the first update after creating
+    one, which says where the file starts, are passed on right away, after any
+    pending update of the same file.  Updates of the segments of a file are
+    coalesced the same way, if progress takes them.
+
+    Parameters
+    ----------
+    progress
+        Progress to pass updates on to
+    interval
+        Seconds between updates, by default 0.1
+    """
+
+    def __init__(self, progress: 'Progress', interval: float = PROGRESS_INTERVAL) -> None:
+        self.progress = progress
+        self.interval = interval
+        # latest update of each file not yet passed on, keyed by source
+        self._pending: dict[str, tuple[str, int]] = {}
+        # latest update of each segment not yet passed on, keyed by source and
+        # first byte
+        self._segments: dict[tuple[str, int], tuple[str, int, int]] = {}
+        # files created since their last update
+        self._created: set[str] = set()
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def __repr__(self) -> str:
+        return f"CoalescedProgress {len(self._pending)} pending of {self.progress!r}"
+
+    def create_task(self, name: str, source: str, total: int) -> None:
+        # updates from before a retry are stale
+        self._pending.pop(source, None)
+        self._drop_segments(source)
+        self._created.add(source)
+        self.progress.create_task(name, source, total)
+
+    def update(self, name: str, source: str, completed: int) -> None:
+        if source in self._created:
+            self._created.discard(source)
+            self.progress.update(name, source, completed)
+            return None
+        self._pending[source] = (name, completed)
+        self._schedule()
+
+    def update_segment(
+            self, name: str, source: str, start: int, total: int, completed: int
+    ) -> None:
+        if getattr(self.progress, "update_segment", None) is None:
+            return None
+        self._segments[source, start] = (name, total, completed)
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.interval, self.flush)
+
+    def complete_task(self, name: str, source: str) -> None:
+        self._flush_one(source)
+        self.progress.complete_task(name, source)
+
+    def fail_task(self, name: str, source: str, reason: str) -> None:
+        self._flush_one(source)
+        fail_task = getattr(self.progress, "fail_task", None)
+        if fail_task is not None:
+            fail_task(name, source, reason)
+
+    def _flush_one(self, source: str) -> None:
+        self._created.discard(source)
+        pending = self._pending.pop(source, None)
+        if pending is not None:
+            self.progress.update(pending[0], source, pending[1])
+        self._drop_segments(source)
+
+    def _drop_segments(self, source: str) -> None:
+        # segments are of no interest once their file is done or starts over
+        for key in [key for key in self._segments if key[0] == source]:
+            del self._segments[key]
+
+    def flush(self) -> None:
+        """Pass on every pending update now"""
+        self._handle = None
+        pending, self._pending = self._pending, {}
+        segments, self._segments = self._segments, {}
+        for (source, start), (name, total, completed) in segments.items():
+            self.progress.update_segment(name, source, start, total, completed)
+        for source, (name, completed) in pending.items():
+            self.progress.update(name, source, completed)
+
+    def close(self) -> None:
+        """Pass on pending updates and stop the timer"""
+        if self._handle is not None:
+            self._handle.cancel()
+        self.flush()
@@ -0,0 +1,164 @@
+__all__ = ["summarize", "print_report", "write_report"]
+
+import datetime
+import json
+import logging
+import math
+import pathlib
+
+from typing import Any, Optional, TYPE_CHECKING, Union
+
+from rich.console import Console
+from rich.filesize import decimal
+from rich.table import Table
+
+from . import __version__
+from .metrics import Histogram
+
+if TYPE_CHECKING:
+    from .app import Application
+
+logger = logging.getLogger(__name__)
+
+# width in characters of the longest histogram bar
+BAR_WIDTH = 20
+
+
+def _distribution(histogram: Histogram) -> dict[str, Any]:
+    return {
+        "count": len(histogram),
+        "p50": histogram.percentile(0.50),
+        "p95": histogram.percentile(0.95),
+        "p99": histogram.percentile(0.99),
+        "max": max(histogram.values, default=None),
+        "buckets": [
+            {"le": None if math.isinf(bound) else bound, "count": count}
+            for bound, count in zip(histogram.bounds, histogram.counts)
+        ],
+    }
+
+
+def summarize(app: 'Application') -> dict[str, Any]:
+    """
+    Summary of the performance of everything app did so far, suitable for
+    serializing to JSON.
+    """
+    metrics = app.metrics
+    elapsed = metrics.elapsed
+    downloaded = sum(metrics.downloaded.values())
+    started = datetime.datetime.fromtimestamp(metrics.started, datetime.timezone.utc)
+    return {
+        "version": __version__,
+        "started": started.isoformat(),
+        "wall_seconds": elapsed,
+        "bytes_downloaded": downloaded,
+        "bytes_uploaded": sum(metrics.uploaded.values()),
+        "throughput_bytes_per_second": downloaded / elapsed if elapsed else None,
+        "files_completed": metrics.completed,
+        "files_failed": dict(metrics.failed),
+        "api_requests": metrics.api_requests,
+        "retries": dict(app.retry.reasons),
+        "metadata_seconds": metrics.busy_seconds("metadata"),
+        "transfer_seconds": metrics.busy_seconds("transfer"),
+        "time_to_first_byte": _distribution(metrics.ttfb),
+        "file_duration": _distribution(metrics.durations),
+        "slowest": [
+            {"path": path, "bytes": nbytes, "seconds": seconds}
+            for seconds, path, nbytes in sorted(metrics.slowest, reverse=True)
+        ],
+    }
+
+
+def _seconds(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if value < 1:
+        return f"{value * 1000:.0f} ms"
+    return f"{value:.2f} s"
+
+
+def _counts(counts: dict[str, int]) -> str:
+    total = sum(counts.values())
+    if not total:
+        return "0"
+    details = ", ".join(f"{reason}: {count}" for reason, count in sorted(counts.items()))
+    return f"{total} ({details})"
+
+
+def print_report(summary: dict[str, Any], console: Optional[Console] = None) -> None:
+    """Print a summary made by :func:`summarize` as tables"""
+    if console is None:
+        console = Console(stderr=True)
+
+    overview = Table(title="doppkit run", show_header=False)
+    overview.add_column(style="bold")
+    overview.add_column(justify="right")
+    throughput = summary["throughput_bytes_per_second"]
+    overview.add_row("Wall time", _seconds(summary["wall_seconds"]))
+    overview.add_row("Downloaded", decimal(summary["bytes_downloaded"]))
+    if summary["bytes_uploaded"]:
+        overview.add_row("Uploaded", decimal(summary["bytes_uploaded"]))
+    overview.add_row("Throughput", f"{decimal(int(throughput))}/s" if throughput else "-")
+    overview.add_row("Files completed", str(summary["files_completed"]))
+    overview.add_row("Files failed", _counts(summary["files_failed"]))
+    overview.add_row("Retries", _counts(summary["retries"]))
+    overview.add_row("API requests", str(summary["api_requests"]))
+    overview.add_row("Time in API requests", _seconds(summary["metadata_seconds"]))
+    overview.add_row("Time downloading", _seconds(summary["transfer_seconds"]))
+    console.print(overview)
+
+    ttfb = summary["time_to_first_byte"]
+    duration = summary["file_duration"]
+    if not duration["count"]:
+        return None
+
+    latency = Table(title="Per file latency")
+    for column in ("", "p50", "p95", "p99", "max"):
+        latency.add_column(column, justify="right" if column else "left")
+    for label, distribution in (("Time to first byte", ttfb), ("Duration", duration)):
+        latency.add_row(label, *(_seconds(distribution[key]) for key in ("p50", "p95", "p99", "max")))
+    console.print(latency)
+
+    histogram = Table(title="Files by latency")
+    histogram.add_column("Up to", justify="right")
+    histogram.add_column("Time to first byte", no_wrap=True)
+    histogram.add_column("Duration", no_wrap=True)
+    most = max(
+        bucket["count"] for bucket in ttfb["buckets"] + duration["buckets"]
+    )
+    for first, total in zip(ttfb["buckets"], duration["buckets"]):
+        if not first["count"] and not total["count"]:
+            continue
+        histogram.add_row(
+            "more" if first["le"] is None else _seconds(first["le"]),
+            *(
+                f"{'█' * math.ceil(bucket['count'] / most * BAR_WIDTH)} {bucket['count']}"
+                if bucket["count"] else ""
+                for bucket in (first, total)
+            )
+        )
+    console.print(histogram)
+
+    slowest = Table(title="Slowest files")
+    slowest.add_column("File")
+    slowest.add_column("Size", justify="right")
+    slowest.add_column("Duration", justify="right")
+    slowest.add_column("Throughput", justify="right")
+    for entry in summary["slowest"]:
+        rate = entry["bytes"] / entry["seconds"] if entry["seconds"] else 0
+        slowest.add_row(
+            entry["path"],
+            decimal(entry["bytes"]),
+            _seconds(entry["seconds"]),
+            f"{decimal(int(rate))}/s"
+        )
+    console.print(slowest)
+
+
+def write_report(summary: dict[str, Any], path: Union[str, pathlib.Path]) -> None:
+    """Write a summary made by :func:`summarize` as JSON"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Wrote performance report to {path}")
@@ -0,0 +1,169 @@
+__all__ = ["RetryPolicy", "retry_after", "failure_reason"]
+
+import asyncio
+import collections
+import datetime
+import email.utils
+import logging
+import random
+
+import httpx
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+from .integrity import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# statuses worth asking again for, everything else is considered final
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# errors that may well not happen the next time around; errors such as
+# httpx.UnsupportedProtocol or httpx.LocalProtocolError will not go away
+RETRYABLE_EXCEPTIONS = (
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+    IntegrityError,
+)
+
+
+def failure_reason(result: Union[BaseException, httpx.Response, object]) -> str:
+    """Short description of a failed result, its status code or exception type"""
+    if isinstance(result, httpx.HTTPStatusError):
+        result = result.response
+    if isinstance(result, httpx.Response):
+        return str(result.status_code)
+    return type(result).__name__
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds the server asked us to wait in its Retry-After header, if any"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+class RetryPolicy:
+    """
+    Decides if, and after how long, a failed request should be attempted again.
+
+    Delays grow exponentially from ``base`` up to ``cap`` with full jitter, unless
+    the server specified a Retry-After delay.  Every retry draws from a budget
+    shared by all requests using the policy so that a server that is down does
+    not turn into hours of retrying.
+
+    Parameters
+    ----------
+    attempts
+        Maximum number of retries of a single request, by default 5
+    budget
+        Maximum number of retries over the lifetime of the policy, by default 1000
+    base
+        Delay in seconds before the first retry, by default 1.0
+    cap
+        Longest delay in seconds between retries, by default 60.0
+    max_retry_after
+        Longest Retry-After delay in seconds that is honored, longer requests
+        are considered fatal, by default 300.0
+    """
+
+    def __init__(
+            self,
+            attempts: int = 5,
+            budget: int = 1000,
+            base: float = 1.0,
+            cap: float = 60.0,
+            max_retry_after: float = 300.0
+    ) -> None:
+        self.attempts = attempts
+        self.budget = budget
+        self.base = base
+        self.cap = cap
+        self.max_retry_after = max_retry_after
+        self.retries = 0
+        self.reasons: collections.Counter[str] = collections.Counter()
+
+    def __repr__(self) -> str:
+        return f"RetryPolicy {self.retries}/{self.budget} retries used"
+
+    @staticmethod
+    def retryable(result: Union[BaseException, httpx.Response, object]) -> bool:
+        """Whether a failed result is worth retrying, successes are not"""
+        if isinstance(result, httpx.HTTPStatusError):
+            result = result.response
+        if isinstance(result, httpx.Response):
+            return result.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(result, RETRYABLE_EXCEPTIONS)
+
+    def next_delay(
+            self,
+            result: Union[BaseException, httpx.Response, object],
+            attempt: int
+    ) -> Optional[float]:
+        """
+        Seconds to wait before retrying after ``attempt`` (counting from 0)
+        produced ``result``, or None if it should not be retried.  A returned
+        delay is charged against the budget.
+        """
+        if not self.retryable(result):
+            return None
+        if attempt >= self.attempts:
+            return None
+        if self.retries >= self.budget:
+            logger.warning("Retry budget exhausted, not retrying failed requests")
+            return None
+
+        if isinstance(result, httpx.HTTPStatusError):
+            result = result.response
+        requested = retry_after(result) if isinstance(result, httpx.Response) else None
+        if requested is not None:
+            if requested > self.max_retry_after:
+                return None
+            delay = requested
+        else:
+            delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        self.retries += 1
+        self.reasons[failure_reason(result)] += 1
+        return delay
+
+    async def call(
+            self,
+            request: Callable[[], Awaitable[T]],
+            description: str = "request"
+    ) -> T:
+        """
+        Await ``request()`` until it succeeds or is not worth retrying.  Error
+        responses that are not retried are returned, exceptions are raised.
+        """
+        attempt = 0
+        while True:
+            try:
+                result = await request()
+            except Exception as e:
+                delay = self.next_delay(e, attempt)
+                if delay is None:
+                    raise
+                reason = repr(e)
+            else:
+                if not isinstance(result, httpx.Response) or not result.is_error:
+                    return result
+                delay = self.next_delay(result, attempt)
+                if delay is None:
+                    return result
+                reason = f"status {result.status_code}"
+            logger.warning(f"{description} failed with {reason}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
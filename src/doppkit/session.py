@@ -0,0 +1,87 @@
+__all__ = ["Session"]
+
+import asyncio
+import logging
+
+import httpx
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .app import Application
+
+logger = logging.getLogger(__name__)
+
+# connections kept available on top of app.threads so API calls made while
+# downloads are running do not have to wait for a download to finish
+API_CONNECTIONS = 4
+
+
+class Session:
+    """
+    Long-lived HTTP client shared by all GRiD API calls, downloads and uploads of
+    an application, so connections (and their TLS sessions) to GRiD and the
+    storage hosts it redirects to are kept alive and reused.
+
+    A client is bound to the event loop it was created in, a new one is created
+    when used from another loop or when the SSL or HTTP/2 settings of the
+    application change.
+    """
+
+    def __init__(self, app: 'Application') -> None:
+        self.app = app
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._config: tuple = ()
+
+    def __repr__(self) -> str:
+        state = "open" if self._client is not None else "closed"
+        return f"Session {state} {self._config}"
+
+    def _current_config(self) -> tuple:
+        return (
+            self.app.threads,
+            not self.app.disable_ssl_verification,
+            self.app.http2,
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        """Client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        config = self._current_config()
+        if self._client is not None and (loop is not self._loop or config != self._config):
+            if loop is self._loop:
+                asyncio.ensure_future(self._client.aclose())
+            # a client from another, likely closed, event loop cannot be closed
+            self._client = None
+
+        if self._client is None:
+            threads, verify, http2 = config
+            connections = threads + API_CONNECTIONS
+            limits = httpx.Limits(
+                max_keepalive_connections=connections,
+                max_connections=connections,
+            )
+            timeout = httpx.Timeout(20.0, connect=40.0)
+            try:
+                self._client = httpx.AsyncClient(
+                    timeout=timeout, limits=limits, verify=verify, http2=http2
+                )
+            except ImportError:
+                logger.warning(
+                    "HTTP/2 requested but the h2 package is not installed, "
+                    "falling back to HTTP/1.1. Install doppkit[HTTP2] to enable it."
+                )
+                self._client = httpx.AsyncClient(
+                    timeout=timeout, limits=limits, verify=verify
+                )
+            self._loop = loop
+            self._config = config
+            logger.debug(f"Opened HTTP session with {connections} connections")
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the client, if it belongs to the running event loop"""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
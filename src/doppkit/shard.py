@@ -0,0 +1,164 @@
+__all__ = ["Shard", "parse_shard", "partition", "manifest_path", "write_manifest", "check"]
+
+import hashlib
+import heapq
+import json
+import logging
+import pathlib
+import socket
+import time
+
+from typing import Any, Iterable, NamedTuple, Optional, Union
+
+from .cache import DownloadUrl
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIRECTORY = pathlib.Path(".doppkit") / "shards"
+
+
+class Shard(NamedTuple):
+    """Slice ``index`` (counting from 1) of ``count`` of the files to sync"""
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, url: DownloadUrl) -> bool:
+        """Whether url belongs to this shard when partitioning by hash"""
+        digest = hashlib.sha256(url.save_path.lstrip("/").encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count == self.index - 1
+
+
+def parse_shard(shard: Union[str, Shard, None]) -> Optional[Shard]:
+    """Parse a shard given as ``i/n``, such as ``2/4``"""
+    if shard is None or isinstance(shard, Shard):
+        return shard
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError as e:
+        raise ValueError(f"Unable to parse shard {shard!r}, expected a value like 2/4") from e
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {shard!r} is out of range, expected 1 <= i <= n")
+    return Shard(index, count)
+
+
+def partition(
+        urls: Iterable[DownloadUrl],
+        shard: Shard,
+        balance: bool = False
+) -> list[DownloadUrl]:
+    """
+    Files of urls that belong to shard.
+
+    Every node has to be given the same urls to arrive at the same partition,
+    so urls should be all files of the sync, including those already present.
+
+    Parameters
+    ----------
+    urls
+        Every file to sync
+    shard
+        Slice of the files to return
+    balance
+        Assign files largest first to the shard with the fewest bytes so far
+        instead of by hash of their save path, which evens out the bytes each
+        shard downloads but requires knowing every file up front
+    """
+    if not balance:
+        return [url for url in urls if shard.owns(url)]
+
+    # ties are broken by save path and shard number so every node agrees
+    ordered = sorted(urls, key=lambda url: (-url.total, url.save_path))
+    loads = [(0, index) for index in range(1, shard.count + 1)]
+    owned = []
+    for url in ordered:
+        load, index = heapq.heappop(loads)
+        if index == shard.index:
+            owned.append(url)
+        heapq.heappush(loads, (load + url.total, index))
+    return owned
+
+
+def manifest_path(directory: Union[str, pathlib.Path], shard: Shard) -> pathlib.Path:
+    """Completion manifest of shard, kept in the shared download directory"""
+    return pathlib.Path(directory) / SHARD_DIRECTORY / f"shard-{shard.index}-of-{shard.count}.json"
+
+
+def write_manifest(
+        directory: Union[str, pathlib.Path],
+        shard: Shard,
+        files: list[dict[str, Any]]
+) -> pathlib.Path:
+    """
+    Record which files a shard was responsible for and how each of them went.
+
+    Parameters
+    ----------
+    directory
+        Download directory shared by all shards
+    shard
+        Shard the files belong to
+    files
+        Entries with at least ``save_path`` and ``status`` keys
+    """
+    path = manifest_path(directory, shard)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "shard": shard.index,
+        "shards": shard.count,
+        "host": socket.gethostname(),
+        "finished": time.time(),
+        "complete": all(entry["status"] == "done" for entry in files),
+        "files": files,
+    }
+    # written to the side first so a merge never sees a partial manifest
+    partial = path.with_name(f"{path.name}.part")
+    partial.write_text(json.dumps(manifest), encoding="utf-8")
+    partial.replace(path)
+    logger.info(f"Wrote manifest of shard {shard} to {path}")
+    return path
+
+
+def check(directory: Union[str, pathlib.Path], count: Optional[int] = None) -> dict[str, Any]:
+    """
+    Check the manifests of all shards of a sharded sync.
+
+    Parameters
+    ----------
+    directory
+        Download directory shared by all shards
+    count
+        Number of shards, by default taken from the manifests
+
+    Returns
+    -------
+    dict
+        ``shards`` (the number of shards), ``missing`` (shards without a
+        manifest), ``incomplete`` (shards with files not done), ``failed``
+        (save paths of files not done) and ``complete``
+    """
+    manifests = {}
+    for path in sorted((pathlib.Path(directory) / SHARD_DIRECTORY).glob("shard-*-of-*.json")):
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        if count is not None and manifest["shards"] != count:
+            continue
+        manifests[manifest["shard"]] = manifest
+    if count is None:
+        count = max((manifest["shards"] for manifest in manifests.values()), default=0)
+    missing = [index for index in range(1, count + 1) if index not in manifests]
+    incomplete = sorted(index for index, manifest in manifests.items() if not manifest["complete"])
+    failed = [
+        entry["save_path"]
+        for index in incomplete
+        for entry in manifests[index]["files"]
+        if entry["status"] != "done"
+    ]
+    return {
+        "shards": count,
+        "missing": missing,
+        "incomplete": incomplete,
+        "failed": failed,
+        "complete": count > 0 and not missing and not incomplete,
+    }
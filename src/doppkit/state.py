@@ -0,0 +1,338 @@
+__all__ = [
+    "SyncState",
+    "StateProgress",
+    "open_state",
+    "state_path",
+    "PENDING",
+    "PARTIAL",
+    "DONE",
+    "FAILED",
+]
+
+import json
+import logging
+import pathlib
+import sqlite3
+import time
+
+from typing import Any, Iterator, Optional, Union, TYPE_CHECKING
+
+from .cache import DownloadUrl
+from .grid import started_at
+
+if TYPE_CHECKING:
+    from .app import Application
+    from .cache import Progress
+    from .shard import Shard
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PARTIAL = "partial"
+DONE = "done"
+FAILED = "failed"
+
+STATE_NAME = "state.sqlite"
+
+# seconds between writes of buffered status updates
+FLUSH_INTERVAL = 1.0
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    plan TEXT NOT NULL,
+    started REAL NOT NULL,
+    planned REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS exports (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    name TEXT,
+    started_at TEXT,
+    PRIMARY KEY (run, id)
+);
+CREATE TABLE IF NOT EXISTS files (
+    run INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    url TEXT NOT NULL,
+    export INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    save_path TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    file_id INTEGER,
+    status TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run, url)
+);
+CREATE INDEX IF NOT EXISTS files_status ON files(run, status);
+"""
+
+
+def state_path(
+        directory: Union[str, pathlib.Path],
+        shard: Optional['Shard'] = None
+) -> pathlib.Path:
+    """
+    Location of the sync state of a download directory, each shard of a sharded
+    sync keeps its own since SQLite cannot be shared over network filesystems
+    """
+    if shard is not None:
+        return pathlib.Path(directory) / ".doppkit" / f"state-{shard.index}-of-{shard.count}.sqlite"
+    return pathlib.Path(directory) / ".doppkit" / STATE_NAME
+
+
+class SyncState:
+    """
+    Record of what a sync planned to download and how far it got.
+
+    Every file of every export is recorded along with its status (pending,
+    partial, done or failed), the bytes received and when it last changed.  An
+    interrupted sync can resume from this record without asking GRiD for the
+    exports again or looking at files that were already done, and the progress
+    of a running sync can be followed from another process.
+
+    Status updates are buffered and written at most every ``FLUSH_INTERVAL``
+    seconds; updates lost in a crash only cause files to be checked on disk.
+    Failures are written right away, they cannot be told from the files
+    on disk.
+
+    Parameters
+    ----------
+    path
+        SQLite database to keep the state in
+    read_only
+        Open an existing database without writing to it
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], read_only: bool = False) -> None:
+        self.path = pathlib.Path(path)
+        if read_only:
+            self.connection = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=30.0
+            )
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30.0)
+            self.connection.execute("PRAGMA foreign_keys = ON")
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.executescript(_schema)
+        self.run: Optional[int] = None
+        self._updates: dict[str, tuple[str, Optional[int], Optional[str], float]] = {}
+        self._flushed = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"SyncState {self.path} run {self.run}"
+
+    @staticmethod
+    def _plan(plan: dict[str, Any]) -> str:
+        return json.dumps(plan, sort_keys=True)
+
+    def resumable(self, plan: dict[str, Any]) -> Optional[int]:
+        """Latest run of plan that knew all of its files but did not finish"""
+        row = self.connection.execute(
+            "SELECT id, planned, finished FROM runs WHERE plan = ? "
+            "ORDER BY id DESC LIMIT 1",
+            (self._plan(plan),)
+        ).fetchone()
+        if row is None or row[1] is None or row[2] is not None:
+            return None
+        return row[0]
+
+    def start(self, plan: dict[str, Any]) -> int:
+        """Begin a new run of plan, replacing earlier runs of it"""
+        with self.connection:
+            self.connection.execute("DELETE FROM runs WHERE plan = ?", (self._plan(plan),))
+            self.run = self.connection.execute(
+                "INSERT INTO runs (plan, started) VALUES (?, ?)",
+                (self._plan(plan), time.time())
+            ).lastrowid
+        return self.run
+
+    def resume(self, run: int) -> None:
+        self.run = run
+
+    def add_export(
+            self,
+            export: dict[str, Any],
+            files: list[DownloadUrl],
+            wanted: list[DownloadUrl]
+    ) -> None:
+        """Record the files of an export, those not wanted are already done"""
+        now = time.time()
+        wanted_urls = {file_.url for file_ in wanted}
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO exports (run, id, name, started_at) "
+                "VALUES (?, ?, ?, ?)",
+                (self.run, export["id"], export.get("name"), export.get("started_at"))
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (run, url, export, name, save_path, "
+                "total, file_id, status, bytes, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        self.run, file_.url, export["id"], file_.name,
+                        file_.save_path, file_.total, file_.file_id,
+                        PENDING if file_.url in wanted_urls else DONE,
+                        0 if file_.url in wanted_urls else file_.total,
+                        now
+                    )
+                    for file_ in files
+                ]
+            )
+
+    def planned(self) -> None:
+        """Mark every file of the run as known"""
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET planned = ? WHERE id = ?", (time.time(), self.run)
+            )
+
+    def remaining(self) -> Iterator[tuple[dict[str, Any], DownloadUrl]]:
+        """Files of the run that are not done, along with their export"""
+        rows = self.connection.execute(
+            "SELECT files.url, files.name, files.save_path, files.total, "
+            "files.file_id, exports.id, exports.name, exports.started_at "
+            "FROM files JOIN exports "
+            "ON files.run = exports.run AND files.export = exports.id "
+            "WHERE files.run = ? AND files.status != ?",
+            (self.run, DONE)
+        ).fetchall()
+        for url, name, save_path, total, file_id, export_id, export_name, started in rows:
+            export = {"id": export_id, "name": export_name, "started_at": started}
+            yield export, DownloadUrl(
+                url, name, save_path, total, file_id, since=started_at(export)
+            )
+
+    def files(self) -> list[dict[str, Any]]:
+        """Every file of the run along with its status"""
+        self.flush()
+        rows = self.connection.execute(
+            "SELECT save_path, total, status, bytes, error FROM files "
+            "WHERE run = ? ORDER BY save_path",
+            (self.run,)
+        ).fetchall()
+        return [
+            {"save_path": save_path, "total": total, "status": status, "bytes": nbytes, "error": error}
+            for save_path, total, status, nbytes, error in rows
+        ]
+
+    def mark(
+            self,
+            url: str,
+            status: str,
+            nbytes: Optional[int] = None,
+            error: Optional[str] = None
+    ) -> None:
+        """Update the status of a file, written out with the next flush"""
+        if status == PARTIAL and self._updates.get(url, (None,))[0] in (DONE, FAILED):
+            # progress reported after the download already finished
+            return None
+        if nbytes is None and url in self._updates:
+            nbytes = self._updates[url][1]
+        self._updates[url] = (status, nbytes, error, time.time())
+        if status == FAILED or time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        self._flushed = time.monotonic()
+        if not self._updates or self.run is None:
+            return None
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE files SET status = ?, bytes = COALESCE(?, bytes), error = ?, "
+                "updated = ? WHERE run = ? AND url = ?",
+                [
+                    (status, nbytes, error, updated, self.run, url)
+                    for url, (status, nbytes, error, updated) in self._updates.items()
+                ]
+            )
+        self._updates.clear()
+
+    def finish(self) -> None:
+        """Mark the run as complete, it will not be resumed"""
+        self.flush()
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run)
+            )
+
+    def latest(self) -> Optional[dict[str, Any]]:
+        """The most recent run, if any"""
+        row = self.connection.execute(
+            "SELECT id, plan, started, planned, finished FROM runs "
+            "ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        run, plan, started, planned, finished = row
+        return {
+            "run": run,
+            "plan": json.loads(plan),
+            "started": started,
+            "planned": planned,
+            "finished": finished,
+        }
+
+    def summary(self, run: int) -> dict[str, tuple[int, int, int]]:
+        """Number of files, bytes received and total bytes of a run by status"""
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*), SUM(bytes), SUM(total) FROM files "
+            "WHERE run = ? GROUP BY status",
+            (run,)
+        ).fetchall()
+        return {status: (count, nbytes, total) for status, count, nbytes, total in rows}
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+class StateProgress:
+    """
+    Progress that records the bytes received for each file in a SyncState,
+    passing every call on to another progress.
+    """
+
+    def __init__(self, state: SyncState, progress: Optional['Progress'] = None) -> None:
+        self.state = state
+        self.progress = progress
+
+    def create_task(self, name: str, source: str, total: int) -> None:
+        self.state.mark(source, PARTIAL, 0)
+        if self.progress is not None:
+            self.progress.create_task(name, source, total)
+
+    def update(self, name: str, source: str, completed: int) -> None:
+        self.state.mark(source, PARTIAL, completed)
+        if self.progress is not None:
+            self.progress.update(name, source, completed)
+
+    def complete_task(self, name: str, source: str) -> None:
+        # only called once the file is in place
+        self.state.mark(source, DONE)
+        if self.progress is not None:
+            self.progress.complete_task(name, source)
+
+    def fail_task(self, name: str, source: str, reason: str) -> None:
+        # only called once retries are exhausted
+        self.state.mark(source, FAILED, error=reason)
+        fail_task = getattr(self.progress, "fail_task", None)
+        if fail_task is not None:
+            fail_task(name, source, reason)
+
+    def update_segment(
+            self, name: str, source: str, start: int, total: int, completed: int
+    ) -> None:
+        update_segment = getattr(self.progress, "update_segment", None)
+        if update_segment is not None:
+            update_segment(name, source, start, total, completed)
+
+
+def open_state(app: 'Application') -> SyncState:
+    """Sync state of the application's download directory"""
+    return SyncState(state_path(app.directory, app.shard))
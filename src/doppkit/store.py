@@ -0,0 +1,301 @@
+__all__ = ["DownloadStore", "materialize", "open_store"]
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import sys
+import time
+
+from typing import AsyncIterator, Iterable, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .app import Application
+
+logger = logging.getLogger(__name__)
+
+# ioctl request number to clone a file's extents on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+_schema = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    downloaded REAL
+);
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES objects(digest) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects(last_used);
+"""
+
+
+def _reflink(source: pathlib.Path, destination: pathlib.Path) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks are only attempted on linux")
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            destination.unlink(missing_ok=True)
+            raise
+
+
+def materialize(
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        copy: bool = True
+) -> Optional[str]:
+    """
+    Make the contents of source available at destination without copying bytes
+    if the filesystem allows it.
+
+    Tries a hardlink, then a reflink, and falls back to a regular copy unless
+    copy is False.
+
+    Returns
+    -------
+    str, optional
+        The method used, one of "hardlink", "reflink" or "copy", None if
+        nothing was made
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+    with contextlib.suppress(OSError):
+        os.link(source, destination)
+        return "hardlink"
+    with contextlib.suppress(OSError):
+        _reflink(source, destination)
+        return "reflink"
+    if not copy:
+        return None
+    shutil.copyfile(source, destination)
+    return "copy"
+
+
+class DownloadStore:
+    """
+    Persistent store of previously downloaded files.
+
+    Objects are kept in ``<root>/objects`` and indexed in a SQLite database by
+    every key they are known under, such as their URL or GRiD exportfile id,
+    name and size, so a file that is part of several exports is only
+    downloaded once.  Objects share storage with the downloaded files through
+    hardlinks or reflinks, so the store costs little extra disk space.  Where
+    neither is possible, such as with the store on another filesystem, files
+    are only copied into the store if it has a max_size, which bounds the
+    extra disk space used, and are not stored otherwise.
+
+    Parameters
+    ----------
+    root
+        Directory to keep the index and objects in
+    max_size
+        Total size in bytes of objects to retain, least recently used objects are
+        evicted past this size.  None keeps everything, but only stores files
+        that can share storage with their download.
+    """
+
+    def __init__(
+            self,
+            root: Union[str, pathlib.Path],
+            max_size: Optional[int] = None
+    ) -> None:
+        self.root = pathlib.Path(root)
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.connection = sqlite3.connect(self.root / "store.sqlite", timeout=30.0)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(_schema)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(objects)")]
+        if "downloaded" not in columns:
+            # stores from before download times were kept, their objects are
+            # of unknown age
+            self.connection.execute("ALTER TABLE objects ADD COLUMN downloaded REAL")
+        self._size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM objects"
+        ).fetchone()[0]
+        self._reservations: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def __repr__(self) -> str:
+        return f"DownloadStore {self.root}"
+
+    def _object_path(self, digest: str) -> pathlib.Path:
+        return self.objects / digest[:2] / digest
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, key: str) -> AsyncIterator[None]:
+        """
+        Hold key while downloading the file it identifies, so that concurrent
+        downloads of the same file wait for the first one and can then be
+        looked up rather than fetched again.
+        """
+        lock, users = self._reservations.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._reservations[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._reservations[key]
+            if users > 1:
+                self._reservations[key] = (lock, users - 1)
+            else:
+                del self._reservations[key]
+
+    def lookup(
+            self,
+            keys: Iterable[str],
+            size: Optional[int] = None,
+            newer_than: Optional[float] = None
+    ) -> Optional[pathlib.Path]:
+        """
+        Return the stored object known by any of keys, if there is one.
+
+        Objects that are not size bytes, or that were not downloaded after the
+        unix time newer_than, are not returned, they are kept for other keys.
+        """
+        for key in keys:
+            row = self.connection.execute(
+                "SELECT objects.digest, objects.size, objects.downloaded FROM keys "
+                "JOIN objects ON keys.digest = objects.digest WHERE keys.key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                continue
+            digest, stored_size, downloaded = row
+            path = self._object_path(digest)
+            try:
+                stat = path.stat()
+            except OSError:
+                stat = None
+            with self.connection:
+                if stat is None or stat.st_size != stored_size:
+                    logger.debug(f"Dropping missing or modified store object {digest}")
+                    self._forget(digest)
+                    continue
+                if (size is not None and stat.st_size != size) or (
+                        newer_than is not None
+                        and (downloaded is None or downloaded <= newer_than)
+                ):
+                    logger.debug(f"Store object {digest} is out of date for {key}")
+                    continue
+                self.connection.execute(
+                    "UPDATE objects SET last_used = ? WHERE digest = ?",
+                    (time.time(), digest)
+                )
+            return path
+        return None
+
+    def discard(self, keys: Iterable[str]) -> None:
+        """Forget the objects known by any of keys, they are out of date"""
+        with self.connection:
+            for key in keys:
+                row = self.connection.execute(
+                    "SELECT digest FROM keys WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._object_path(row[0]).unlink(missing_ok=True)
+                    self._forget(row[0])
+
+    async def add(self, keys: Iterable[str], path: pathlib.Path) -> None:
+        """Record the file at path, just downloaded, in the store under each of keys"""
+        keys = list(keys)
+        if not keys:
+            return None
+        digest = hashlib.sha256(keys[0].encode("utf-8")).hexdigest()
+        object_path = self._object_path(digest)
+        size = path.stat().st_size
+        # falling back to a copy could take a while, keep it off the event loop,
+        # without a size limit copies would double the disk space of every sync
+        method = await asyncio.to_thread(
+            materialize, path, object_path, self.max_size is not None
+        )
+        with self.connection:
+            self._forget(digest)
+            if method is None:
+                logger.debug(
+                    f"Not storing {path.name}, it cannot be linked into the store "
+                    "and copies need a store size limit"
+                )
+                return None
+            logger.debug(f"Stored {path.name} as {digest} using {method}")
+            now = time.time()
+            self.connection.execute(
+                "INSERT INTO objects (digest, size, last_used, downloaded) "
+                "VALUES (?, ?, ?, ?)",
+                (digest, size, now, now)
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO keys (key, digest) VALUES (?, ?)",
+                [(key, digest) for key in keys]
+            )
+            self._size += size
+        self.evict()
+
+    def _forget(self, digest: str) -> None:
+        row = self.connection.execute(
+            "SELECT size FROM objects WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is not None:
+            self.connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            self._size -= row[0]
+
+    def size(self) -> int:
+        """Total size in bytes of the objects in the store"""
+        return self._size
+
+    def evict(self) -> None:
+        """Remove least recently used objects until the store is within max_size"""
+        if self.max_size is None:
+            return None
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return None
+        rows = self.connection.execute(
+            "SELECT digest, size FROM objects ORDER BY last_used"
+        ).fetchall()
+        with self.connection:
+            for digest, size in rows:
+                if excess <= 0:
+                    break
+                self._object_path(digest).unlink(missing_ok=True)
+                self._forget(digest)
+                excess -= size
+                logger.debug(f"Evicted {digest} from download store")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+_stores: dict[pathlib.Path, DownloadStore] = {}
+
+
+def open_store(app: 'Application') -> DownloadStore:
+    """
+    Get the download store for an application, by default kept in a ``.doppkit``
+    directory inside the download directory so objects can be hardlinked.  Each
+    shard of a sharded sync gets a store of its own.
+    """
+    if app.store is not None:
+        root = pathlib.Path(app.store)
+    elif app.shard is not None:
+        root = pathlib.Path(app.directory) / ".doppkit" / f"store-{app.shard.index}-of-{app.shard.count}"
+    else:
+        root = pathlib.Path(app.directory) / ".doppkit"
+    root = root.resolve()
+    if root not in _stores:
+        _stores[root] = DownloadStore(root, max_size=app.store_size)
+    return _stores[root]
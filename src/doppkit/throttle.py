@@ -0,0 +1,164 @@
+__all__ = ["Throttle", "TokenBucket", "parse_rate", "parse_schedule"]
+
+import asyncio
+import datetime
+import logging
+import re
+import time
+
+from typing import NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_rate_re = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*$", re.IGNORECASE)
+_multipliers = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_rate(rate: Union[str, float, int, None]) -> Optional[float]:
+    """
+    Parse a rate in bytes per second such as ``500K``, ``10M`` or ``1.5G``.
+
+    Empty values and 0 mean unlimited and are returned as None.
+    """
+    if rate is None:
+        return None
+    if isinstance(rate, (int, float)):
+        return float(rate) if rate > 0 else None
+    if not rate.strip():
+        return None
+    match = _rate_re.match(rate)
+    if match is None:
+        raise ValueError(f"Unable to parse rate {rate!r}, expected a value like 10M")
+    value = float(match[1]) * _multipliers[match[2].lower()]
+    return value if value > 0 else None
+
+
+class ScheduleEntry(NamedTuple):
+    start: datetime.time
+    end: datetime.time
+    rate: Optional[float]
+
+    def active(self, now: datetime.time) -> bool:
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        # window wraps around midnight
+        return now >= self.start or now < self.end
+
+
+def parse_schedule(schedule: Optional[str]) -> list[ScheduleEntry]:
+    """
+    Parse comma separated ``HH:MM-HH:MM=RATE`` entries, such as
+    ``08:00-18:00=5M,18:00-08:00=0``, in local time.
+    """
+    entries = []
+    if not schedule:
+        return entries
+    for item in schedule.split(","):
+        if not item.strip():
+            continue
+        try:
+            window, rate = item.split("=")
+            start, end = window.split("-")
+            entries.append(
+                ScheduleEntry(
+                    datetime.time.fromisoformat(start.strip()),
+                    datetime.time.fromisoformat(end.strip()),
+                    parse_rate(rate)
+                )
+            )
+        except ValueError as e:
+            raise ValueError(
+                f"Unable to parse schedule entry {item!r}, expected HH:MM-HH:MM=RATE"
+            ) from e
+    return entries
+
+
+class TokenBucket:
+    """
+    Limits the rate at which bytes are consumed, allowing bursts of up to one
+    second's worth of bytes.  Consumers that overdraw the bucket wait until the
+    debt has been paid off.
+    """
+
+    def __init__(self, rate: Optional[float] = None) -> None:
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"TokenBucket {self.rate} B/s"
+
+    async def consume(self, nbytes: int, rate: Optional[float] = None) -> None:
+        rate = self.rate if rate is None else rate
+        now = time.monotonic()
+        if rate is None:
+            self.tokens = 0.0
+            self.updated = now
+            return None
+        burst = max(rate, 65536.0)
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= nbytes
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / rate)
+
+
+class Throttle:
+    """
+    Bandwidth limits shared by all downloads and uploads of an application.
+
+    Parameters
+    ----------
+    rate
+        Overall limit in bytes per second, None for unlimited
+    host_rate
+        Limit in bytes per second for each individual host, None for unlimited
+    schedule
+        Time of day windows that override the overall limit while active
+    """
+
+    def __init__(
+            self,
+            rate: Optional[float] = None,
+            host_rate: Optional[float] = None,
+            schedule: Optional[list[ScheduleEntry]] = None
+    ) -> None:
+        self.bucket = TokenBucket()
+        self.host_buckets: dict[str, TokenBucket] = {}
+        self.configure(rate, host_rate, schedule)
+
+    def __repr__(self) -> str:
+        return f"Throttle {self.rate} B/s overall, {self.host_rate} B/s per host"
+
+    def configure(
+            self,
+            rate: Optional[float] = None,
+            host_rate: Optional[float] = None,
+            schedule: Optional[list[ScheduleEntry]] = None
+    ) -> None:
+        self.rate = rate
+        self.host_rate = host_rate
+        self.schedule = schedule if schedule is not None else []
+
+    def current_rate(self) -> Optional[float]:
+        """Overall limit in effect right now"""
+        now = datetime.datetime.now().time()
+        for entry in self.schedule:
+            if entry.active(now):
+                return entry.rate
+        return self.rate
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate or self.host_rate or self.schedule)
+
+    async def consume(self, host: Optional[str], nbytes: int) -> None:
+        """Wait until nbytes may be transferred to or from host"""
+        if not self.enabled:
+            return None
+        if self.host_rate is not None and host:
+            bucket = self.host_buckets.setdefault(host, TokenBucket())
+            await bucket.consume(nbytes, rate=self.host_rate)
+        rate = self.current_rate()
+        if rate is not None:
+            await self.bucket.consume(nbytes, rate=rate)
@@ -0,0 +1,201 @@
+__all__ = ["Tracer", "NullTracer"]
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import pathlib
+import time
+
+from typing import Any, Awaitable, Iterator, Optional, TypeVar, Union
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the row of the trace the current task records its spans in
+_lane: contextvars.ContextVar[int] = contextvars.ContextVar("doppkit_trace_lane", default=0)
+
+
+class Tracer:
+    """
+    Records how long each phase of each request takes, such as waiting for a
+    download slot, every redirect hop up to its response headers (the last one
+    being the time to first byte), streaming the body, and writing it to disk.
+
+    Spans are kept in memory and written with :meth:`write` in the Chrome trace
+    event format, which can be opened in Perfetto or ``chrome://tracing``.
+    Concurrent downloads are drawn in separate rows, and spans of other
+    processes added with :meth:`merge` in separate groups.
+
+    Parameters
+    ----------
+    name
+        Name to draw the spans of this process under, by default its pid
+    """
+
+    enabled = True
+
+    def __init__(self, name: Optional[str] = None) -> None:
+        self.events: list[dict[str, Any]] = []
+        self._origin = time.perf_counter()
+        # unix time of the origin, to line up spans of other processes
+        self.epoch = time.time()
+        self._pid = os.getpid()
+        self._lanes: set[int] = set()
+        self._named: set[int] = set()
+        if name is not None:
+            self.events.append({
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "args": {"name": name},
+            })
+
+    def __repr__(self) -> str:
+        return f"Tracer {len(self.events)} spans"
+
+    def add(self, name: str, category: str, start: float, end: float, **args: Any) -> None:
+        """Record a span between two :func:`time.perf_counter` readings"""
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self._pid,
+            "tid": _lane.get(),
+            "args": args,
+        })
+
+    @contextlib.contextmanager
+    def span(
+            self,
+            name: str,
+            category: str,
+            threshold: float = 0.0,
+            **args: Any
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Record the time spent in the block, unless shorter than threshold
+        seconds.  The yielded dict can be updated with more arguments.
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            if end - start >= threshold:
+                self.add(name, category, start, end, **args)
+
+    async def timed(
+            self,
+            name: str,
+            category: str,
+            awaitable: Awaitable[T],
+            totals: dict[str, float],
+            threshold: float = 0.001
+    ) -> T:
+        """
+        Await awaitable, adding its duration to totals[name] and recording a span
+        if it took at least threshold seconds; for operations happening too
+        often to record every one of them
+        """
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            end = time.perf_counter()
+            totals[name] = totals.get(name, 0.0) + end - start
+            if end - start >= threshold:
+                self.add(name, category, start, end)
+
+    @contextlib.contextmanager
+    def lane(self, label: str = "download") -> Iterator[int]:
+        """Draw the spans of the current task in a row of their own"""
+        lane = 1
+        while lane in self._lanes:
+            lane += 1
+        self._lanes.add(lane)
+        if lane not in self._named:
+            self._named.add(lane)
+            self.events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": lane,
+                "args": {"name": f"{label} {lane}"},
+            })
+        token = _lane.set(lane)
+        try:
+            yield lane
+        finally:
+            _lane.reset(token)
+            self._lanes.discard(lane)
+
+    def merge(self, events: list[dict[str, Any]], epoch: float) -> None:
+        """
+        Add events recorded by another tracer whose origin was at unix time
+        epoch, such as that of a worker process
+        """
+        shift = (epoch - self.epoch) * 1e6
+        for event in events:
+            if "ts" in event:
+                event = {**event, "ts": event["ts"] + shift}
+            self.events.append(event)
+
+    def write(self, path: Union[str, pathlib.Path]) -> None:
+        """Write the recorded spans as a Chrome trace"""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"Wrote {len(self.events)} trace events to {path}")
+
+
+class _NullSpan:
+
+    def __enter__(self) -> dict[str, Any]:
+        return {}
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_null_span = _NullSpan()
+
+
+class NullTracer:
+    """Tracer that records nothing, used unless tracing was asked for"""
+
+    enabled = False
+
+    def __repr__(self) -> str:
+        return "NullTracer"
+
+    def add(self, name: str, category: str, start: float, end: float, **args: Any) -> None:
+        return None
+
+    def span(self, name: str, category: str, threshold: float = 0.0, **args: Any) -> _NullSpan:
+        return _null_span
+
+    async def timed(
+            self,
+            name: str,
+            category: str,
+            awaitable: Awaitable[T],
+            totals: dict[str, float],
+            threshold: float = 0.001
+    ) -> T:
+        return await awaitable
+
+    def lane(self, label: str = "download") -> _NullSpan:
+        return _null_span
+
+    def merge(self, events: list[dict[str, Any]], epoch: float) -> None:
+        return None
+
+    def write(self, path: Union[str, pathlib.Path]) -> None:
+        logger.warning("Tracing was not enabled, no trace to write")
+
@@ -40,24 +40,24 @@ async def upload(
             filepath.as_posix(),
             total=source_size
         )
-    async with httpx.AsyncClient() as client:
-        async with aiofiles.open(filepath, mode='rb') as f:
-            tasks.extend(
-                upload_chunk(
-                    app=app,
-                    client=client,
-                    file_buffer=f,
-                    file_path=filepath,
-                    chunk_number=chunk_number,
-                    bytes_per_chunk=bytes_per_chunk,
-                    source_size=source_size,
-                    url=url,
-                    auth_header=auth_header,
-                    progress=progress
-                )
-                for chunk_number, url in enumerate(urls)
+    client = app.session.client()
+    async with aiofiles.open(filepath, mode='rb') as f:
+        tasks.extend(
+            upload_chunk(
+                app=app,
+                client=client,
+                file_buffer=f,
+                file_path=filepath,
+                chunk_number=chunk_number,
+                bytes_per_chunk=bytes_per_chunk,
+                source_size=source_size,
+                url=url,
+                auth_header=auth_header,
+                progress=progress
             )
-            await asyncio.gather(*tasks)
+            for chunk_number, url in enumerate(urls)
+        )
+        await asyncio.gather(*tasks)
     parts = part_info[filepath].copy()
     # grid needs this list sorted by part number
     parts.sort(key=lambda part: part["PartNumber"])
@@ -102,6 +102,7 @@ async def upload_chunk(
     headers = {
         'Content-Length': f'{bytes_to_read}'
     }
+    await app.throttle.consume(url.host, bytes_to_read)
     
     attempt = 0
     while attempt < 10:
@@ -120,6 +121,7 @@ async def upload_chunk(
             break
     else:
         raise httpx.ReadError
+    app.metrics.record_upload(url.host, bytes_to_read)
 
     if app.progress and progress is not None:
         old_progress = progress.upload_progress[file_path.as_posix()]
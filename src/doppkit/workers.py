@@ -0,0 +1,526 @@
+__all__ = ["ProcessPool"]
+
+import asyncio
+import collections
+import itertools
+import logging
+import logging.handlers
+import math
+import multiprocessing
+import pathlib
+import pickle
+import queue
+import signal
+import threading
+
+from typing import Any, Callable, Optional, TYPE_CHECKING, Union
+
+import httpx
+
+from .app import Application
+from .cache import Content, DownloadUrl, Progress, _cache_retrying, store_keys
+from .metrics import Metrics
+from .progress import CoalescedProgress
+from .store import open_store
+from .trace import Tracer
+from .writer import WriterPool
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from multiprocessing.synchronize import Event
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks for work, for the pool being stopped and for workers
+# that died
+POLL_INTERVAL = 0.1
+
+# seconds between messages with the bytes a worker downloaded
+METRICS_INTERVAL = 0.5
+
+# seconds cancelled workers get to clean up before they are terminated
+EXIT_TIMEOUT = 10.0
+
+Result = Union[Content, Exception, httpx.Response]
+
+
+def _worker_options(app: Application, processes: int) -> tuple[dict[str, Any], tuple]:
+    """
+    Arguments of the application of each worker and its share of the bandwidth
+    limits, the download slots, writer threads and retry budget are split
+    between the workers
+    """
+    def share(value: int) -> int:
+        return max(1, math.ceil(value / processes))
+
+    def divide(rate: Optional[float]) -> Optional[float]:
+        return rate / processes if rate is not None else None
+
+    options = dict(
+        token=app.token,
+        url=app.url,
+        log_level=app.log_level,
+        run_method=app.run_method,
+        threads=share(app.threads),
+        disable_ssl_verification=app.disable_ssl_verification,
+        override=app.override,
+        directory=app.directory,
+        segments=app.segments,
+        segment_threshold=app.segment_threshold,
+        store=app.store,
+        store_size=app.store_size,
+        incremental=app.incremental,
+        shard=str(app.shard) if app.shard else None,
+        shard_balance=app.shard_balance,
+        trace=app.tracer.enabled,
+        adaptive_concurrency=app.limit.adaptive,
+        retries=app.retry.attempts,
+        retry_budget=math.ceil(max(0, app.retry.budget - app.retry.retries) / processes),
+        checksums=app.checksums,
+        sha256=app.sha256,
+        http2=app.http2,
+        writer_threads=share(app.writer.threads),
+        write_buffer=app.writer.buffer_size,
+        fsync=app.writer.fsync,
+    )
+    throttle = app.throttle
+    limits = (
+        divide(throttle.rate),
+        divide(throttle.host_rate),
+        [entry._replace(rate=divide(entry.rate)) for entry in throttle.schedule],
+    )
+    return options, limits
+
+
+def _portable(result: Result) -> Result:
+    """result, or an error describing it if it cannot be sent between processes"""
+    try:
+        pickle.loads(pickle.dumps(result))
+    except Exception:
+        return RuntimeError(f"{type(result).__name__}: {result}")
+    return result
+
+
+class _LogHandler(logging.handlers.QueueHandler):
+    """Sends the log records of a worker to the pool, to be handled there"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put(("log", record))
+
+
+class _WorkerProgress:
+    """Progress of a worker, sent to the pool"""
+
+    def __init__(self, send: Callable[[tuple], None]) -> None:
+        self.send = send
+
+    def create_task(self, name: str, source: str, total: int) -> None:
+        self.send(("progress", "create_task", (name, source, total)))
+
+    def update(self, name: str, source: str, completed: int) -> None:
+        self.send(("progress", "update", (name, source, completed)))
+
+    def complete_task(self, name: str, source: str) -> None:
+        self.send(("progress", "complete_task", (name, source)))
+
+    def update_segment(
+            self, name: str, source: str, start: int, total: int, completed: int
+    ) -> None:
+        self.send(("progress", "update_segment", (name, source, start, total, completed)))
+
+
+class _WorkerMetrics(Metrics):
+    """
+    Metrics of a worker, the bytes downloaded and retries are collected and
+    sent to the pool by :meth:`flush`, file timings are sent as they happen.
+    Results are counted by the pool.
+    """
+
+    def __init__(self, app: Application, send: Callable[[tuple], None]) -> None:
+        super().__init__(app)
+        self._send = send
+
+    def record_file(self, name: str, nbytes: int, ttfb: float, seconds: float) -> None:
+        self._send(("file", name, nbytes, ttfb, seconds))
+
+    def flush(self) -> None:
+        downloaded, self.downloaded = self.downloaded, collections.Counter()
+        reasons = dict(self._app.retry.reasons)
+        self._app.retry.reasons.clear()
+        if downloaded or reasons:
+            self._send(("metrics", dict(downloaded), reasons))
+
+
+class _WorkerTracer(Tracer):
+    """
+    Tracer of a worker, the spans recorded are sent to the pool by
+    :meth:`flush` to be merged into its tracer
+    """
+
+    def __init__(self, index: int, send: Callable[[tuple], None]) -> None:
+        super().__init__(name=f"doppkit-worker-{index}")
+        self._send = send
+
+    def flush(self) -> None:
+        events, self.events = self.events, []
+        if events:
+            self._send(("trace", self.epoch, events))
+
+
+class _WorkerWriter(WriterPool):
+    """
+    Writer pool of a worker, files to flush at the end are sent to the pool so
+    they are flushed with the others when the command is done
+    """
+
+    def __init__(self, send: Callable[[tuple], None], pool: WriterPool) -> None:
+        super().__init__(threads=pool.threads, buffer_size=pool.buffer_size, fsync=pool.fsync)
+        self._send = send
+
+    def written(self, path: pathlib.Path) -> None:
+        if self.fsync == "end":
+            self._send(("written", path))
+
+
+async def _serve(
+        index: int,
+        options: dict[str, Any],
+        limits: tuple,
+        headers: dict[str, str],
+        tasks: multiprocessing.Queue,
+        results: multiprocessing.Queue,
+        stop: 'Event'
+) -> None:
+    send = results.put
+    app = Application(**options)
+    app.throttle.configure(*limits)
+    app.metrics = _WorkerMetrics(app, send)
+    if app.tracer.enabled:
+        app.tracer = _WorkerTracer(index, send)
+    app.writer = _WorkerWriter(send, app.writer)
+    progress = CoalescedProgress(_WorkerProgress(send))
+    client = app.session.client()
+    loop = asyncio.get_running_loop()
+    running: set[asyncio.Task] = set()
+
+    async def download(task_id: int, url: DownloadUrl) -> None:
+        result = await _cache_retrying(app, url, headers, client, progress=progress)
+        send(("result", index, task_id, _portable(result)))
+
+    async def receive() -> None:
+        # the pool sends no more files than there are download slots
+        while True:
+            while True:
+                # a thread blocked for good would keep a stopped worker alive
+                try:
+                    task = await loop.run_in_executor(None, tasks.get, True, POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    continue
+            if task is None:
+                break
+            task_id, url = task
+            task = asyncio.create_task(download(task_id, url))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.gather(*list(running))
+
+    async def watch() -> None:
+        parent = multiprocessing.parent_process()
+        while not stop.is_set():
+            if parent is not None and not parent.is_alive():
+                logger.warning("doppkit exited, cancelling downloads")
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            app.metrics.flush()
+            if app.tracer.enabled:
+                app.tracer.flush()
+
+    receiving = asyncio.create_task(receive())
+    watching = asyncio.create_task(watch())
+    reporting = asyncio.create_task(report())
+    try:
+        await asyncio.wait({receiving, watching}, return_when=asyncio.FIRST_COMPLETED)
+        if not receiving.done():
+            receiving.cancel()
+            for task in list(running):
+                task.cancel()
+            await asyncio.gather(receiving, *list(running), return_exceptions=True)
+        else:
+            receiving.result()
+    finally:
+        watching.cancel()
+        reporting.cancel()
+        progress.close()
+        app.metrics.flush()
+        if app.tracer.enabled:
+            app.tracer.flush()
+        await app.session.aclose()
+        app.writer.close()
+
+
+def _work(
+        index: int,
+        options: dict[str, Any],
+        limits: tuple,
+        headers: dict[str, str],
+        level: int,
+        tasks: multiprocessing.Queue,
+        results: multiprocessing.Queue,
+        stop: 'Event'
+) -> None:
+    """Entry point of a worker process"""
+    # interrupts are handled by the pool, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    root = logging.getLogger()
+    root.handlers = [_LogHandler(results)]
+    root.setLevel(level)
+    try:
+        asyncio.run(_serve(index, options, limits, headers, tasks, results, stop))
+    except Exception:
+        logger.exception(f"Download worker {index} failed")
+    finally:
+        results.put(("exit", index))
+
+
+class ProcessPool:
+    """
+    Worker processes downloading files for one call of
+    :func:`~doppkit.cache.cache_iter`, to use more than one CPU for TLS and
+    chunk handling.
+
+    Each of the ``app.processes`` workers runs its own event loop with its own
+    connection pool and writer pool, the shard and trace settings of ``app``,
+    and an equal share of ``app.threads`` download slots, the bandwidth limits
+    and the remaining retry budget.  Files are sent to the worker with the most
+    slots free, over a queue of its own so the files a worker was given are
+    known if it dies.  Workers send progress, bytes downloaded, file timings,
+    trace spans, files to flush, log records and the result of each file back
+    over one queue, which are passed on to progress, ``app.metrics``,
+    ``app.tracer``, ``app.writer`` and logging in this process.
+
+    Results are what :func:`~doppkit.cache.cache_url` returned in the worker,
+    after retries.  Results that cannot be pickled, and files lost to a worker
+    that died, are replaced by a RuntimeError describing them.  Workers are
+    started with the first download and stopped by :meth:`close`.
+
+    Parameters
+    ----------
+    app
+        doppkit application the workers copy their settings from
+    headers
+        Headers sent with every download
+    progress
+        Progress to pass the progress of the workers on to
+    """
+
+    def __init__(
+            self,
+            app: Application,
+            headers: dict[str, str],
+            progress: Optional[Progress] = None
+    ) -> None:
+        self.app = app
+        self.headers = headers
+        self.progress = progress
+        self.processes = max(1, app.processes)
+        self._context = multiprocessing.get_context("spawn")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: list['BaseProcess'] = []
+        self._receiver: Optional[threading.Thread] = None
+        self._ids = itertools.count()
+        self._futures: dict[int, asyncio.Future] = {}
+        # files waiting for a worker with a download slot free
+        self._pending: collections.deque[tuple[int, DownloadUrl]] = collections.deque()
+        # files each live worker was given and did not return yet
+        self._assigned: dict[int, set[int]] = {}
+        self._queues: list[multiprocessing.Queue] = []
+        self._closed = False
+
+    def __repr__(self) -> str:
+        return f"ProcessPool {len(self._assigned)}/{self.processes} workers, {len(self._futures)} files"
+
+    def _start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._results = self._context.Queue()
+        self._stop = self._context.Event()
+        options, limits = _worker_options(self.app, self.processes)
+        self._slots = options["threads"]
+        level = logging.getLogger("doppkit").getEffectiveLevel()
+        for index in range(self.processes):
+            tasks = self._context.Queue()
+            process = self._context.Process(
+                target=_work,
+                args=(
+                    index, options, limits, self.headers, level,
+                    tasks, self._results, self._stop
+                ),
+                name=f"doppkit-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self._workers.append(process)
+            self._queues.append(tasks)
+            self._assigned[index] = set()
+        self._receiver = threading.Thread(
+            target=self._receive, name="doppkit-workers", daemon=True
+        )
+        self._receiver.start()
+        logger.debug(f"Started {self.processes} download worker processes")
+
+    async def download(self, url: DownloadUrl) -> Result:
+        """Have a worker download url, returning its result"""
+        if self._closed:
+            raise RuntimeError("Unable to download with a closed process pool")
+        if not self._workers:
+            self._start()
+        with self.app.metrics.busy("transfer"):
+            if self.app.override:
+                return await self._submit(url)
+            # the store keeps duplicates from downloading at the same time only
+            # within a process
+            async with open_store(self.app).reserve(store_keys(url)[-1]):
+                return await self._submit(url)
+
+    async def _submit(self, url: DownloadUrl) -> Result:
+        if not self._assigned:
+            return RuntimeError("No download worker processes left")
+        task_id = next(self._ids)
+        future = self._loop.create_future()
+        self._futures[task_id] = future
+        self._pending.append((task_id, url))
+        self._assign()
+        try:
+            return await future
+        finally:
+            del self._futures[task_id]
+
+    def _assign(self) -> None:
+        """Send pending files to the live workers with download slots free"""
+        while self._pending and self._assigned:
+            index = min(self._assigned, key=lambda worker: len(self._assigned[worker]))
+            if len(self._assigned[index]) >= self._slots:
+                break
+            task_id, url = self._pending.popleft()
+            if task_id not in self._futures:
+                # whoever waited for it was cancelled
+                continue
+            self._assigned[index].add(task_id)
+            self._queues[index].put((task_id, url))
+
+    def _resolve(self, task_id: int, result: Result) -> None:
+        future = self._futures.get(task_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _receive(self) -> None:
+        """Pass messages from the workers on to the event loop, run in a thread"""
+        exited: set[int] = set()
+        while True:
+            for index, process in enumerate(self._workers):
+                if index not in exited and process.exitcode is not None:
+                    exited.add(index)
+                    # everything a worker sent is queued by the time it
+                    # exited, so its results are dispatched before the files
+                    # it did not return are failed
+                    self._results.put(("exit", index, process.exitcode))
+            try:
+                message = self._results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if message is None:
+                break
+            self._loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message: tuple) -> None:
+        kind = message[0]
+        if kind == "progress":
+            _, method, args = message
+            handler = getattr(self.progress, method, None)
+            if handler is not None:
+                handler(*args)
+        elif kind == "metrics":
+            _, downloaded, reasons = message
+            for host, nbytes in downloaded.items():
+                self.app.metrics.record_download(host, nbytes)
+            self.app.retry.reasons.update(reasons)
+            self.app.retry.retries += sum(reasons.values())
+        elif kind == "trace":
+            _, epoch, events = message
+            self.app.tracer.merge(events, epoch)
+        elif kind == "file":
+            self.app.metrics.record_file(*message[1:])
+        elif kind == "written":
+            self.app.writer.written(message[1])
+        elif kind == "log":
+            record = message[1]
+            target = logging.getLogger(record.name)
+            if target.isEnabledFor(record.levelno):
+                target.handle(record)
+        elif kind == "result":
+            _, index, task_id, result = message
+            self._assigned.get(index, set()).discard(task_id)
+            self._resolve(task_id, result)
+            self._assign()
+        elif kind == "exit":
+            self._exited(*message[1:])
+
+    def _exited(self, index: int, exitcode: Optional[int] = None) -> None:
+        if index not in self._assigned:
+            return None
+        lost = self._assigned.pop(index)
+        if lost:
+            reason = f"Download worker {index} exited" + (
+                f" with code {exitcode}" if exitcode is not None else ""
+            )
+            if not self._closed:
+                logger.error(f"{reason}, failing the {len(lost)} files it was downloading")
+            for task_id in lost:
+                self._resolve(task_id, RuntimeError(reason))
+        if self._assigned:
+            self._assign()
+        else:
+            # nobody is left to take the files still queued
+            for task_id in list(self._futures):
+                self._resolve(task_id, RuntimeError("No download worker processes left"))
+
+    def _join(self, timeout: Optional[float]) -> None:
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating it")
+                process.terminate()
+                process.join()
+
+    async def close(self, cancel: bool = False) -> None:
+        """
+        Stop the workers once they are done with the files they took and have
+        flushed their writes, or right away if cancel is True
+        """
+        if self._closed:
+            return None
+        self._closed = True
+        if not self._workers:
+            return None
+        if cancel:
+            self._stop.set()
+            for tasks in self._queues:
+                tasks.cancel_join_thread()
+        else:
+            for tasks in self._queues:
+                tasks.put(None)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._join, EXIT_TIMEOUT if cancel else None)
+        self._results.put(None)
+        await loop.run_in_executor(None, self._receiver.join)
+        # messages received before the workers exited were dispatched by now
+        for index, process in enumerate(self._workers):
+            self._exited(index, process.exitcode)
+        for tasks in self._queues:
+            tasks.close()
+        self._results.close()
+        logger.debug(f"Stopped {self.processes} download worker processes")
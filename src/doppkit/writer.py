@@ -0,0 +1,328 @@
+__all__ = ["WriterPool", "FileWriter"]
+
+import asyncio
+import concurrent.futures
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import sys
+
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# bytes collected from the network before they are written in one go
+WRITE_BUFFER = 1024 * 1024
+
+# writes end on multiples of this many bytes into the file, the page size
+ALIGNMENT = 4096
+
+FSYNC_MODES = ("none", "file", "end")
+
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+# fallocate(2) mode reserving space without changing the size of the file
+FALLOC_FL_KEEP_SIZE = 0x01
+
+
+def _load_fallocate():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        function = getattr(libc, "fallocate64", None) or libc.fallocate
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    function.restype = ctypes.c_int
+    return function
+
+
+_fallocate = _load_fallocate()
+
+
+def _pwrite(fd: int, data: Union[bytes, bytearray], offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # only this file's single outstanding write moves its position
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _preallocate(fd: int, offset: int, length: int) -> None:
+    """Reserve length bytes from offset, extending the file to offset + length"""
+    if length <= 0:
+        return None
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, offset, length)
+            return None
+        except OSError as e:
+            # not every filesystem supports it
+            logger.debug(f"posix_fallocate failed with {e}, extending the file instead")
+    os.ftruncate(fd, offset + length)
+
+
+def _reserve(fd: int, offset: int, length: int) -> None:
+    """
+    Reserve length bytes from offset without extending the file, so its size
+    keeps telling how much was written even if the process is killed
+    """
+    if length <= 0 or _fallocate is None:
+        return None
+    if _fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length) != 0:
+        # not every filesystem supports it
+        error = ctypes.get_errno()
+        logger.debug(f"fallocate failed with {os.strerror(error)}, not reserving space")
+
+
+def _fsync_path(path: pathlib.Path) -> None:
+    # Windows only flushes files opened for writing
+    fd = os.open(path, os.O_RDWR | _O_BINARY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriterPool:
+    """
+    Threads that write downloads to disk, shared by every download of an
+    application.
+
+    Parameters
+    ----------
+    threads
+        Number of writer threads, which bounds the number of concurrent disk
+        operations, by default 4
+    buffer_size
+        Bytes collected from the network before they are written, by default
+        1 MiB
+    fsync
+        When to flush written files to stable storage, "none" to leave it to
+        the operating system, "file" to flush each file before it is moved into
+        place, or "end" to flush all of them when :meth:`sync` is called once
+        the command downloading them is done, by default "none"
+    """
+
+    def __init__(
+            self,
+            threads: int = 4,
+            buffer_size: int = WRITE_BUFFER,
+            fsync: str = "none"
+    ) -> None:
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_MODES)}, not {fsync!r}")
+        self.threads = max(1, threads)
+        self.buffer_size = max(ALIGNMENT, buffer_size)
+        self.fsync = fsync
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._unsynced: list[pathlib.Path] = []
+
+    def __repr__(self) -> str:
+        return f"WriterPool {self.threads} threads, {self.buffer_size} byte buffers, fsync {self.fsync}"
+
+    @property
+    def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="doppkit-writer"
+            )
+        return self._executor
+
+    async def run(self, function, *args):
+        """Call function(*args) in a writer thread"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def open(
+            self,
+            path: pathlib.Path,
+            offset: int = 0,
+            size: Optional[int] = None,
+            segment: bool = False
+    ) -> 'FileWriter':
+        """
+        Writer of the bytes of path starting at offset, see :class:`FileWriter`
+        """
+        return FileWriter(self, path, offset=offset, size=size, segment=segment)
+
+    async def allocate(self, path: pathlib.Path, size: int) -> None:
+        """Create path with size bytes reserved, for segments to be written into"""
+        def allocate() -> None:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY, 0o666)
+            try:
+                _preallocate(fd, 0, size)
+            finally:
+                os.close(fd)
+        await self.run(allocate)
+
+    def written(self, path: pathlib.Path) -> None:
+        """Note that path was written and moved into place, to flush it in :meth:`sync`"""
+        if self.fsync == "end":
+            self._unsynced.append(path)
+
+    async def sync(self) -> None:
+        """Flush the files written since the last call, if fsync is "end" """
+        paths, self._unsynced = self._unsynced, []
+        if not paths:
+            return None
+        logger.debug(f"Flushing {len(paths)} files to disk")
+        results = await asyncio.gather(
+            *(self.run(_fsync_path, path) for path in paths),
+            return_exceptions=True
+        )
+        for path, result in zip(paths, results):
+            if isinstance(result, OSError):
+                logger.warning(f"Unable to flush {path} to disk: {result}")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class FileWriter:
+    """
+    Asynchronous context manager collecting chunks written to it into large
+    page aligned positional writes, run by the writer pool while the next
+    chunks are received.  At most one write per file is in flight, bounding the
+    memory used to two buffers per file.
+
+    Unless segment is True the file is truncated at offset (or created) and,
+    if size is known, disk space up to size is reserved where the platform
+    allows it without changing the size of the file, so an interrupted
+    download, even a killed one, can be resumed from its length.  Segments
+    write into a file that already has its final size, see
+    :meth:`WriterPool.allocate`.
+
+    Parameters
+    ----------
+    pool
+        Writer pool running the writes
+    path
+        File to write to
+    offset
+        Position in the file the first chunk is written at
+    size
+        Expected final size of the file, if known
+    segment
+        Write into part of an existing file, leaving the rest of it untouched
+    """
+
+    def __init__(
+            self,
+            pool: WriterPool,
+            path: pathlib.Path,
+            offset: int = 0,
+            size: Optional[int] = None,
+            segment: bool = False
+    ) -> None:
+        self.pool = pool
+        self.path = path
+        self.position = offset
+        self.size = size
+        self.segment = segment
+        self._fd: Optional[int] = None
+        self._buffer = bytearray()
+        # the write (or preallocation) in flight and where it ends
+        self._pending: Optional[concurrent.futures.Future] = None
+        self._pending_end = offset
+        # end of the bytes known to be in the file
+        self._end = offset
+
+    def __repr__(self) -> str:
+        return f"FileWriter {self.path} at {self.position}"
+
+    async def __aenter__(self) -> 'FileWriter':
+        flags = os.O_WRONLY | _O_BINARY
+        if not self.segment:
+            flags |= os.O_CREAT
+        offset, segment = self.position, self.segment
+
+        def open_() -> int:
+            fd = os.open(self.path, flags, 0o666)
+            if not segment:
+                try:
+                    os.ftruncate(fd, offset)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            return fd
+
+        opening = self.pool.executor.submit(open_)
+        try:
+            self._fd = await asyncio.wrap_future(opening)
+        except asyncio.CancelledError:
+            opening.add_done_callback(
+                lambda future: future.exception() is None and os.close(future.result())
+            )
+            raise
+        if not segment and self.size is not None and self.size > offset:
+            # runs ahead of the first write and is waited for like one
+            self._pending = self.pool.executor.submit(
+                _reserve, self._fd, offset, self.size - offset
+            )
+        return self
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        self.position += len(chunk)
+        if len(self._buffer) >= self.pool.buffer_size:
+            await self._flush(final=False)
+
+    async def _wait(self) -> None:
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+            self._pending = None
+            self._end = self._pending_end
+
+    async def _flush(self, final: bool) -> None:
+        await self._wait()
+        cut = len(self._buffer)
+        if not final:
+            # keep the tail so the next write starts on a page boundary
+            cut -= self.position % ALIGNMENT
+        if cut <= 0:
+            return None
+        data = self._buffer
+        self._buffer = bytearray(data[cut:])
+        del data[cut:]
+        offset = self.position - len(self._buffer) - len(data)
+        self._pending_end = offset + len(data)
+        self._pending = self.pool.executor.submit(_pwrite, self._fd, data, offset)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            # bytes received before a failure are still good to resume from
+            await self._flush(final=True)
+        finally:
+            fd, self._fd = self._fd, None
+            pending, self._pending = self._pending, None
+            end, pending_end = self._end, self._pending_end
+            segment, fsync = self.segment, self.pool.fsync == "file"
+
+            def close() -> None:
+                nonlocal end
+                try:
+                    # the file must not be cut while a write to it is in
+                    # flight, even if the task waiting for it was cancelled
+                    if pending is not None:
+                        concurrent.futures.wait([pending])
+                        if pending.exception() is None:
+                            end = pending_end
+                    if not segment:
+                        # drop what failed to be written
+                        os.ftruncate(fd, end)
+                    if fsync:
+                        os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+            await asyncio.wrap_future(self.pool.executor.submit(close))
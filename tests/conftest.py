@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import pathlib
+
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import pytest
+
+from benchmarks.profiles import Profile
+from benchmarks.server import FakeGrid, content
+from doppkit.app import Application
+from doppkit.cache import DownloadUrl
+
+T = TypeVar("T")
+
+# one export of two files, small enough to download in a blink
+PROFILE = Profile("tests", exports=1, files_per_export=2, file_size=300 * 1024)
+
+
+class Served:
+    """The fake GRiD server of a test, recording the requests made to storage"""
+
+    def __init__(self, grid: FakeGrid, directory: pathlib.Path) -> None:
+        self.grid = grid
+        self.directory = directory
+        self.storage: list[dict[str, str]] = []
+        self.apps: list[Application] = []
+        route = grid.route
+
+        async def recording(method: str, target: str, headers: dict[str, str], body: bytes):
+            if target.startswith("/storage/"):
+                self.storage.append(headers)
+            return await route(method, target, headers, body)
+
+        grid.route = recording
+
+    def url(self, index: int = 0, export_id: int = 1, **fields: Any) -> DownloadUrl:
+        """Download of file index of an export, as Grid.get_exports lists it"""
+        name = f"tile-{index}.bin"
+        values = dict(
+            url=f"{self.grid.base}/grid/api/v4/exportfiles/{export_id}/{index}/download",
+            name=name,
+            save_path=f"export-{export_id}/tiles/{name}",
+            total=self.grid.profile.file_size,
+            file_id=export_id * 1_000_000 + index,
+        )
+        values.update(fields)
+        return DownloadUrl(**values)
+
+    def app(self, **options: Any) -> Application:
+        options.setdefault("directory", self.directory)
+        app = Application(
+            token="token",
+            url=f"{self.grid.base}/grid",
+            log_level=logging.DEBUG,
+            **options
+        )
+        self.apps.append(app)
+        return app
+
+    async def contents(self, size: Optional[int] = None) -> bytes:
+        """Contents of the files the server hands out, or of their first size bytes"""
+        if size is None:
+            size = self.grid.profile.file_size
+        return b"".join([bytes(chunk) async for chunk in content(0, size)])
+
+    async def close(self) -> None:
+        for app in self.apps:
+            await app.session.aclose()
+
+
+@pytest.fixture
+def serve(tmp_path) -> Callable[[Callable[[Served], Awaitable[T]]], T]:
+    """Run a test coroutine against a fake GRiD server of its own"""
+    def run(test: Callable[[Served], Awaitable[T]], profile: Profile = PROFILE) -> T:
+        async def main() -> T:
+            grid = FakeGrid(profile)
+            server = await grid.start()
+            served = Served(grid, tmp_path / "downloads")
+            try:
+                return await test(served)
+            finally:
+                await served.close()
+                server.close()
+                await server.wait_closed()
+
+        return asyncio.run(main())
+
+    return run
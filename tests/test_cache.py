@@ -0,0 +1,266 @@
+import datetime
+import json
+import os
+
+from benchmarks.server import Response, content, etag
+from doppkit import store
+from doppkit.cache import VALIDATOR_SUFFIX, cache, needs_download, part_path
+from doppkit.integrity import MANIFEST_NAME
+
+
+def manifest(served, export_id: int = 1) -> list[dict]:
+    path = served.directory / f"export-{export_id}" / MANIFEST_NAME
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def no_link(monkeypatch) -> None:
+    """Make the store fall back to copies, as on another filesystem"""
+    def fail(*args, **kwargs):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(store.os, "link", fail)
+    monkeypatch.setattr(store, "_reflink", fail)
+
+
+def interrupted(served, url, contents: bytes, validator=None):
+    """Leave behind the .part file, and validator, of an interrupted download"""
+    partial = part_path(served.directory / url.save_path)
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    partial.write_bytes(contents)
+    if validator is not None:
+        partial.with_name(partial.name + VALIDATOR_SUFFIX).write_text(validator)
+    return partial
+
+
+def test_download(serve):
+    async def test(served):
+        url = served.url()
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        assert not part_path(result.target).exists()
+        [entry] = manifest(served)
+        assert entry["path"] == url.save_path
+        assert entry["size"] == url.total
+        assert entry["verified"] is True
+        [request] = served.storage
+        assert "range" not in request
+
+    serve(test)
+
+
+def test_resume_unchanged_file(serve):
+    async def test(served):
+        url = served.url()
+        partial = interrupted(
+            served, url, await served.contents(100_000), validator=etag(url.total)
+        )
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        [request] = served.storage
+        assert request["range"] == "bytes=100000-"
+        assert request["if-range"] == etag(url.total)
+        # the bytes already there were hashed along with the rest
+        assert manifest(served)[0]["verified"] is True
+        assert not partial.with_name(partial.name + VALIDATOR_SUFFIX).exists()
+
+    serve(test)
+
+
+def test_resume_without_validator(serve):
+    async def test(served):
+        url = served.url()
+        interrupted(served, url, await served.contents(100_000))
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        [request] = served.storage
+        assert request["range"] == "bytes=100000-"
+        assert "if-range" not in request
+
+    serve(test)
+
+
+def test_resume_restarts_when_file_changed(serve):
+    async def test(served):
+        url = served.url()
+        # the .part is of an older version of the file
+        interrupted(served, url, b"\0" * 100_000, validator='"older version"')
+        [result] = await cache(served.app(), [url], {})
+        # the server sent all of the new version instead of the rest of the old
+        assert result.target.read_bytes() == await served.contents()
+        [request] = served.storage
+        assert request["if-range"] == '"older version"'
+        assert manifest(served)[0]["verified"] is True
+
+    serve(test)
+
+
+def test_resume_restarts_without_range_support(serve):
+    async def test(served):
+        storage_get = served.grid.storage_get
+        served.grid.storage_get = lambda size, headers: storage_get(
+            size, {name: value for name, value in headers.items() if name != "range"}
+        )
+        url = served.url()
+        interrupted(served, url, b"\0" * 100_000)
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        assert len(served.storage) == 1
+
+    serve(test)
+
+
+def test_resume_restarts_on_wrong_range(serve):
+    async def test(served):
+        storage_get = served.grid.storage_get
+
+        def wrong_range(size, headers):
+            if "range" not in headers:
+                return storage_get(size, headers)
+            # claims to be partial but starts over
+            return Response(
+                206,
+                content(0, size),
+                headers={"Content-Range": f"bytes 0-{size - 1}/{size}"},
+                length=size
+            )
+
+        served.grid.storage_get = wrong_range
+        url = served.url()
+        interrupted(served, url, b"\0" * 100_000)
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        first, second = served.storage
+        assert first["range"] == "bytes=100000-"
+        assert "range" not in second
+
+    serve(test)
+
+
+def test_oversized_part_is_discarded(serve):
+    async def test(served):
+        url = served.url()
+        interrupted(served, url, b"\0" * (url.total + 1))
+        [result] = await cache(served.app(), [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        [request] = served.storage
+        assert "range" not in request
+
+    serve(test)
+
+
+def test_shared_file_restored_from_store(serve):
+    async def test(served):
+        app = served.app()
+        # the same product file, part of two exports
+        first = served.url(export_id=1, file_id=7)
+        second = served.url(export_id=2, file_id=7)
+        await cache(app, [first], {})
+        [result] = await cache(app, [second], {})
+        assert result.target == served.directory / second.save_path
+        assert result.target.read_bytes() == await served.contents()
+        assert len(served.storage) == 1
+        assert manifest(served, export_id=2)[0]["restored"] == "hardlink"
+
+    serve(test)
+
+
+def test_store_without_size_does_not_copy(serve, monkeypatch):
+    no_link(monkeypatch)
+
+    async def test(served):
+        app = served.app()
+        await cache(app, [served.url(export_id=1, file_id=7)], {})
+        await cache(app, [served.url(export_id=2, file_id=7)], {})
+        assert len(served.storage) == 2
+        assert store.open_store(app).size() == 0
+
+    serve(test)
+
+
+def test_store_with_size_copies(serve, monkeypatch):
+    no_link(monkeypatch)
+
+    async def test(served):
+        app = served.app(store_size=10 * 1024 ** 2)
+        await cache(app, [served.url(export_id=1, file_id=7)], {})
+        [result] = await cache(app, [served.url(export_id=2, file_id=7)], {})
+        assert len(served.storage) == 1
+        assert result.target.read_bytes() == await served.contents()
+        assert manifest(served, export_id=2)[0]["restored"] == "copy"
+
+    serve(test)
+
+
+def test_refresh_skips_store_objects_older_than_export(serve, monkeypatch):
+    no_link(monkeypatch)
+
+    async def test(served):
+        app = served.app(store_size=10 * 1024 ** 2, incremental=True)
+        [result] = await cache(app, [served.url()], {})
+        # the export was started again after the file was downloaded
+        since = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=1)
+        os.utime(result.target, (0, 0))
+        url = served.url(since=since)
+        assert needs_download(app, url)
+        await cache(app, [url], {})
+        assert len(served.storage) == 2
+
+    serve(test)
+
+
+def test_refresh_restores_store_objects_newer_than_export(serve, monkeypatch):
+    no_link(monkeypatch)
+
+    async def test(served):
+        app = served.app(store_size=10 * 1024 ** 2, incremental=True)
+        since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        url = served.url(since=since)
+        [result] = await cache(app, [url], {})
+        # only the file on disk is out of date
+        os.utime(result.target, (0, 0))
+        assert needs_download(app, url)
+        [result] = await cache(app, [url], {})
+        assert len(served.storage) == 1
+        assert result.target.read_bytes() == await served.contents()
+        assert not needs_download(app, url)
+
+    serve(test)
+
+
+def test_incremental_fetches_changed_files(serve):
+    async def test(served):
+        app = served.app(incremental=True)
+        changed, unchanged = served.url(0), served.url(1)
+        await cache(app, [changed, unchanged], {})
+        assert not needs_download(app, changed)
+        path = served.directory / changed.save_path
+        with open(path, "r+b") as f:
+            f.write(b"changed")
+        entry = manifest(served)[0]
+        os.utime(path, (entry["time"] + 1, entry["time"] + 1))
+        assert needs_download(app, changed)
+        assert not needs_download(app, unchanged)
+        # a file linked into the store changes along with it
+        assert store.open_store(app).lookup([f"url:{changed.url}"]) is None
+        [result] = await cache(app, [changed], {})
+        assert result.target.read_bytes() == await served.contents()
+        assert not needs_download(app, changed)
+
+    serve(test)
+
+
+def test_incremental_fetches_short_files_from_where_they_end(serve):
+    async def test(served):
+        app = served.app(incremental=True)
+        url = served.url()
+        path = served.directory / url.save_path
+        path.parent.mkdir(parents=True)
+        path.write_bytes(await served.contents(50_000))
+        assert needs_download(app, url)
+        assert part_path(path).exists()
+        [result] = await cache(app, [url], {})
+        assert result.target.read_bytes() == await served.contents()
+        [request] = served.storage
+        assert request["range"] == "bytes=50000-"
+
+    serve(test)
@@ -0,0 +1,164 @@
+import asyncio
+
+from typing import Awaitable, Callable
+
+import pytest
+
+from doppkit import concurrency
+from doppkit.concurrency import AdaptiveLimit
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(concurrency.time, "monotonic", clock)
+    return clock
+
+
+def run(
+        test: Callable[[AdaptiveLimit], Awaitable[None]],
+        limit: AdaptiveLimit,
+        clock: Clock
+) -> None:
+    """Run test with more downloads waiting for limit than it can ever allow"""
+    async def main() -> None:
+        waiting = [asyncio.create_task(limit.acquire()) for _ in range(limit.maximum + 5)]
+        await asyncio.sleep(0)
+        # slots were still being taken during the first interval, it says
+        # nothing about the limit
+        window(limit, clock, 0)
+        try:
+            await test(limit)
+        finally:
+            for task in waiting:
+                task.cancel()
+
+    asyncio.run(main())
+
+
+def window(limit: AdaptiveLimit, clock: Clock, nbytes: int) -> None:
+    """Transfer nbytes over one measuring interval"""
+    clock.now += limit.interval
+    limit.record(nbytes)
+
+
+def test_limit_grows_while_throughput_improves(clock):
+    async def test(limit: AdaptiveLimit) -> None:
+        window(limit, clock, 1000)
+        assert limit.limit == 3
+        assert limit.in_flight == 3
+        window(limit, clock, 2000)
+        assert limit.limit == 4
+        window(limit, clock, 3000)
+        assert limit.limit == 5
+
+    run(test, AdaptiveLimit(10, initial=2), clock)
+
+
+def test_limit_holds_while_throughput_is_flat(clock):
+    async def test(limit: AdaptiveLimit) -> None:
+        window(limit, clock, 1000)
+        window(limit, clock, 1010)
+        assert limit.limit == 3
+
+    run(test, AdaptiveLimit(10, initial=2), clock)
+
+
+def test_limit_shrinks_when_throughput_degrades(clock):
+    async def test(limit: AdaptiveLimit) -> None:
+        window(limit, clock, 1000)
+        window(limit, clock, 2000)
+        assert limit.limit == 4
+        window(limit, clock, 1000)
+        assert limit.limit == 3
+
+    run(test, AdaptiveLimit(10, initial=2), clock)
+
+
+def test_limit_stays_within_bounds(clock):
+    async def test(limit: AdaptiveLimit) -> None:
+        for nbytes in (1000, 2000, 3000, 4000):
+            window(limit, clock, nbytes)
+        assert limit.limit == 3
+        for nbytes in (3000, 2000, 1000):
+            window(limit, clock, nbytes)
+        assert limit.limit == 2
+
+    run(test, AdaptiveLimit(3, minimum=2, initial=2), clock)
+
+
+def test_unsaturated_window_leaves_limit(clock):
+    limit = AdaptiveLimit(10, initial=2)
+    limit._in_flight = 1
+    limit._check_saturation()
+    clock.now += limit.interval
+    limit.record(1000)
+    assert limit.limit == 2
+    assert limit.throughput == 1000 / limit.interval
+
+
+def test_backoff_halves_limit_once_per_interval(clock):
+    limit = AdaptiveLimit(16, initial=16)
+    limit.backoff("timeout")
+    assert limit.limit == 8
+    limit.backoff("timeout")
+    assert limit.limit == 8
+    clock.now += limit.interval
+    limit.backoff("timeout")
+    assert limit.limit == 4
+
+
+def test_backoff_respects_minimum(clock):
+    limit = AdaptiveLimit(16, minimum=3, initial=4)
+    limit.backoff()
+    assert limit.limit == 3
+
+
+def test_fixed_limit_does_not_adapt(clock):
+    async def test(limit: AdaptiveLimit) -> None:
+        assert limit.limit == 6
+        window(limit, clock, 1000)
+        window(limit, clock, 100)
+        limit.backoff()
+        assert limit.limit == 6
+
+    run(test, AdaptiveLimit(6, adaptive=False), clock)
+
+
+def test_growing_limit_wakes_waiters(clock):
+    async def main() -> None:
+        limit = AdaptiveLimit(4, initial=1)
+        await limit.acquire()
+        waiter = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        assert limit.waiting == 1
+        clock.now += limit.interval
+        limit.record(1000)
+        assert limit.limit == 2
+        await asyncio.wait_for(waiter, 1)
+        assert limit.in_flight == 2
+
+    asyncio.run(main())
+
+
+def test_release_passes_slot_to_waiter():
+    async def main() -> None:
+        limit = AdaptiveLimit(1)
+        await limit.acquire()
+        waiter = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        assert limit.locked()
+        limit.release()
+        await asyncio.wait_for(waiter, 1)
+        assert limit.in_flight == 1
+
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+import email.utils
+
+import httpx
+import pytest
+
+from doppkit.integrity import IntegrityError
+from doppkit.retry import RetryPolicy, retry_after
+
+
+def response(status: int, **headers: str) -> httpx.Response:
+    return httpx.Response(status, headers=headers, request=httpx.Request("GET", "https://grid.test/"))
+
+
+def test_retry_after_seconds():
+    assert retry_after(response(503, **{"Retry-After": "12"})) == 12.0
+    assert retry_after(response(503, **{"Retry-After": " 3 "})) == 3.0
+
+
+def test_retry_after_http_date():
+    when = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    delay = retry_after(response(503, **{"Retry-After": email.utils.format_datetime(when, usegmt=True)}))
+    assert 25.0 <= delay <= 30.0
+
+
+def test_retry_after_in_the_past_is_now():
+    assert retry_after(response(503, **{"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+
+
+@pytest.mark.parametrize("value", ["soon", "-5", "1.5", ""])
+def test_retry_after_invalid(value):
+    assert retry_after(response(503, **{"Retry-After": value})) is None
+
+
+def test_retry_after_missing():
+    assert retry_after(response(503)) is None
+
+
+def test_delay_honors_retry_after():
+    policy = RetryPolicy()
+    assert policy.next_delay(response(429, **{"Retry-After": "7"}), 0) == 7.0
+    assert policy.reasons == {"429": 1}
+
+
+def test_long_retry_after_is_fatal():
+    policy = RetryPolicy(max_retry_after=60.0)
+    assert policy.next_delay(response(503, **{"Retry-After": "61"}), 0) is None
+    assert policy.retries == 0
+
+
+def test_delay_backs_off_exponentially_with_jitter(monkeypatch):
+    monkeypatch.setattr("doppkit.retry.random.uniform", lambda low, high: high)
+    policy = RetryPolicy(attempts=10, base=1.0, cap=10.0)
+    error = httpx.ConnectTimeout("timed out")
+    assert [policy.next_delay(error, attempt) for attempt in range(6)] == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_jittered_delay_is_within_bounds():
+    policy = RetryPolicy(attempts=100, budget=100, base=1.0, cap=60.0)
+    for attempt in range(8):
+        assert 0.0 <= policy.next_delay(httpx.ReadError("reset"), attempt) <= min(60.0, 2 ** attempt)
+
+
+@pytest.mark.parametrize("result", [
+    response(400),
+    response(404),
+    httpx.UnsupportedProtocol("ftp"),
+    ValueError("bug"),
+])
+def test_final_failures_are_not_retried(result):
+    policy = RetryPolicy()
+    assert policy.next_delay(result, 0) is None
+    assert policy.retries == 0
+
+
+@pytest.mark.parametrize("result", [
+    response(500),
+    response(503),
+    httpx.ReadTimeout("slow"),
+    httpx.RemoteProtocolError("eof"),
+    IntegrityError("md5"),
+])
+def test_transient_failures_are_retried(result):
+    assert RetryPolicy().next_delay(result, 0) is not None
+
+
+def test_status_error_is_judged_by_its_response():
+    failed = response(502)
+    error = httpx.HTTPStatusError("bad gateway", request=failed.request, response=failed)
+    policy = RetryPolicy()
+    assert policy.next_delay(error, 0) is not None
+    assert policy.reasons == {"502": 1}
+
+
+def test_attempts_are_limited():
+    policy = RetryPolicy(attempts=2)
+    error = httpx.ConnectError("refused")
+    assert policy.next_delay(error, 0) is not None
+    assert policy.next_delay(error, 1) is not None
+    assert policy.next_delay(error, 2) is None
+
+
+def test_budget_is_shared_between_requests():
+    policy = RetryPolicy(attempts=5, budget=3)
+    error = httpx.ConnectError("refused")
+    assert policy.next_delay(error, 0) is not None
+    assert policy.next_delay(error, 0) is not None
+    assert policy.next_delay(response(503), 1) is not None
+    assert policy.next_delay(error, 0) is None
+    assert policy.retries == 3
+    assert policy.reasons == {"ConnectError": 2, "503": 1}
+
+
+async def no_sleep(delay: float) -> None:
+    pass
+
+
+def test_call_retries_until_success(monkeypatch):
+    monkeypatch.setattr("doppkit.retry.asyncio.sleep", no_sleep)
+    results = [httpx.ConnectError("refused"), response(503), response(200)]
+
+    async def request() -> httpx.Response:
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    policy = RetryPolicy()
+    assert asyncio.run(policy.call(request)).status_code == 200
+    assert policy.retries == 2
+
+
+def test_call_returns_final_error_response():
+    async def request() -> httpx.Response:
+        return response(404)
+
+    assert asyncio.run(RetryPolicy().call(request)).status_code == 404
+
+
+def test_call_raises_once_budget_is_spent(monkeypatch):
+    monkeypatch.setattr("doppkit.retry.asyncio.sleep", no_sleep)
+
+    async def request() -> httpx.Response:
+        raise httpx.ConnectError("refused")
+
+    policy = RetryPolicy(attempts=10, budget=2)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(policy.call(request))
+    assert policy.retries == 2